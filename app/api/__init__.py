@@ -8,7 +8,7 @@ from .auth import (
 )
 
 from .response import response_bp
-from .response import user_responses, response_
+from .response import user_responses, user_response_snapshot, user_progress, response_
 
 from .user import user_bp
 from .user import delete_current_user, user_info, set_active_edit_no
@@ -20,11 +20,13 @@ from .consent import consent_bp
 from .consent import consent_
 
 from .report import report_bp
-from .report import report_, generate_report_data
+from .report import report_, generate_report_data, report_job
 
 from .test_edits import test_edits_bp
 from .test_edits import user_test_edits, test_edit, delete_test_edit, rename_test_edit
 
+from .metrics import metrics_bp
+
 blueprints = [
     auth_bp,
     user_bp,
@@ -33,6 +35,7 @@ blueprints = [
     consent_bp,
     report_bp,
     test_edits_bp,
+    metrics_bp,
 ]
 
 
@@ -74,6 +77,10 @@ class API:
 
     user_responses = APIMethod(user_responses, "response.user_responses")
 
+    user_response_snapshot = APIMethod(user_response_snapshot, "response.user_response_snapshot")
+
+    user_progress = APIMethod(user_progress, "response.user_progress")
+
     response = APIMethod(response_, "response.response_")
 
     check_username = APIMethod(check_username, "signup.check_username")
@@ -87,3 +94,5 @@ class API:
     report = APIMethod(report_, "report.report_")
 
     generate_report_data = APIMethod(generate_report_data, "report.generate_report_data")
+
+    report_job = APIMethod(report_job, "report.report_job")
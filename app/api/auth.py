@@ -21,6 +21,7 @@ from .core.cookies import (
     cconsent_required,
     hash_string,
 )
+from .core.user_cache import user_cache
 
 from ..core.utils import hprint
 
@@ -251,6 +252,7 @@ def account_reset() -> Response:
             method="scrypt",
         )
     db.session.commit()
+    user_cache.invalidate(user_id)
 
     # Dropping reset code
     db.session.delete(reset)
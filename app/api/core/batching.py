@@ -0,0 +1,178 @@
+import numpy as np
+
+import threading
+import time
+from collections import deque
+
+from typing import Callable
+
+
+class _ScoringRequest:
+    """A single caller's texts waiting in the `ScoringQueue`.
+    """
+    def __init__(self, texts: list[str]) -> None:
+        self.texts = texts
+        self.enqueued = time.perf_counter()
+        self.done = threading.Event()
+        self.result: np.ndarray = None
+        self.error: Exception = None
+
+
+class ScoringQueue:
+    """A dynamic batching queue in front of a predict-function. Texts of
+    concurrent callers are collected for at most `max_wait_ms` milliseconds
+    (or until `max_batch_size` texts are waiting), scored in a single padded
+    batch and each caller gets back its own slice of the predictions.
+
+    Parameters
+    ----------
+    predict : Callable[[list[str]], np.ndarray]
+        The function scoring a (padded) batch of texts, e.g., `Scorer.predict`.
+    max_wait_ms : float=50
+        Maximum time the first request of a batch waits for further requests.
+    max_batch_size : int=64
+        Maximum number of texts per batch. A single request larger than this
+        is scored as a batch on its own.
+    """
+    def __init__(
+        self,
+        predict: Callable[[list[str]], np.ndarray],
+        max_wait_ms: float=50,
+        max_batch_size: int=64,
+    ) -> None:
+        self._predict = predict
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_size = max_batch_size
+
+        self._pending: deque[_ScoringRequest] = deque()
+        self._cond = threading.Condition()
+
+        self._stats_lock = threading.Lock()
+        self._n_batches = 0
+        self._n_texts = 0
+        self._recent: deque[dict] = deque(maxlen=100)
+
+        self._worker = threading.Thread(
+            target=self._run,
+            name="scoring-queue",
+            daemon=True,
+        )
+        self._worker.start()
+
+    def predict(self, texts: list[str]) -> np.ndarray:
+        """Scores the texts as part of the next batch. Blocks until the
+        predictions are available.
+
+        Parameters
+        ----------
+        texts : list[str]
+
+        Returns
+        -------
+        y_pred : np.ndarray
+        """
+        if len(texts) == 0:
+            return np.array([], dtype=int)
+
+        req = _ScoringRequest(texts)
+        with self._cond:
+            self._pending.append(req)
+            self._cond.notify()
+        req.done.wait()
+
+        if req.error is not None:
+            raise req.error
+        return req.result
+
+    def _next_batch(self) -> list[_ScoringRequest]:
+        """Waits for the first request, then keeps collecting requests until
+        the batch is full or the waiting time of the first request is over.
+        """
+        with self._cond:
+            while len(self._pending) == 0:
+                self._cond.wait()
+
+            deadline = self._pending[0].enqueued + self.max_wait
+            while True:
+                n_waiting = sum(len(req.texts) for req in self._pending)
+                remaining = deadline - time.perf_counter()
+                if n_waiting >= self.max_batch_size or remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch = [self._pending.popleft()]
+            n_texts = len(batch[0].texts)
+            while len(self._pending) > 0:
+                n_next = len(self._pending[0].texts)
+                if n_texts + n_next > self.max_batch_size:
+                    break
+                batch.append(self._pending.popleft())
+                n_texts += n_next
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            texts = [text for req in batch for text in req.texts]
+
+            t0 = time.perf_counter()
+            try:
+                y_pred = np.asarray(self._predict(texts))
+            except Exception as e:
+                for req in batch:
+                    req.error = e
+                    req.done.set()
+                continue
+            t1 = time.perf_counter()
+
+            start = 0
+            for req in batch:
+                stop = start + len(req.texts)
+                req.result = y_pred[start:stop]
+                start = stop
+                req.done.set()
+
+            self._record(batch, len(texts), t0, t1)
+
+    def _record(
+        self,
+        batch: list[_ScoringRequest],
+        n_texts: int,
+        t_start: float,
+        t_end: float,
+    ) -> None:
+        with self._stats_lock:
+            self._n_batches += 1
+            self._n_texts += n_texts
+            self._recent.append({
+                "requests": len(batch),
+                "texts": n_texts,
+                "occupancy": min(n_texts / self.max_batch_size, 1.0),
+                "queue_seconds": max(t_start - req.enqueued for req in batch),
+                "predict_seconds": t_end - t_start,
+            })
+
+    def stats(self) -> dict:
+        """Batch counts and (recent) per-batch occupancy and latency
+        statistics.
+
+        Returns
+        -------
+        stats : dict
+        """
+        with self._stats_lock:
+            recent = list(self._recent)
+            stats = {
+                "max_wait_ms": self.max_wait * 1000,
+                "max_batch_size": self.max_batch_size,
+                "batches": self._n_batches,
+                "texts": self._n_texts,
+                "pending_requests": len(self._pending),
+            }
+        if len(recent) > 0:
+            stats["recent_batches"] = len(recent)
+            for key in ["requests", "texts", "occupancy", "queue_seconds", "predict_seconds"]:
+                values = [r[key] for r in recent]
+                stats[f"mean_{key}"] = round(float(np.mean(values)), 4)
+            stats["max_predict_seconds"] = round(max(r["predict_seconds"] for r in recent), 4)
+        return stats
@@ -0,0 +1,165 @@
+import threading
+import time
+from collections import OrderedDict
+
+from typing import Any, Callable, Hashable
+
+
+class LRUCache:
+    """A thread-safe, bounded least-recently-used cache with hit/miss
+    counters and optional expiry of the entries.
+
+    Parameters
+    ----------
+    max_size : int
+        Maximum total size of the cached entries. By default each entry has
+        size 1, i.e., `max_size` is the maximum number of entries.
+    sizeof : Callable[[Hashable, Any], int]=None
+        Optional function computing the size of an entry (e.g. in bytes) for
+        size-based eviction.
+    ttl_s : float=None
+        Optional time to live of the entries in seconds. Expired entries are
+        treated as missing.
+    """
+    def __init__(
+        self,
+        max_size: int,
+        sizeof: Callable[[Hashable, Any], int]=None,
+        ttl_s: float=None,
+    ) -> None:
+        self.max_size = max_size
+        self.ttl = ttl_s
+        self._sizeof = sizeof if sizeof is not None else lambda key, value: 1
+        # key -> (value, size, expiry time or None)
+        self._data: OrderedDict[Hashable, tuple[Any, int, float]] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _entry(self, key: Hashable) -> tuple[Any, int, float]:
+        """The entry of the key or `None`, dropping it if expired. Must be
+        called holding the lock.
+        """
+        entry = self._data.get(key)
+        if entry is not None and entry[2] is not None and entry[2] <= time.monotonic():
+            del self._data[key]
+            self._size -= entry[1]
+            self.expirations += 1
+            return None
+        return entry
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return self._entry(key) is not None
+
+    def get(self, key: Hashable, default: Any=None) -> Any:
+        """Returns the cached value (and marks it as recently used) or
+        `default` if the key is not cached.
+        """
+        with self._lock:
+            entry = self._entry(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def peek(self, key: Hashable, default: Any=None) -> Any:
+        """Returns the cached value without marking it as recently used and
+        without counting a hit or miss.
+        """
+        with self._lock:
+            entry = self._entry(key)
+            return default if entry is None else entry[0]
+
+    def keys(self) -> list[Hashable]:
+        """The currently cached keys, least recently used first.
+        """
+        with self._lock:
+            return list(self._data.keys())
+
+    def put(self, key: Hashable, value: Any, ttl_s: float=None) -> None:
+        """Caches the value, evicting least recently used entries if the
+        maximum size is exceeded. `ttl_s` overrides the default time to live
+        of the cache for this entry.
+        """
+        size = self._sizeof(key, value)
+        if ttl_s is None:
+            ttl_s = self.ttl
+        expires = time.monotonic() + ttl_s if ttl_s is not None else None
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._size -= old[1]
+            if size > self.max_size:
+                return
+            self._data[key] = (value, size, expires)
+            self._size += size
+            while self._size > self.max_size:
+                _, (_, evicted_size, _) = self._data.popitem(last=False)
+                self._size -= evicted_size
+                self.evictions += 1
+
+    def replace(self, key: Hashable, value: Any) -> bool:
+        """Replaces the value of a cached entry, keeping its expiry time and
+        its position in the eviction order. Does nothing if the key is not
+        cached (anymore).
+
+        Returns
+        -------
+        replaced : bool
+        """
+        size = self._sizeof(key, value)
+        with self._lock:
+            entry = self._entry(key)
+            if entry is None:
+                return False
+            self._data[key] = (value, size, entry[2])
+            self._size += size - entry[1]
+            while self._size > self.max_size:
+                _, (_, evicted_size, _) = self._data.popitem(last=False)
+                self._size -= evicted_size
+                self.evictions += 1
+            return True
+
+    def pop(self, key: Hashable) -> Any:
+        """Removes an entry from the cache and returns its value (or `None`).
+        """
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None:
+                return None
+            self._size -= entry[1]
+            return entry[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._size = 0
+
+    def stats(self) -> dict:
+        """Current size and hit/miss counters of the cache.
+
+        Returns
+        -------
+        stats : dict
+        """
+        with self._lock:
+            n_lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "size": self._size,
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": round(self.hits / n_lookups, 4) if n_lookups > 0 else None,
+            }
@@ -0,0 +1,290 @@
+import numpy as np
+import pandas as pd
+import sqlalchemy as sa
+
+import datetime as dt
+
+from . import qutools
+from .database import db, upsert
+from .dbmodels import MCResponse, TextResponse, Score, TestEdit
+from .models import model_registry
+from .time import utc_now
+
+
+Edit = tuple[int, int]
+
+# Number of (user_id, edit_no) pairs per `IN`-clause, keeping the number of
+#   bound parameters below the limits of sqlite.
+EDITS_PER_QUERY = 400
+
+
+def _chunks(edits: list[Edit], size: int=EDITS_PER_QUERY) -> list[list[Edit]]:
+    return [edits[k:k + size] for k in range(0, len(edits), size)]
+
+
+def load_responses(edits: list[Edit]) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Loads the MC- and text-responses of many edits with a single query per
+    response table (and chunk of `EDITS_PER_QUERY` edits).
+
+    Parameters
+    ----------
+    edits : list[Edit]
+        (user_id, edit_no) pairs.
+
+    Returns
+    -------
+    tuple[pd.DataFrame, pd.DataFrame]
+        The MC-responses (user_id, edit_no, task_id, item_id, response) and
+        the normalized text-responses (user_id, edit_no, task_id, item_id,
+        text).
+    """
+    mc_rows, text_rows = [], []
+    for chunk in _chunks(edits):
+        mc_rows += db.session.execute(
+            sa.select(
+                MCResponse.user_id,
+                MCResponse.edit_no,
+                MCResponse.task_id,
+                MCResponse.item_id,
+                MCResponse.response,
+            )
+            .where(sa.tuple_(MCResponse.user_id, MCResponse.edit_no).in_(chunk))
+        ).all()
+        text_rows += db.session.execute(
+            sa.select(
+                TextResponse.user_id,
+                TextResponse.edit_no,
+                TextResponse.task_id,
+                TextResponse.item_id,
+                TextResponse.response,
+                TextResponse.normalized,
+                TextResponse.normalizer_version,
+            )
+            .where(sa.tuple_(TextResponse.user_id, TextResponse.edit_no).in_(chunk))
+        ).all()
+
+    df_mc = pd.DataFrame(
+        mc_rows,
+        columns=["user_id", "edit_no", "task_id", "item_id", "response"],
+    )
+    df_text = pd.DataFrame(
+        text_rows,
+        columns=["user_id", "edit_no", "task_id", "item_id", "response", "normalized", "normalizer_version"],
+    )
+
+    # Responses with outdated normalization get re-normalized in memory
+    normalizer = qutools.text_normalizer
+    outdated = (df_text["normalizer_version"] != normalizer.version).to_numpy()
+    df_text["text"] = df_text["normalized"]
+    if outdated.any():
+        df_text.loc[outdated, "text"] = normalizer.normalize_batch(
+            df_text.loc[outdated, "response"].to_list()
+        )
+    df_text = df_text[["user_id", "edit_no", "task_id", "item_id", "text"]]
+
+    return df_mc, df_text
+
+
+def count_responses(
+    edits: list[Edit],
+    df_mc: pd.DataFrame,
+    df_text: pd.DataFrame,
+) -> pd.DataFrame:
+    """Number of responses per edit and (scored) task, see `Score.n_responses`.
+
+    Returns
+    -------
+    pd.DataFrame
+        Indexed by (user_id, edit_no), a column per task.
+    """
+    df = pd.concat([df_mc[["user_id", "edit_no", "task_id"]], df_text[["user_id", "edit_no", "task_id"]]])
+    df["task"] = df["task_id"].map(qutools.score_task)
+    df_counts = (df
+        .groupby(["user_id", "edit_no", "task"])
+        .size()
+        .unstack(fill_value=0)
+        .reindex(index=pd.MultiIndex.from_tuples(edits, names=["user_id", "edit_no"]), columns=qutools.tasks)
+        .fillna(0)
+        .astype(int)
+    )
+    return df_counts
+
+
+def score_mc(edits: list[Edit], df_mc: pd.DataFrame) -> np.ndarray:
+    """Scores the MC-tasks of all edits at once, see `qutools.MCScorer`.
+
+    Returns
+    -------
+    np.ndarray
+        Scores of shape (n_edits, n_mc_tasks).
+    """
+    responses = {edit: {} for edit in edits}
+    for user_id, edit_no, item_id, response in zip(
+        df_mc["user_id"], df_mc["edit_no"], df_mc["item_id"], df_mc["response"]
+    ):
+        responses[(user_id, edit_no)][item_id] = response
+    X = qutools.mc_scorer.response_matrix([responses[edit] for edit in edits])
+    return qutools.mc_scorer.score_matrix(X)
+
+
+def text_inputs(df_text: pd.DataFrame) -> pd.DataFrame:
+    """Builds the scorer inputs (one "Aufgabe xy: ..." text per edit and
+    non-empty task) of many edits at once. Multi-row counterpart of the text
+    preprocessing in `compute_scores`.
+
+    Returns
+    -------
+    pd.DataFrame
+        Columns user_id, edit_no, item (the task) and text.
+    """
+    columns = ["user_id", "edit_no", "item", "text"]
+    if df_text.shape[0] == 0:
+        return pd.DataFrame(columns=columns)
+
+    df = df_text.copy()
+    df["item"] = df["item_id"].map(qutools.item_dot)
+    df = df.pivot(index=["user_id", "edit_no"], columns="item", values="text")
+    df = df.reindex(columns=qutools.text_items).fillna("")
+    df.columns.name = None
+
+    df = qutools.concat_taskwise(df)
+    df = (df
+        .reset_index()
+        .melt(id_vars=["user_id", "edit_no"], var_name="item", value_name="text")
+    )
+    df = qutools.drop_empty(df)
+    if df.shape[0] > 0:
+        df = qutools.add_item_names(df)
+    return df[columns]
+
+
+def score_cohort(
+    edits: list[Edit],
+    df_mc: pd.DataFrame,
+    df_text: pd.DataFrame,
+    batch_size: int=1024,
+) -> pd.DataFrame:
+    """Scores all tasks of many edits. The MC-tasks are scored as a single
+    matrix, the texts are passed on to the scorer in batches of `batch_size`.
+
+    Parameters
+    ----------
+    edits : list[Edit]
+        (user_id, edit_no) pairs.
+    df_mc, df_text : pd.DataFrame
+        The responses as returned by `load_responses`.
+    batch_size : int=1024
+        Number of texts per call of the prediction cache / scorer.
+
+    Returns
+    -------
+    pd.DataFrame
+        Indexed by (user_id, edit_no), a column per task.
+    """
+    index = pd.MultiIndex.from_tuples(edits, names=["user_id", "edit_no"])
+    df_scores = pd.DataFrame(0.0, index=index, columns=qutools.tasks)
+    df_scores[qutools.mc_scorer.tasks] = score_mc(edits, df_mc)
+
+    df_inputs = text_inputs(df_text)
+    if df_inputs.shape[0] > 0:
+        prediction_cache = model_registry.prediction_cache()
+        texts = df_inputs["text"].to_list()
+        y_pred = np.concatenate([
+            prediction_cache.predict(texts[k:k + batch_size])
+            for k in range(0, len(texts), batch_size)
+        ])
+        df_pred = (df_inputs
+            .assign(score=y_pred)
+            .pivot(index=["user_id", "edit_no"], columns="item", values="score")
+        )
+        df_scores.update(df_pred)
+
+    return df_scores.astype(int)
+
+
+def store_cohort_scores(
+    df_scores: pd.DataFrame,
+    df_counts: pd.DataFrame,
+    model_version: str,
+    timestamp: dt.datetime=None,
+    revisions: dict[Edit, int]=None,
+) -> int:
+    """Replaces the stored scores of the edits in `df_scores` with a bulk
+    upsert in a single transaction.
+
+    Parameters
+    ----------
+    df_scores : pd.DataFrame
+        As returned by `score_cohort`.
+    df_counts : pd.DataFrame
+        As returned by `count_responses`.
+    model_version : str
+        Version of the scorer model, see `Score.model_version`.
+    timestamp : dt.datetime=None
+        Time the scoring has been started at. Defaults to the current time.
+    revisions : dict[Edit, int]=None
+        The `TestEdit.revision`s read before the responses have been loaded.
+
+    Returns
+    -------
+    n_scores : int
+        Number of stored score rows.
+    """
+    if timestamp is None:
+        timestamp = utc_now()
+    if revisions is None:
+        revisions = {}
+
+    rows = [
+        {
+            "id": f"u{user_id}_tst{edit_no}_tsk{task}",
+            "task_id": task,
+            "user_id": user_id,
+            "edit_no": edit_no,
+            "score": int(score),
+            "n_responses": int(df_counts.at[(user_id, edit_no), task]),
+            "timestamp": timestamp,
+            "provisional": False,
+            "model_version": model_version,
+            "revision": revisions.get((user_id, edit_no)),
+        }
+        for (user_id, edit_no), scores in df_scores.iterrows()
+        for task, score in scores.items()
+    ]
+
+    upsert(Score, rows)
+    db.session.commit()
+    return len(rows)
+
+
+def rescore_cohort(edits: list[Edit], batch_size: int=1024) -> int:
+    """Loads, scores and stores all tasks of many edits at once. Requires an
+    app context.
+
+    Parameters
+    ----------
+    edits : list[Edit]
+        (user_id, edit_no) pairs. Should be edits that already have scores
+        (see `app.rescore.select_edits`): final scores get stored for every
+        task, i.e., edits without responses end up with a report of zeros.
+    batch_size : int=1024
+        Number of texts per call of the scorer.
+
+    Returns
+    -------
+    n_scores : int
+        Number of stored score rows.
+    """
+    edits = list(dict.fromkeys((int(user_id), int(edit_no)) for user_id, edit_no in edits))
+    if len(edits) == 0:
+        return 0
+
+    scoring_time = utc_now()
+    revisions = {}
+    for chunk in _chunks(edits):
+        revisions.update(TestEdit.revisions(chunk))
+    df_mc, df_text = load_responses(edits)
+    df_counts = count_responses(edits, df_mc, df_text)
+    df_scores = score_cohort(edits, df_mc, df_text, batch_size)
+    model_version = model_registry.prediction_cache().model_version
+    return store_cohort_scores(df_scores, df_counts, model_version, scoring_time, revisions)
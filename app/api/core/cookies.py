@@ -1,17 +1,65 @@
 from flask import Response
 from flask import jsonify, make_response
-from flask import current_app, request
+from flask import current_app, request, g
 
 import jwt
 
 import datetime as dt
+import time
 from functools import wraps
 from hashlib import sha256
 
 from typing import Callable
 
+from ...config import load_env_json
+from .caching import LRUCache
 from .dbmodels import User
+from .metrics import register_metrics
 from .time import utc_now
+from .user_cache import user_cache
+
+
+
+class VerifiedTokens:
+    """A bounded cache of recently verified JWTs, such that e.g. autosave
+    bursts do not decode (and check the signature of) the same token again
+    and again. Maps a tokens signature to the token and its payload. Entries
+    expire after `ttl_s` or with the token, whichever comes first.
+
+    Parameters
+    ----------
+    max_entries : int=10000
+    ttl_s : float=60.0
+    """
+    def __init__(self, max_entries: int=10000, ttl_s: float=60.0) -> None:
+        self.cache = LRUCache(max_entries, ttl_s=ttl_s)
+
+    def get(self, token: str) -> dict:
+        """The payload of the token or `None`, if the token has not been
+        verified recently.
+        """
+        entry = self.cache.get(token.rpartition(".")[2])
+        if entry is None or entry[0] != token or entry[1]["exp"] <= time.time():
+            return None
+        return entry[1]
+
+    def put(self, token: str, payload: dict) -> None:
+        """Caches the payload of a verified token.
+        """
+        ttl_s = min(self.cache.ttl, payload["exp"] - time.time())
+        if ttl_s > 0:
+            self.cache.put(token.rpartition(".")[2], (token, payload), ttl_s=ttl_s)
+
+    def forget_user(self, public_id: int) -> None:
+        """Drops the cached tokens of a user, e.g., when it gets deleted.
+        """
+        for key in self.cache.keys():
+            entry = self.cache.peek(key)
+            if entry is not None and entry[1]["public_id"] == public_id:
+                self.cache.pop(key)
+
+    def stats(self) -> dict:
+        return self.cache.stats()
 
 
 
@@ -37,6 +85,45 @@ def construct_user_jwt(user: User) -> str:
 
 
 
+def token_refresh_due() -> bool:
+    """Whether a refreshed JWT should be sent along with the response to the
+    current request, i.e., whether the lifetime left of the requests token is
+    below `JWT_REFRESH_THRESHOLD_S` (sliding refresh). Requires a token
+    validated by `jwt_auth_core`.
+    """
+    if g.get("jwt_refreshed_token") is not None:
+        return True
+    threshold = current_app.config.get("JWT_REFRESH_THRESHOLD_S", 600)
+    return g.get("jwt_expires", 0) - time.time() < threshold
+
+
+
+def refreshed_user_jwt(user: User) -> str:
+    """Like `construct_user_jwt`, but the token is only signed once per
+    request and reused by nested (functional) API-calls.
+
+    Parameters
+    ----------
+    user : User
+        The user for whom the JWT should be constructed.
+    """
+    token = g.get("jwt_refreshed_token")
+    if token is None:
+        token = construct_user_jwt(user)
+        g.jwt_refreshed_token = token
+    return token
+
+
+
+def reset_auth_context() -> None:
+    """Drops the user and refreshed token kept on `flask.g` by
+    `jwt_auth_core`, e.g., after the user has been deleted.
+    """
+    g.pop("jwt_current_user", None)
+    g.pop("jwt_refreshed_token", None)
+
+
+
 def add_jwt_cookie(res: Response, token: str) -> Response:
     """"Function appending a JWT-cookie to a flask.Response.
     Potentiall add
@@ -112,7 +199,16 @@ def jwt_auth_core(f, *args, **kwargs):
     - 401 if the JWT-cookie is missing.
     - 410 if the JWT-cookie has expired.
     - 403 if the JWT-cookie is invalid.
+
+    The validated user is kept on `flask.g` for the rest of the request, such
+    that nested (functional) API-calls neither decode the token nor load the
+    user again.
     """
+    current_user: User = g.get("jwt_current_user")
+    if current_user is not None:
+        res = f(current_user, *args, **kwargs)
+        return res, current_user
+
     key = current_app.config['JWT_COOKIE_KEY']
     token = request.cookies.get(key)
 
@@ -123,28 +219,34 @@ def jwt_auth_core(f, *args, **kwargs):
         )
         return res, None
 
-    try:
-        token = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
-    except jwt.ExpiredSignatureError:
-        res = make_response(
-            jsonify({'message': 'Token expired!', 'token_expired': True}),
-            410,
-        )
-        return res, None
-    except jwt.InvalidTokenError:
-        res = make_response(
-            jsonify({'message': 'Token is invalid!'}),
-            403,
-        )
-        return res, None
+    payload = verified_tokens.get(token)
+    if payload is None:
+        try:
+            payload = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
+        except jwt.ExpiredSignatureError:
+            res = make_response(
+                jsonify({'message': 'Token expired!', 'token_expired': True}),
+                410,
+            )
+            return res, None
+        except jwt.InvalidTokenError:
+            res = make_response(
+                jsonify({'message': 'Token is invalid!'}),
+                403,
+            )
+            return res, None
+        verified_tokens.put(token, payload)
 
-    current_user = User.query.filter_by(public_id=token['public_id']).first()
+    current_user = user_cache.get(payload['public_id'])
     if not current_user:
+        verified_tokens.forget_user(payload['public_id'])
         res = jsonify({'message': 'User does not exist anymore'})
         res.delete_cookie(current_app.config['JWT_COOKIE_KEY'])
         res.status_code = 403
         return res, None
 
+    g.jwt_current_user = current_user
+    g.jwt_expires = payload['exp']
     res = f(current_user, *args, **kwargs)
 
     return res, current_user
@@ -153,7 +255,8 @@ def jwt_auth_core(f, *args, **kwargs):
 
 def jwt_required(f) -> Callable[[], Response]:
     """JWT-validation wrapper that appends a new JWT to the sent response, i. e.
-    refreshes the current login-session.
+    refreshes the current login-session, once the current token is about to
+    expire (see `token_refresh_due`).
 
     #### Possible Status-Codes
     - 401 if the JWT-cookie is missing.
@@ -163,8 +266,8 @@ def jwt_required(f) -> Callable[[], Response]:
     @wraps(f)
     def decorated(*args, **kwargs):
         res, current_user = jwt_auth_core(f, *args, **kwargs)
-        if current_user is not None:
-            new_token = construct_user_jwt(current_user)
+        if current_user is not None and token_refresh_due():
+            new_token = refreshed_user_jwt(current_user)
             res = add_jwt_cookie(res, new_token)
         return res
 
@@ -186,3 +289,13 @@ def jwt_required_no_refresh(f) -> Callable[[], Response]:
         return res
 
     return decorated
+
+
+
+cnfg = load_env_json("./env/config.jsonc")
+
+verified_tokens = VerifiedTokens(
+    cnfg.get("VERIFIED_TOKEN_CACHE_SIZE", 10000),
+    ttl_s=cnfg.get("VERIFIED_TOKEN_CACHE_TTL_S", 60.0),
+)
+register_metrics("verified_tokens", verified_tokens.stats)
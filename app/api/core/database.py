@@ -1,3 +1,126 @@
 from flask_sqlalchemy import SQLAlchemy
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql, sqlite
+
+from contextlib import contextmanager
+
+from typing import Iterator
 
 db = SQLAlchemy()
+
+
+def upsert(
+    model: type[db.Model],
+    rows: list[dict],
+    update_columns: list[str]=None,
+    only_changed: list[str]=None,
+) -> int:
+    """Inserts the rows or updates the existing rows with the same primary
+    key in a single (executemany-) statement. Uses `INSERT ... ON CONFLICT DO
+    UPDATE` on SQLite and PostgreSQL and a delete followed by an insert on
+    other dialects. Does not commit.
+
+    Parameters
+    ----------
+    model : type[db.Model]
+        The model (table) to write to.
+    rows : list[dict]
+        The rows, containing the primary key and the columns to be written.
+    update_columns : list[str]=None
+        The columns updated on conflicts. Defaults to all non-key columns of
+        the first row.
+    only_changed : list[str]=None
+        If passed, existing rows are only updated if at least one of these
+        columns changes. Unchanged rows are left as they are and do not count
+        as written.
+
+    Returns
+    -------
+    n_written : int
+        Number of inserted or updated rows.
+    """
+    if len(rows) == 0:
+        return 0
+
+    table: sa.Table = model.__table__
+    pk = [col.name for col in table.primary_key.columns]
+    if update_columns is None:
+        update_columns = [col for col in rows[0].keys() if col not in pk]
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ["sqlite", "postgresql"]:
+        insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        stmt = insert(table)
+        where = None
+        if only_changed is not None:
+            where = sa.or_(*[table.c[col] != stmt.excluded[col] for col in only_changed])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=pk,
+            set_={col: stmt.excluded[col] for col in update_columns},
+            where=where,
+        )
+        # A single row as plain execute, such that the rowcount is reliable
+        result = db.session.execute(stmt, rows if len(rows) > 1 else rows[0])
+        return result.rowcount
+
+    pk_cols = sa.tuple_(*[table.c[col] for col in pk])
+    if only_changed is not None:
+        unchanged = {
+            tuple(row) for row in db.session.execute(
+                sa.select(*[table.c[col] for col in pk + only_changed])
+                .where(pk_cols.in_([tuple(row[col] for col in pk) for row in rows]))
+            ).all()
+        }
+        rows = [
+            row for row in rows
+            if tuple(row[col] for col in pk + only_changed) not in unchanged
+        ]
+        if len(rows) == 0:
+            return 0
+    db.session.execute(
+        sa.delete(table)
+        .where(pk_cols.in_([tuple(row[col] for col in pk) for row in rows]))
+    )
+    db.session.execute(sa.insert(table), rows)
+    return len(rows)
+
+
+class QueryCounter:
+    """Statements executed within `count_queries`.
+    """
+    def __init__(self) -> None:
+        self.statements: list[str] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+
+@contextmanager
+def count_queries() -> Iterator[QueryCounter]:
+    """Counts the statements (including commits) sent to the database within
+    the context, e.g., to check the number of round trips of a code path.
+    Requires an app context.
+
+    ```python
+    with count_queries() as counter:
+        store_scores(df, user_id, edit_no)
+    print(counter.count, counter.statements)
+    ```
+    """
+    counter = QueryCounter()
+    engine = db.engine
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        counter.statements.append(statement)
+
+    def on_commit(conn):
+        counter.statements.append("COMMIT")
+
+    sa.event.listen(engine, "before_cursor_execute", on_execute)
+    sa.event.listen(engine, "commit", on_commit)
+    try:
+        yield counter
+    finally:
+        sa.event.remove(engine, "before_cursor_execute", on_execute)
+        sa.event.remove(engine, "commit", on_commit)
@@ -7,7 +7,7 @@ import base64
 
 from abc import abstractmethod
 
-from .database import db
+from .database import db, upsert
 from .time import utc_now, get_reset_code_exp_time
 
 
@@ -56,6 +56,11 @@ class Response(db.Model):
     edit_no = sa.Column(sa.Integer, nullable=False, default=0)
     timestamp = sa.Column(sa.DateTime, default=utc_now, nullable=False)
 
+    @sa.orm.declared_attr
+    def __table_args__(cls):
+        # The responses are mostly accessed per users edit
+        return (sa.Index(f"ix_{cls.__tablename__}_edit", "user_id", "edit_no"),)
+
     def as_dict(self):
         """Returns an etnry as a dict.
 
@@ -111,9 +116,18 @@ class TextResponse(Response):
     response : sa.Column(sa.String(1000), nullable=False)
         The text-response as a string column. Currently capped to 1000
         characters (~ 100 German words).
+    normalized : sa.Column(sa.Text)
+        The cleaned text-response (see `qutools.TextNormalizer`), as passed
+        on to the scoring. Computed once when the response is stored.
+    normalizer_version : sa.Column(sa.SmallInteger)
+        The `TextNormalizer.version` that `normalized` was computed with.
+        Responses with an outdated version get re-normalized lazily by the
+        scoring.
     """
     __tablename__: str = "text_responses"
     response = sa.Column(sa.String(1000), nullable=False)
+    normalized = sa.Column(sa.Text)
+    normalizer_version = sa.Column(sa.SmallInteger)
 
 
 class MCResponse(Response):
@@ -154,6 +168,9 @@ class Responses:
     response types.
     """
     res_classes: list[Response] = [TextResponse, MCResponse, ImageResponse]
+    # Write-behind journal (see `app.api.core.journal`), if enabled. Its
+    #   unflushed responses get overlaid onto `user_dicts`.
+    journal = None
 
     @staticmethod
     def response_classes():
@@ -218,8 +235,25 @@ class Responses:
         dct = {}
         for name_, data_ in zip(names, data):
             dct[name_] = [res.as_dict() for res in data_]
+        if Responses.journal is not None:
+            dct = Responses.journal.overlay(public_id, edit_no, dct)
         return dct
 
+    @staticmethod
+    def discard_journaled(public_id: int, edit_no: int=None) -> None:
+        """Drops the not yet flushed responses of a user (edit) from the
+        write-behind journal, if enabled. Must be called before deleting the
+        users responses, as they would be written again otherwise.
+
+        Parameters
+        ----------
+        public_id : int
+        edit_no : int=None
+            If `None` the journaled responses of all edits are dropped.
+        """
+        if Responses.journal is not None:
+            Responses.journal.discard(public_id, edit_no)
+
     @staticmethod
     def user_pandas(public_id: int, edit_no: int=None) -> dict[str, pd.DataFrame]:
         """Method to access all responses of a users edit as `pandas.DataFrame`.
@@ -239,6 +273,40 @@ class Responses:
             dct[name_] = pd.DataFrame(data_)
         return dct
 
+    @staticmethod
+    def task_stats(public_id: int, edit_no: int) -> dict[str, tuple[dt.datetime, int]]:
+        """Method to retrieve the last response time and the number of
+        responses per task of a users edit. Only the scored response classes
+        (text and multiple choice) are considered.
+
+        Parameters
+        ----------
+        public_id : int
+            User id for the user whoms responses should be considered.
+        edit_no : int
+            Edit-number for the users test edit of concern.
+
+        Returns
+        -------
+        stats : dict[str, tuple[dt.datetime, int]]
+            Maps the task-ids to tuples of the last response time and the
+            number of responses.
+        """
+        stats = {}
+        for res_class in [TextResponse, MCResponse]:
+            rows = db.session.execute(
+                sa.select(
+                    res_class.task_id,
+                    sa.func.max(res_class.timestamp),
+                    sa.func.count(),
+                )
+                .where(res_class.user_id == public_id, res_class.edit_no == edit_no)
+                .group_by(res_class.task_id)
+            ).all()
+            for task_id, last_res_time, n_responses in rows:
+                stats[task_id] = (last_res_time, n_responses)
+        return stats
+
     @staticmethod
     def get_last_response_time(public_id: int, edit_no: int) -> str:
         """Method to retrieve the last response time of a users edit.
@@ -255,18 +323,16 @@ class Responses:
         -------
         last_res_time : str
         """
-        responses: list[Response] = [
-            res
+        last_res_times = sa.union_all(*[
+            sa.select(sa.func.max(res_class.timestamp).label("timestamp"))
+            .where(res_class.user_id == public_id, res_class.edit_no == edit_no)
             for res_class in Responses.res_classes
-            for res in res_class.query.filter_by(
-                user_id=public_id,
-                edit_no=edit_no
-            ).all()
-        ]
-        if len(responses) == 0:
+        ]).subquery()
+        last_res_time: dt.datetime = db.session.execute(
+            sa.select(sa.func.max(last_res_times.c.timestamp))
+        ).scalar()
+        if last_res_time is None:
             return None
-        res_times: list[dt.datetime] = [res.timestamp for res in responses]
-        last_res_time = max(res_times)
         last_res_time = last_res_time.strftime("%d.%m.%Y - %H:%M:%S (UTC)")
         return last_res_time
 
@@ -355,9 +421,24 @@ class Score(db.Model):
         The edit number of the users edit this score belongs to.
     score = sa.Column(sa.SmallInteger, nullable=False, default=0)
         The score itself. Ranges from 0 to 2.
+    n_responses = sa.Column(sa.SmallInteger, nullable=False, default=0)
+        The number of (item-) responses of the task the score has been computed
+        from. Is used to detect deleted responses.
     timestamp = sa.Column(sa.DateTime, ...)
         Timestamp when the score has been computed. Is used for comparison with
         the `Responses` entries.
+    provisional = sa.Column(sa.Boolean, nullable=False, default=False)
+        Whether the score has been computed speculatively in the background
+        (see `SPECULATIVE_SCORING`) and not yet been confirmed by a report
+        generation.
+    model_version = sa.Column(sa.String(64))
+        Version of the scorer model the (text-) score has been computed with,
+        see `PredictionCache.model_version`. Scores of an outdated model
+        version get recomputed.
+    revision = sa.Column(sa.Integer)
+        The `TestEdit.revision` the score is known to be up to date with.
+        If all scores of an edit carry the current revision, none of them
+        has to be checked for changed responses.
     """
     __tablename__: str = "score"
     id = sa.Column(sa.String(30), primary_key=True)
@@ -365,7 +446,11 @@ class Score(db.Model):
     user_id = sa.Column(sa.Integer, db.ForeignKey("user.public_id", ondelete='CASCADE'), nullable=False)
     edit_no = sa.Column(sa.Integer, nullable=False, default=0)
     score = sa.Column(sa.SmallInteger, nullable=False, default=0)
+    n_responses = sa.Column(sa.SmallInteger, nullable=False, default=0)
     timestamp = sa.Column(sa.DateTime, default=utc_now, nullable=False)
+    provisional = sa.Column(sa.Boolean, nullable=False, default=False)
+    model_version = sa.Column(sa.String(64))
+    revision = sa.Column(sa.Integer)
 
     def as_dict(self):
         """Returns the entry as a dictionary containing:
@@ -448,13 +533,85 @@ class Score(db.Model):
         -------
         last_report_time : str
         """
-        scores: list[Score] = Score.query.filter_by(user_id=public_id, edit_no=edit_no).all()
-        if len(scores) == 0:
+        last_report_time: dt.datetime = db.session.execute(
+            sa.select(sa.func.max(Score.timestamp))
+            .where(
+                Score.user_id == public_id,
+                Score.edit_no == edit_no,
+                Score.provisional == False,
+            )
+        ).scalar()
+        if last_report_time is None:
             return None
-        ts: list[dt.datetime] = [score.timestamp for score in scores]
-        last_report_time = max(ts).strftime("%d.%m.%Y - %H:%M:%S (UTC)")
+        last_report_time = last_report_time.strftime("%d.%m.%Y - %H:%M:%S (UTC)")
         return last_report_time
 
+    @staticmethod
+    def outdated_edits(model_version: str) -> set[tuple[int, int]]:
+        """Returns the edits with at least one score that has not been
+        computed with the passed scorer model version.
+
+        Parameters
+        ----------
+        model_version : str
+            The current model version, see `PredictionCache.model_version`.
+
+        Returns
+        -------
+        edits : set[tuple[int, int]]
+            (user_id, edit_no) pairs.
+        """
+        rows = db.session.execute(
+            sa.select(Score.user_id, Score.edit_no)
+            .where(sa.or_(
+                Score.model_version.is_(None),
+                Score.model_version != model_version,
+            ))
+            .distinct()
+        ).all()
+        return {(user_id, edit_no) for user_id, edit_no in rows}
+
+    @staticmethod
+    def scored_edits() -> set[tuple[int, int]]:
+        """Returns the edits with at least one stored score.
+
+        Returns
+        -------
+        edits : set[tuple[int, int]]
+            (user_id, edit_no) pairs.
+        """
+        rows = db.session.execute(
+            sa.select(Score.user_id, Score.edit_no).distinct()
+        ).all()
+        return {(user_id, edit_no) for user_id, edit_no in rows}
+
+
+
+
+class PredictionCacheEntry(db.Model):
+    """Persistent tier of the scorers prediction cache. Stores the predicted
+    score of a (normalized) task text, such that unchanged texts do not have
+    to pass the transformer again.
+
+    Parameters
+    ----------
+    key : sa.Column(sa.String(64), primary_key=True)
+        Content address of the text, i.e., the sha256-hash of the model version
+        and the text as passed to the scorer (see
+        `app.api.core.prediction_cache.prediction_key`).
+    model_version : sa.Column(sa.String(64), nullable=False)
+        Version of the scorer model that produced the prediction.
+    prediction : sa.Column(sa.SmallInteger, nullable=False)
+        The predicted score.
+    timestamp : sa.Column(sa.DateTime, default=utc_now, nullable=False)
+        Timestamp when the prediction has been computed.
+    """
+    __tablename__: str = "prediction_cache"
+    key = sa.Column(sa.String(64), primary_key=True)
+    model_version = sa.Column(sa.String(64), nullable=False)
+    prediction = sa.Column(sa.SmallInteger, nullable=False)
+    timestamp = sa.Column(sa.DateTime, default=utc_now, nullable=False)
+
 
 
 
@@ -477,12 +634,17 @@ class TestEdit(db.Model):
         do not get "filled"
     edit_name : sa.Column(sa.String(20), default="Standard", nullable=True)
         Name the user chooses for the edit. Defaults to "Standard"
+    revision : sa.Column(sa.Integer, nullable=False, default=0)
+        Gets increased by every transaction that writes or deletes responses
+        of the edit (see `ViewProgress.touch`). Scores store the revision
+        they are up to date with.
     """
     __tablename__: str = "test_edit"
     id = sa.Column(sa.String(10), primary_key=True)
     user_id = sa.Column(sa.Integer, db.ForeignKey("user.public_id", ondelete="CASCADE"), nullable=False)
     edit_no = sa.Column(sa.Integer, nullable=False)
     edit_name = sa.Column(sa.String(20), default="Standard", nullable=True)
+    revision = sa.Column(sa.Integer, nullable=False, default=0)
 
     def as_dict(self):
         """Returns the entry as a dictionary containing:
@@ -505,6 +667,206 @@ class TestEdit(db.Model):
         }
         return ret_dct
 
+    @staticmethod
+    def all_edits(user_ids: list[int]=None) -> list[tuple[int, int]]:
+        """Returns the (user_id, edit_no) pairs of all edits, ordered by
+        user and edit number.
+
+        Parameters
+        ----------
+        user_ids : list[int]=None
+            Restricts the edits to these users (public ids).
+
+        Returns
+        -------
+        edits : list[tuple[int, int]]
+        """
+        query = sa.select(TestEdit.user_id, TestEdit.edit_no)
+        if user_ids is not None:
+            query = query.where(TestEdit.user_id.in_(user_ids))
+        query = query.order_by(TestEdit.user_id, TestEdit.edit_no)
+        return [(user_id, edit_no) for user_id, edit_no in db.session.execute(query).all()]
+
+    @staticmethod
+    def get_revision(public_id: int, edit_no: int) -> int:
+        """Returns the current revision of a users edit or `None`, if the
+        edit does not exist.
+        """
+        return db.session.execute(
+            sa.select(TestEdit.revision)
+            .where(TestEdit.user_id == public_id, TestEdit.edit_no == edit_no)
+        ).scalar()
+
+    @staticmethod
+    def revisions(edits: list[tuple[int, int]]) -> dict[tuple[int, int], int]:
+        """Returns the current revisions of the passed (user_id, edit_no)
+        pairs. Non-existent edits are missing.
+        """
+        rows = db.session.execute(
+            sa.select(TestEdit.user_id, TestEdit.edit_no, TestEdit.revision)
+            .where(sa.tuple_(TestEdit.user_id, TestEdit.edit_no).in_(edits))
+        ).all()
+        return {(user_id, edit_no): revision for user_id, edit_no, revision in rows}
+
+    @staticmethod
+    def bump_revisions(edits: list[tuple[int, int]]) -> None:
+        """Increases the revisions of the passed (user_id, edit_no) pairs.
+        Does not commit.
+        """
+        if len(edits) == 0:
+            return
+        db.session.execute(
+            sa.update(TestEdit)
+            .where(sa.tuple_(TestEdit.user_id, TestEdit.edit_no).in_(edits))
+            .values(revision=TestEdit.revision + 1)
+            .execution_options(synchronize_session=False)
+        )
+
+
+
+
+class ViewProgress(db.Model):
+    """Number of responses per view of a users edit, kept up to date with the
+    response tables such that the progress of all views is available with a
+    single (small) query. Views with written or deleted responses get
+    collected in the database session (see `touch`) and recounted right
+    before the session commits, i.e., within the same transaction. The
+    revisions of the respective edits get increased alongside.
+
+    Parameters
+    ----------
+    id : sa.Column(sa.String(30), primary_key=True)
+        Primary key in the format
+        ```python
+        f"u{public_id}_tst{edit_no}_v{view_id}"
+        ```
+    user_id : sa.Column(sa.Integer, ...)
+        The user the edit belongs to.
+    edit_no : sa.Column(sa.Integer, nullable=False)
+        The number of the edit.
+    view_id : sa.Column(sa.String(5), nullable=False)
+        The view-id.
+    n_responses : sa.Column(sa.SmallInteger, nullable=False, default=0)
+        The number of (item-) responses of the view.
+    """
+    __tablename__: str = "view_progress"
+    id = sa.Column(sa.String(30), primary_key=True)
+    user_id = sa.Column(sa.Integer, db.ForeignKey("user.public_id", ondelete="CASCADE"), nullable=False)
+    edit_no = sa.Column(sa.Integer, nullable=False)
+    view_id = sa.Column(sa.String(5), nullable=False)
+    n_responses = sa.Column(sa.SmallInteger, nullable=False, default=0)
+    __table_args__ = (sa.Index("ix_view_progress_edit", "user_id", "edit_no"),)
+
+    @staticmethod
+    def touch(user_id: int, edit_no: int, view_id: str) -> None:
+        """Marks a view of a users edit to be recounted when the current
+        database session commits. Must be called for every response write
+        that bypasses the ORM-unit of work (e.g., `upsert`), ORM-writes are
+        collected automatically.
+        """
+        db.session.info.setdefault("touched_views", set()).add((user_id, edit_no, view_id))
+
+    @staticmethod
+    def refresh(views: set[tuple[int, int, str]]) -> None:
+        """Recounts the responses of the passed (user_id, edit_no, view_id)
+        views with a single aggregate query and writes the counts. Does not
+        commit.
+        """
+        if len(views) == 0:
+            return
+        views = list(views)
+        edits = list({(user_id, edit_no) for user_id, edit_no, _ in views})
+        responses = sa.union_all(*[
+            sa.select(res_class.user_id, res_class.edit_no, res_class.view_id)
+            .where(sa.tuple_(res_class.user_id, res_class.edit_no).in_(edits))
+            for res_class in Responses.res_classes
+        ]).subquery()
+        counts = {
+            (user_id, edit_no, view_id): n_responses
+            for user_id, edit_no, view_id, n_responses in db.session.execute(
+                sa.select(
+                    responses.c.user_id,
+                    responses.c.edit_no,
+                    responses.c.view_id,
+                    sa.func.count(),
+                )
+                .where(responses.c.view_id.in_({view_id for _, _, view_id in views}))
+                .group_by(responses.c.user_id, responses.c.edit_no, responses.c.view_id)
+            ).all()
+        }
+        upsert(ViewProgress, [
+            {
+                "id": f"u{user_id}_tst{edit_no}_v{view_id}",
+                "user_id": user_id,
+                "edit_no": edit_no,
+                "view_id": view_id,
+                "n_responses": counts.get((user_id, edit_no, view_id), 0),
+            }
+            for user_id, edit_no, view_id in views
+        ])
+
+    @staticmethod
+    def user_progress(public_id: int, edit_no: int) -> dict[str, int]:
+        """Returns the number of responses per view of a users edit. Views
+        without responses might be missing.
+
+        Parameters
+        ----------
+        public_id : int
+            The users public id.
+        edit_no : int
+            An edit number belonging to the user.
+
+        Returns
+        -------
+        progress : dict[str, int]
+            Maps the view-ids to the number of responses.
+        """
+        rows = db.session.execute(
+            sa.select(ViewProgress.view_id, ViewProgress.n_responses)
+            .where(ViewProgress.user_id == public_id, ViewProgress.edit_no == edit_no)
+        ).all()
+        return {view_id: n_responses for view_id, n_responses in rows}
+
+    @staticmethod
+    def delete_edits(public_id: int, edit_no: int=None) -> None:
+        """Deletes the progress of a user (edit), alongside its responses.
+        Does not commit.
+        """
+        query = sa.delete(ViewProgress).where(ViewProgress.user_id == public_id)
+        if edit_no is not None:
+            query = query.where(ViewProgress.edit_no == edit_no)
+        db.session.execute(query)
+        touched = db.session.info.get("touched_views", set())
+        touched -= {
+            view for view in touched
+            if view[0] == public_id and (edit_no is None or view[1] == edit_no)
+        }
+
+
+@sa.event.listens_for(sa.orm.Session, "before_flush")
+def _touch_flushed_views(session: sa.orm.Session, flush_context, instances) -> None:
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, Response):
+            session.info.setdefault("touched_views", set()).add(
+                (obj.user_id, obj.edit_no or 0, obj.view_id)
+            )
+
+
+@sa.event.listens_for(sa.orm.Session, "before_commit")
+def _refresh_touched_views(session: sa.orm.Session) -> None:
+    # Flushing first, such that pending ORM-responses get collected and counted
+    session.flush()
+    touched = session.info.pop("touched_views", set())
+    if len(touched) > 0:
+        ViewProgress.refresh(touched)
+        TestEdit.bump_revisions(list({(user_id, edit_no) for user_id, edit_no, _ in touched}))
+
+
+@sa.event.listens_for(sa.orm.Session, "after_rollback")
+def _drop_touched_views(session: sa.orm.Session) -> None:
+    session.info.pop("touched_views", None)
+
 
 
 
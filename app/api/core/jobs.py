@@ -0,0 +1,289 @@
+from flask import Flask, current_app
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from typing import Callable, Hashable, Iterator, Literal
+
+from .time import utc_now
+
+
+class Job:
+    """A background job of the `JobQueue`.
+
+    Parameters
+    ----------
+    key : Hashable
+        Deduplication key, e.g., `(user_id, edit_no)` for scoring jobs.
+    user_id : int
+        The user (public) id the job belongs to. Only this user may query the
+        job status.
+    """
+    def __init__(self, key: Hashable, user_id: int) -> None:
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.user_id = user_id
+        self.status: Literal["queued", "running", "done", "failed"] = "queued"
+        self.message: str = None
+        self.created = utc_now()
+        self.started = None
+        self.finished = None
+
+    def as_dict(self) -> dict:
+        """Returns the job as a json-serializable dict.
+        """
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "message": self.message,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+class JobQueue:
+    """A thread pool running jobs in the background within an app context.
+    Submitting a job for a key, which already has a queued (not yet running)
+    job, returns the queued job instead of adding a duplicate. Jobs of the
+    same key never run concurrently.
+
+    Parameters
+    ----------
+    max_workers : int=2
+        Number of worker threads.
+    max_finished : int=1000
+        Number of finished jobs kept for status queries.
+    """
+    def __init__(self, max_workers: int=2, max_finished: int=1000) -> None:
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="jobs",
+        )
+        self.max_workers = max_workers
+        self.max_finished = max_finished
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._queued: dict[Hashable, Job] = {}
+        # Locks of the keys in use, with their number of holders / waiters
+        self._key_locks: dict[Hashable, tuple[threading.Lock, int]] = {}
+        self._lock = threading.Lock()
+        self.merged = 0
+
+    def submit(
+        self,
+        key: Hashable,
+        user_id: int,
+        fn: Callable[..., str],
+        *args,
+        **kwargs,
+    ) -> Job:
+        """Queues `fn(*args, **kwargs)` as a job. Must be called within an
+        app context, which is passed on to the worker.
+
+        Returns
+        -------
+        job : Job
+            The new job or the already queued job for the same key.
+        """
+        app: Flask = current_app._get_current_object()
+        with self._lock:
+            queued = self._queued.get(key)
+            if queued is not None:
+                self.merged += 1
+                return queued
+            job = Job(key, user_id)
+            self._jobs[job.id] = job
+            self._queued[key] = job
+            self._prune()
+        self._executor.submit(self._run, app, job, fn, *args, **kwargs)
+        return job
+
+    def get(self, job_id: str) -> Job:
+        """Returns the job with the given id or `None`.
+        """
+        return self._jobs.get(job_id)
+
+    @contextmanager
+    def key_lock(self, key: Hashable) -> Iterator[None]:
+        """Holds the lock of the key, which is held while a job of the key
+        runs. Can be used by other background work that must not run
+        concurrently with these jobs. The lock is dropped once nobody holds
+        or waits for it anymore.
+        """
+        with self._lock:
+            lock, n_users = self._key_locks.get(key, (threading.Lock(), 0))
+            self._key_locks[key] = (lock, n_users + 1)
+        try:
+            with lock:
+                yield
+        finally:
+            with self._lock:
+                lock, n_users = self._key_locks[key]
+                if n_users > 1:
+                    self._key_locks[key] = (lock, n_users - 1)
+                else:
+                    del self._key_locks[key]
+
+    def _run(self, app: Flask, job: Job, fn: Callable[..., str], *args, **kwargs) -> None:
+        with self.key_lock(job.key):
+            with self._lock:
+                # From now on, new submissions for the key get a new job, as
+                #   the responses might have changed after this one started.
+                if self._queued.get(job.key) is job:
+                    del self._queued[job.key]
+                job.status = "running"
+                job.started = utc_now()
+            try:
+                with app.app_context():
+                    job.message = fn(*args, **kwargs)
+                job.status = "done"
+            except Exception as e:
+                job.message = f"{type(e).__name__}: {e}"
+                job.status = "failed"
+            job.finished = utc_now()
+
+    def _prune(self) -> None:
+        finished = [
+            job_id for job_id, job in self._jobs.items()
+            if job.status in ["done", "failed"]
+        ]
+        for job_id in finished[:max(len(finished) - self.max_finished, 0)]:
+            del self._jobs[job_id]
+
+    def stats(self) -> dict:
+        """Number of jobs per status.
+
+        Returns
+        -------
+        stats : dict
+        """
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        stats = {
+            status: statuses.count(status)
+            for status in ["queued", "running", "done", "failed"]
+        }
+        stats["workers"] = self.max_workers
+        stats["merged"] = self.merged
+        stats["locked_keys"] = len(self._key_locks)
+        return stats
+
+
+class DebouncedWorker:
+    """A single low-priority worker thread for speculative background work.
+    A scheduled call only runs after no further call for the same key has
+    been scheduled for `delay_s` seconds; calls still waiting for the worker
+    are merged per key as well. The delays are kept by the worker itself,
+    which waits until the earliest deadline. After each call the worker
+    pauses, such that it is busy for at most `cpu_share` of the time.
+
+    Parameters
+    ----------
+    delay_s : float=2.0
+        Debounce delay per key.
+    cpu_share : float=0.25
+        Maximum share of (wall-clock) time the worker is busy, in (0, 1].
+    """
+    def __init__(self, delay_s: float=2.0, cpu_share: float=0.25) -> None:
+        self.delay = delay_s
+        self.cpu_share = min(max(cpu_share, 0.01), 1.0)
+        # Deadlines are increasing in insertion order, as the delay is the same
+        #   for all keys, i.e., the first entry is due first.
+        self._waiting: OrderedDict[Hashable, tuple[float, tuple]] = OrderedDict()
+        self._pending: OrderedDict[Hashable, tuple] = OrderedDict()
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._worker: threading.Thread = None
+        self.debounced = 0
+        self.merged = 0
+        self.done = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.idle_seconds = 0.0
+
+    def schedule(self, key: Hashable, fn: Callable[..., str], *args, **kwargs) -> None:
+        """Schedules `fn(*args, **kwargs)` for the key, replacing a call of the
+        same key that is still within its delay. Must be called within an app
+        context, which is passed on to the worker.
+        """
+        app: Flask = current_app._get_current_object()
+        call = (app, fn, args, kwargs)
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run,
+                    name="debounced-worker",
+                    daemon=True,
+                )
+                self._worker.start()
+            if self._waiting.pop(key, None) is not None:
+                self.debounced += 1
+            self._waiting[key] = (time.monotonic() + self.delay, call)
+            self._cond.notify()
+
+    def _enqueue_due(self) -> float:
+        """Moves the calls whose delay has passed to the pending ones and
+        returns the seconds until the next deadline (None if nothing is
+        waiting). Must be called holding the lock.
+        """
+        now = time.monotonic()
+        while len(self._waiting) > 0:
+            key, (deadline, call) = next(iter(self._waiting.items()))
+            if deadline > now:
+                return deadline - now
+            del self._waiting[key]
+            if key in self._pending:
+                self.merged += 1
+            self._pending[key] = call
+        return None
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    timeout = self._enqueue_due()
+                    if len(self._pending) > 0:
+                        break
+                    self._cond.wait(timeout)
+                _, (app, fn, args, kwargs) = self._pending.popitem(last=False)
+
+            t0 = time.perf_counter()
+            try:
+                with app.app_context():
+                    fn(*args, **kwargs)
+                self.done += 1
+            except Exception:
+                self.failed += 1
+            busy = time.perf_counter() - t0
+
+            # Keeping the duty cycle at `cpu_share`
+            idle = busy * (1 - self.cpu_share) / self.cpu_share
+            self.busy_seconds += busy
+            self.idle_seconds += idle
+            time.sleep(idle)
+
+    def stats(self) -> dict:
+        """Numbers of scheduled, merged and finished calls and the busy and
+        idle time of the worker.
+
+        Returns
+        -------
+        stats : dict
+        """
+        with self._lock:
+            return {
+                "delay_s": self.delay,
+                "cpu_share": self.cpu_share,
+                "waiting": len(self._waiting),
+                "pending": len(self._pending),
+                "debounced": self.debounced,
+                "merged": self.merged,
+                "done": self.done,
+                "failed": self.failed,
+                "busy_seconds": round(self.busy_seconds, 4),
+                "idle_seconds": round(self.idle_seconds, 4),
+            }
@@ -0,0 +1,421 @@
+from flask import Flask
+import sqlalchemy as sa
+
+import datetime as dt
+import fcntl
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from typing import Literal
+
+from .database import db, upsert
+from .dbmodels import Response, Responses, TextResponse, MCResponse, ViewProgress
+from .metrics import register_metrics
+
+from ...core.utils import hprint
+
+
+class ResponseJournal:
+    """A write-behind journal for (text- and MC-) responses. Accepted writes
+    are appended to a local file (fsync'd, i.e., durable when `append`
+    returns) and kept in memory, a background thread flushes them to the
+    response tables in batches. Multiple writes to the same response within a
+    batch collapse to the last one. Unflushed writes get overlaid onto
+    `Responses.user_dicts` (see `Responses.journal`) and are recovered from
+    the file after a restart, see `init_app`.
+
+    Each process journals to its own file (the process id is appended to the
+    name of `path`), which it holds an exclusive lock on. Files that are not
+    locked (anymore) are left over by stopped processes and get recovered by
+    the next one. Entries the database refuses are moved to a dead-letter
+    file (".dead" appended to the name of `path`).
+
+    Parameters
+    ----------
+    path : str
+        The journal file, the name the files of the processes derive from.
+    flush_interval_s : float=1.0
+        Time between two flushes of the background thread.
+    """
+    res_classes: dict[str, type[Response]] = {
+        res_class.__tablename__: res_class
+        for res_class in [TextResponse, MCResponse]
+    }
+
+    def __init__(self, path: str, flush_interval_s: float=1.0) -> None:
+        base = Path(path)
+        self.base_path = base
+        self.path = base.with_name(f"{base.stem}.{os.getpid()}{base.suffix}")
+        self.dead_letter_path = base.with_name(f"{base.stem}.dead{base.suffix}")
+        self.flush_interval = flush_interval_s
+        # (table, id) -> entry, in order of the last write
+        self._pending: OrderedDict[tuple[str, str], dict] = OrderedDict()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._worker: threading.Thread = None
+        self._app: Flask = None
+        self._file = None
+        self._seq = 0
+        self.appended = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.failed_flushes = 0
+        self.dead_letters = 0
+        self.recovered_files = 0
+        self.last_flush_seconds: float = None
+
+    def _leftover_files(self) -> list[Path]:
+        """Journal files of other (possibly stopped) processes, including
+        the unsuffixed `base_path` of older versions.
+        """
+        base = self.base_path
+        pattern = re.compile(rf"{re.escape(base.stem)}\.\d+{re.escape(base.suffix)}")
+        if not base.parent.is_dir():
+            return []
+        return sorted(
+            file for file in base.parent.iterdir()
+            if file == base or pattern.fullmatch(file.name) is not None
+        )
+
+    def _open(self) -> None:
+        """Takes over the entries of all leftover journal files that are not
+        locked by a running process and writes them to the (locked) file of
+        this process. The leftover files get removed afterwards.
+        """
+        entries = []
+        recovered = []
+        for file in self._leftover_files():
+            try:
+                f = open(file, encoding="utf-8")
+            except FileNotFoundError:
+                continue
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Journal of a running process
+                f.close()
+                continue
+            # Might have been recovered (and removed) by another process
+            #   while waiting for the lock.
+            if os.fstat(f.fileno()).st_nlink == 0:
+                f.close()
+                continue
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Incomplete last line of a crashed write, which has not
+                    #   been acknowledged.
+                    continue
+                entry["row"]["timestamp"] = dt.datetime.fromisoformat(entry["row"]["timestamp"])
+                entries.append(entry)
+            recovered.append((file, f))
+
+        # The sequence numbers are per file, the last write of a response is
+        #   the one with the latest timestamp (stable, i.e., in file order
+        #   otherwise).
+        entries.sort(key=lambda entry: entry["row"]["timestamp"])
+        for entry in entries:
+            self._seq += 1
+            entry["seq"] = self._seq
+            self._pending.pop((entry["table"], entry["row"]["id"]), None)
+            self._pending[(entry["table"], entry["row"]["id"])] = entry
+
+        # Durable in this processes file before removing the leftovers
+        self._compact()
+        for file, f in recovered:
+            if file != self.path:
+                file.unlink(missing_ok=True)
+            f.close()
+        self.recovered_files = len(recovered)
+
+    def _write(self, entries: list[dict]) -> None:
+        for entry in entries:
+            self._file.write(json.dumps(entry, default=dt.datetime.isoformat) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def init_app(self, app: Flask) -> None:
+        """Opens the journal file of this process and sets the app the
+        background flusher works with. Entries recovered from leftover journal
+        files are flushed right away and the flusher is started, such that
+        they reach the response tables without waiting for the next write.
+        """
+        self._app = app
+        with self._lock:
+            if self._file is None:
+                self._open()
+        if len(self._pending) == 0:
+            return
+        with app.app_context():
+            try:
+                self.flush()
+            except Exception as e:
+                # Stays pending, the background flusher retries
+                hprint(f"Flushing the recovered journal entries failed: {e}")
+            finally:
+                db.session.remove()
+        self._start()
+
+    def append(
+        self,
+        res_class: type[Response],
+        row: dict,
+        op: Literal["save", "delete"]="save",
+    ) -> None:
+        """Journals a write of a response. The row must contain at least the
+        id, item_id, task_id, view_id, user_id, edit_no and timestamp columns
+        (and response for saves). Requires `init_app` to have been called.
+        """
+        self._start()
+        with self._lock:
+            self._seq += 1
+            entry = {"seq": self._seq, "op": op, "table": res_class.__tablename__, "row": row}
+            self._write([entry])
+            key = (entry["table"], row["id"])
+            if self._pending.pop(key, None) is not None:
+                self.coalesced += 1
+            self._pending[key] = entry
+            self.appended += 1
+
+    def get(self, res_class: type[Response], unique_id: str) -> dict:
+        """The unflushed entry of a response or `None`. Entries have an "op"
+        ("save" or "delete") and a "row".
+        """
+        with self._lock:
+            return self._pending.get((res_class.__tablename__, unique_id))
+
+    def _start(self) -> None:
+        if self._worker is not None:
+            return
+        if self._app is None:
+            raise RuntimeError("The response journal has not been initialized, see `ResponseJournal.init_app`.")
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run,
+                    args=(self._app,),
+                    name="response-journal",
+                    daemon=True,
+                )
+                self._worker.start()
+
+    def _run(self, app: Flask) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            with app.app_context():
+                try:
+                    self.flush()
+                except Exception:
+                    pass
+                finally:
+                    db.session.remove()
+
+    def flush(self) -> int:
+        """Writes all unflushed entries to the response tables in a single
+        transaction. Is called periodically by the background thread, and
+        should be called before reading the response tables directly, e.g.,
+        for scoring. If the transaction fails, the entries are written one by
+        one and the ones the database refuses are dead-lettered. Requires an
+        app context.
+
+        Returns
+        -------
+        n_flushed : int
+            Number of written (saved or deleted) responses.
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch = list(self._pending.values())
+            if len(batch) == 0:
+                return 0
+
+            t0 = time.perf_counter()
+            dead: list[tuple[dict, Exception]] = []
+            try:
+                self._write_rows(batch)
+                db.session.commit()
+                flushed = batch
+            except Exception as e:
+                db.session.rollback()
+                with self._lock:
+                    self.failed_flushes += 1
+                if isinstance(e, sa.exc.OperationalError):
+                    # The database is unavailable (e.g. locked), the complete
+                    #   batch stays pending.
+                    raise
+                # A single entry should not block all others, the entries the
+                #   database refuses on their own are dead-lettered.
+                flushed, dead = self._flush_single(batch)
+
+            with self._lock:
+                if len(dead) > 0:
+                    self._dead_letter(dead)
+                for entry in flushed + [entry for entry, _ in dead]:
+                    key = (entry["table"], entry["row"]["id"])
+                    # Entries written during the flush stay pending
+                    if self._pending.get(key) is entry:
+                        del self._pending[key]
+                self._compact()
+                self.flushes += 1
+                self.flushed_rows += len(flushed)
+                self.last_flush_seconds = time.perf_counter() - t0
+            return len(flushed)
+
+    def _write_rows(self, batch: list[dict]) -> None:
+        for table, res_class in self.res_classes.items():
+            saves = [e["row"] for e in batch if e["table"] == table and e["op"] == "save"]
+            deletes = [e["row"]["id"] for e in batch if e["table"] == table and e["op"] == "delete"]
+            upsert(res_class, saves)
+            if len(deletes) > 0:
+                db.session.execute(sa.delete(res_class).where(res_class.id.in_(deletes)))
+        for entry in batch:
+            row = entry["row"]
+            ViewProgress.touch(row["user_id"], row["edit_no"], row["view_id"])
+
+    def _flush_single(self, batch: list[dict]) -> tuple[list[dict], list[tuple[dict, Exception]]]:
+        """Writes the entries of a failed batch one by one. Stops (leaving the
+        remaining entries pending) if the database becomes unavailable.
+
+        Returns
+        -------
+        flushed : list[dict]
+            The written entries.
+        dead : list[tuple[dict, Exception]]
+            The refused entries and their errors.
+        """
+        flushed, dead = [], []
+        for entry in batch:
+            try:
+                self._write_rows([entry])
+                db.session.commit()
+                flushed.append(entry)
+            except sa.exc.OperationalError:
+                db.session.rollback()
+                break
+            except Exception as e:
+                db.session.rollback()
+                dead.append((entry, e))
+        return flushed, dead
+
+    def _dead_letter(self, dead: list[tuple[dict, Exception]]) -> None:
+        """Appends refused entries (with their error) to the dead-letter file,
+        which is shared by all processes. Must be called holding the lock.
+        """
+        with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            for entry, e in dead:
+                f.write(json.dumps({**entry, "error": repr(e)}, default=dt.datetime.isoformat) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        for entry, e in dead:
+            hprint(
+                f"Journal entry {entry['table']}/{entry['row']['id']} could not be written and "
+                f"was moved to {self.dead_letter_path}: {e}"
+            )
+        self.dead_letters += len(dead)
+
+    def discard(self, user_id: int, edit_no: int=None) -> None:
+        """Drops the unflushed entries of a user (edit), e.g., before its
+        responses get deleted.
+        """
+        with self._flush_lock, self._lock:
+            for key, entry in list(self._pending.items()):
+                row = entry["row"]
+                if row["user_id"] == user_id and (edit_no is None or row["edit_no"] == edit_no):
+                    del self._pending[key]
+            self._compact()
+
+    def _compact(self) -> None:
+        """Rewrites the journal file with the pending entries only. The new
+        file is locked before it replaces the old one. Must be called holding
+        the lock.
+        """
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        f = open(tmp_path, "w", encoding="utf-8")
+        fcntl.flock(f, fcntl.LOCK_EX)
+        for entry in self._pending.values():
+            f.write(json.dumps(entry, default=dt.datetime.isoformat) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        if self._file is not None:
+            self._file.close()
+        self._file = f
+
+    def overlay(self, public_id: int, edit_no: int, dct: dict[str, list[dict]]) -> dict[str, list[dict]]:
+        """Applies the unflushed entries of a user (edit) to the output of
+        `Responses.user_dicts`.
+        """
+        with self._lock:
+            entries = [
+                entry for entry in self._pending.values()
+                if entry["row"]["user_id"] == public_id
+                and (edit_no is None or entry["row"]["edit_no"] == edit_no)
+            ]
+        for entry in entries:
+            row = entry["row"]
+            responses = [res for res in dct.get(entry["table"], []) if res["id"] != row["id"]]
+            if entry["op"] == "save":
+                responses.append({
+                    key: row[key]
+                    for key in ["id", "item_id", "task_id", "view_id", "user_id", "edit_no", "response", "timestamp"]
+                })
+            dct[entry["table"]] = responses
+        return dct
+
+    def stats(self) -> dict:
+        """Numbers of journaled, coalesced, pending and flushed writes.
+
+        Returns
+        -------
+        stats : dict
+        """
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "appended": self.appended,
+                "coalesced": self.coalesced,
+                "flushes": self.flushes,
+                "flushed_rows": self.flushed_rows,
+                "failed_flushes": self.failed_flushes,
+                "dead_letters": self.dead_letters,
+                "recovered_files": self.recovered_files,
+                "last_flush_seconds": (
+                    round(self.last_flush_seconds, 4)
+                    if self.last_flush_seconds is not None else None
+                ),
+            }
+
+
+response_journal: ResponseJournal = None
+
+
+def init_response_journal(app: Flask) -> ResponseJournal:
+    """Creates (once per process) and initializes the response journal, if
+    "RESPONSE_JOURNAL" is set in the app config. The journal is used via
+    `Responses.journal`.
+
+    Returns
+    -------
+    response_journal : ResponseJournal
+        `None` if the journal is disabled.
+    """
+    global response_journal
+    if not app.config.get("RESPONSE_JOURNAL", False):
+        return None
+    if response_journal is None:
+        response_journal = ResponseJournal(
+            app.config.get("RESPONSE_JOURNAL_PATH", "./env/response_journal.jsonl"),
+            flush_interval_s=app.config.get("RESPONSE_JOURNAL_FLUSH_S", 1.0),
+        )
+        Responses.journal = response_journal
+        register_metrics("response_journal", response_journal.stats)
+    response_journal.init_app(app)
+    return response_journal
@@ -0,0 +1,29 @@
+from typing import Callable
+
+
+metrics_providers: dict[str, Callable[[], dict]] = {}
+
+
+def register_metrics(name: str, provider: Callable[[], dict]) -> None:
+    """Registers a callable that returns a json-serializable dict of runtime
+    metrics (cache hit rates, load times, ...) under the given name.
+
+    Parameters
+    ----------
+    name : str
+        Key under which the metrics are reported.
+    provider : Callable[[], dict]
+        Callable returning the current metrics.
+    """
+    metrics_providers[name] = provider
+
+
+def collect_metrics() -> dict[str, dict]:
+    """Collects the current metrics of all registered providers.
+
+    Returns
+    -------
+    metrics : dict[str, dict]
+    """
+    metrics = {name: provider() for name, provider in metrics_providers.items()}
+    return metrics
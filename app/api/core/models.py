@@ -2,15 +2,29 @@ from flask import current_app
 
 import numpy as np
 import pandas as pd
+import torch
 from transformers import (
     AutoTokenizer,
     AutoModelForSequenceClassification,
-    TextClassificationPipeline,
+    PreTrainedModel,
+    PreTrainedTokenizerBase,
 )
 
-from typing import Literal
+import importlib.util
+import inspect
+import re
+import threading
+import time
+from collections import defaultdict
+from hashlib import sha256
+from pathlib import Path
+
+from typing import Callable, Literal
 
 from ...config import load_env_json
+from .metrics import register_metrics
+from .batching import ScoringQueue
+from .prediction_cache import PredictionCache
 
 # import torch
 # print(torch.cuda.is_available())
@@ -18,41 +32,343 @@ from ...config import load_env_json
 # from ...core.utils import hprint
 
 
+def scorer_version(path: str="./models/scorer") -> str:
+    """A version string for the scorer model files, derived from the file
+    names, sizes and modification times below `path`. Changes whenever a new
+    model is dropped into the directory, without reading the weights.
+
+    Parameters
+    ----------
+    path : str="./models/scorer"
+
+    Returns
+    -------
+    version : str
+    """
+    h = sha256()
+    root = Path(path)
+    for file in sorted(root.rglob("*")):
+        if file.is_file():
+            stat = file.stat()
+            h.update(f"{file.relative_to(root)}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return h.hexdigest()[:16]
+
+
+ScorerBackend = Literal["eager", "quantized", "onnx"]
+scorer_backends: list[ScorerBackend] = ["eager", "quantized", "onnx"]
+
+
+def check_scorer_backend(backend: str) -> None:
+    """Raises a ValueError if the backend is unknown and a RuntimeError if it
+    depends on an optional package that is not installed.
+
+    Parameters
+    ----------
+    backend : str
+    """
+    if backend not in scorer_backends:
+        raise ValueError(f"Unknown scorer backend \"{backend}\", must be one of {scorer_backends}.")
+    if backend == "onnx" and importlib.util.find_spec("onnxruntime") is None:
+        raise RuntimeError(
+            "The \"onnx\" scorer backend requires the `onnxruntime` package. Install it "
+            "via `poetry install --extras onnx` or choose another SCORER_BACKEND."
+        )
+
+
+def export_onnx(
+    lang_model: PreTrainedModel,
+    tokenizer: PreTrainedTokenizerBase,
+    path: str,
+) -> None:
+    """Exports the language model to an ONNX graph with dynamic batch and
+    sequence axes.
+
+    Parameters
+    ----------
+    lang_model : PreTrainedModel
+    tokenizer : PreTrainedTokenizerBase
+    path : str
+        Path of the resulting ".onnx"-file.
+    """
+    sample = tokenizer(["Aufgabe 1: Beispiel"], return_tensors="pt")
+    # The graph inputs are ordered like the arguments of `forward`, not like
+    #   the tokenizer outputs.
+    input_names = [
+        name for name in inspect.signature(lang_model.forward).parameters
+        if name in sample
+    ]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["logits"] = {0: "batch"}
+
+    export_kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        # Newer torch versions default to the dynamo-exporter
+        export_kwargs["dynamo"] = False
+
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with torch.inference_mode():
+        torch.onnx.export(
+            lang_model,
+            (dict(sample),),
+            path,
+            input_names=input_names,
+            output_names=["logits"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+            **export_kwargs,
+        )
+
+
 class Scorer:
-    def __init__(self) -> None:
+    """The language model scoring the text tasks.
+
+    Parameters
+    ----------
+    backend : ScorerBackend="eager"
+        The inference backend: "eager" runs the PyTorch model as is,
+        "quantized" a dynamically int8-quantized copy of its linear layers and
+        "onnx" an exported ONNX graph on the onnxruntime CPU execution
+        provider (requires the `onnxruntime` package). The ONNX graph is
+        exported once per model version to "./models/scorer_onnx".
+    batch_size : int=16
+        Number of texts per forward pass. The texts of a `predict`-call are
+        sorted by their token length before batching, such that each batch
+        contains texts of similar length and little padding.
+    max_length : int=None
+        Number of tokens a text gets truncated to. Defaults to the maximum
+        input length of the model.
+    """
+    def __init__(
+        self,
+        backend: ScorerBackend="eager",
+        batch_size: int=16,
+        max_length: int=None,
+    ) -> None:
+        check_scorer_backend(backend)
+        self.version = scorer_version("./models/scorer")
+        self.backend = backend
+
         self.tokenizer = AutoTokenizer.from_pretrained("./models/scorer/tokenizer")
 
         lang_model = AutoModelForSequenceClassification.from_pretrained("./models/scorer/model")
         lang_model = lang_model.to("cpu")
         lang_model = lang_model.eval()
-        self.lang_model = lang_model
+        self.id2label = lang_model.config.id2label
+
+        model_max_length = min(
+            self.tokenizer.model_max_length,
+            lang_model.config.max_position_embeddings,
+        )
+        if max_length is None or max_length > model_max_length:
+            max_length = model_max_length
+        self.max_length = max_length
+        self.batch_size = max(batch_size, 1)
+
+        self.lang_model = None
+        self.session = None
+        if backend == "eager":
+            self.lang_model = lang_model
+        if backend == "quantized":
+            self.lang_model = torch.ao.quantization.quantize_dynamic(
+                lang_model,
+                {torch.nn.Linear},
+                dtype=torch.qint8,
+            )
+        if backend == "onnx":
+            import onnxruntime as ort
+            self.onnx_path = Path(f"./models/scorer_onnx/{self.version}.onnx")
+            if not self.onnx_path.exists():
+                export_onnx(lang_model, self.tokenizer, str(self.onnx_path))
+            self.session = ort.InferenceSession(
+                str(self.onnx_path),
+                providers=["CPUExecutionProvider"],
+            )
+
+        # The lock serializes concurrent forward passes, which compete for the
+        #   same CPU threads anyways.
+        self._lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._n_texts = 0
+        self._n_truncated = 0
+        self._n_tokens = 0
+        self._n_padded_tokens = 0
+        self._length_bins = [2**k for k in range(3, 16) if 2**k < self.max_length]
+        self._length_bins.append(self.max_length)
+        self._length_hists: dict[str, np.ndarray] = defaultdict(
+            lambda: np.zeros(len(self._length_bins), dtype=int)
+        )
 
-        print(f"Scorer initiated (device={self.lang_model.device}).")
+        print(f"Scorer initiated (device=cpu, backend={backend}, version={self.version}).")
 
     def __del__(self) -> None:
         print("Scorer deleted.")
 
+    def memory_bytes(self) -> int:
+        """Approximate memory footprint of the language model weights and
+        buffers in bytes. For the ONNX backend this is the size of the graph
+        file.
+        """
+        if self.session is not None:
+            return self.onnx_path.stat().st_size
+        state = self.lang_model.state_dict()
+        tensors = [t for t in state.values() if isinstance(t, torch.Tensor)]
+        # The quantized linear layers keep their weights as packed params
+        for value in state.values():
+            if isinstance(value, tuple):
+                tensors += [t for t in value if isinstance(t, torch.Tensor)]
+        return sum(t.numel() * t.element_size() for t in tensors)
+
+    def _logits(self, encodings: dict[str, list[list[int]]]) -> np.ndarray:
+        """Logits of a batch of (unpadded) encodings.
+        """
+        if self.session is not None:
+            encodings = self.tokenizer.pad(encodings, return_tensors="np")
+            feeds = {
+                node.name: encodings[node.name].astype(np.int64)
+                for node in self.session.get_inputs()
+            }
+            return self.session.run(["logits"], feeds)[0]
+
+        encodings = self.tokenizer.pad(encodings, return_tensors="pt")
+        with torch.inference_mode():
+            logits = self.lang_model(**encodings).logits
+        return logits.numpy()
+
     def predict(
         self,
         texts: list[str]
     ) -> np.ndarray:
-        model = self.lang_model.eval()
-        tokenizer = self.tokenizer
-
-        pipe = TextClassificationPipeline(model=model, tokenizer=tokenizer)
-        # y_pred = np.array([])
-
-        preds = pipe(texts)
-        df_preds = pd.DataFrame(preds)
-        y_pred = (df_preds["label"]
+        if len(texts) == 0:
+            return np.array([], dtype=int)
+
+        with self._lock:
+            encodings = self.tokenizer(texts, truncation=True, max_length=self.max_length)
+            lengths = np.array([len(ids) for ids in encodings["input_ids"]])
+
+            # Length-bucketing: Batches of texts with similar token lengths,
+            #   the predictions are written back in the original order.
+            order = np.argsort(lengths, kind="stable")
+            logits = np.zeros((len(texts), len(self.id2label)), dtype=np.float32)
+            n_padded_tokens = 0
+            for start in range(0, len(texts), self.batch_size):
+                idxs = order[start:start + self.batch_size]
+                batch = {key: [values[idx] for idx in idxs] for key, values in encodings.items()}
+                logits[idxs] = self._logits(batch)
+                n_padded_tokens += len(idxs) * lengths[idxs].max()
+
+        self._record_lengths(texts, lengths, n_padded_tokens)
+
+        labels = pd.Series([self.id2label[idx] for idx in logits.argmax(axis=-1)])
+        y_pred = (labels
             .str.removeprefix("LABEL_")
             .astype(int)
             .values
         )
-        # y_pred = np.hstack([y_pred, y_pred_batch])
 
         return y_pred
 
+    def _record_lengths(
+        self,
+        texts: list[str],
+        lengths: np.ndarray,
+        n_padded_tokens: int,
+    ) -> None:
+        bins = np.searchsorted(self._length_bins, lengths)
+        with self._stats_lock:
+            self._n_texts += len(texts)
+            self._n_truncated += int(np.sum(lengths >= self.max_length))
+            self._n_tokens += int(lengths.sum())
+            self._n_padded_tokens += int(n_padded_tokens)
+            for text, bin_ in zip(texts, bins):
+                task = re.match(r"Aufgabe ([^:]*):", text)
+                task = "A" + task.group(1) if task is not None else "unknown"
+                self._length_hists[task][bin_] += 1
+
+    def stats(self) -> dict:
+        """Batching and truncation settings, the share of padding tokens and
+        the token length histograms per task. The histogram keys are the
+        upper bin edges. Texts reaching `max_length` count as truncated.
+
+        Returns
+        -------
+        stats : dict
+        """
+        with self._stats_lock:
+            return {
+                "backend": self.backend,
+                "batch_size": self.batch_size,
+                "max_length": self.max_length,
+                "texts": self._n_texts,
+                "truncated": self._n_truncated,
+                "tokens": self._n_tokens,
+                "padded_tokens": self._n_padded_tokens,
+                "padding_share": (
+                    round(1 - self._n_tokens / self._n_padded_tokens, 4)
+                    if self._n_padded_tokens > 0 else None
+                ),
+                "token_lengths": {
+                    task: {
+                        str(edge): int(count)
+                        for edge, count in zip(self._length_bins, hist)
+                    }
+                    for task, hist in sorted(self._length_hists.items())
+                },
+            }
+
+
+def compare_scorer_backends(
+    texts: list[str],
+    backends: list[ScorerBackend]=scorer_backends,
+    n_repeats: int=3,
+) -> pd.DataFrame:
+    """Parity check and latency comparison of the scorer backends on a
+    reference set of texts. The predicted labels of each backend are compared
+    to the ones of the "eager" backend.
+
+    Parameters
+    ----------
+    texts : list[str]
+        Reference texts as passed to the scorer (i.e. including the
+        "Aufgabe xy:" prefix).
+    backends : list[ScorerBackend]=scorer_backends
+    n_repeats : int=3
+        Number of timed predictions of the complete reference set per backend.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per backend with the label agreement with the eager backend
+        and the prediction latencies.
+    """
+    backends = ["eager"] + [backend for backend in backends if backend != "eager"]
+    for backend in backends:
+        check_scorer_backend(backend)
+    y_ref = None
+    rows = []
+    for backend in backends:
+        scorer = Scorer(backend)
+        scorer.predict(texts[:1])
+
+        latencies = []
+        for _ in range(n_repeats):
+            t0 = time.perf_counter()
+            y_pred = scorer.predict(texts)
+            latencies.append(time.perf_counter() - t0)
+        if y_ref is None:
+            y_ref = y_pred
+
+        rows.append({
+            "backend": backend,
+            "n_texts": len(texts),
+            "agreement": float(np.mean(y_pred == y_ref)),
+            "n_different": int(np.sum(y_pred != y_ref)),
+            "mean_seconds": float(np.mean(latencies)),
+            "min_seconds": float(np.min(latencies)),
+            "memory_bytes": scorer.memory_bytes(),
+        })
+    return pd.DataFrame(rows)
+
 
 class Clusterer:
     def __init__(self) -> None:
@@ -67,6 +383,12 @@ class Clusterer:
     def __del__(self) -> None:
         print("Clusterer deleted.")
 
+    def memory_bytes(self) -> int:
+        """Memory footprint of the loaded model tables in bytes.
+        """
+        dfs = [self.dimensions, self.scaler, self.centroids]
+        return int(sum(df.memory_usage(deep=True).sum() for df in dfs))
+
     def predict(self, scores: np.ndarray) -> int:
         if scores.ndim == 1:
             scores = np.expand_dims(scores, 0)
@@ -107,6 +429,11 @@ class Regressor:
     def __del__(self) -> None:
         print("Regressor deleted.")
 
+    def memory_bytes(self) -> int:
+        """Memory footprint of the loaded coefficient table in bytes.
+        """
+        return int(self.df_coefs.memory_usage(deep=True).sum())
+
     def dimscores(self, scores: np.ndarray) -> pd.DataFrame:
         if scores.ndim == 1:
             scores = np.expand_dims(scores, 0)
@@ -128,20 +455,127 @@ class Regressor:
 
 
 
-# cnfg = load_env_json("./env/config.jsonc")
 
-# if cnfg["PRELOAD_MODELS"]:
-#     scorer = Scorer()
-#     regressor = Regressor(cnfg["DIMSCORES_MODE"])
-#     clusterer = Clusterer()
-
-def get_model_instances() -> (tuple[Scorer, Regressor, Clusterer] | tuple[None, None, None]):
+class ModelRegistry:
+    """Process-wide registry for the assessment models. The models get loaded
+    lazily on first use and are kept resident afterwards, such that report
+    requests never reload tokenizer and weights from disk. The configured
+    scorer backend is checked right away, such that a misconfiguration shows
+    up at startup rather than on the first report request.
+    """
+    def __init__(self) -> None:
+        cnfg = load_env_json("./env/config.jsonc")
+        self.scorer_backend: ScorerBackend = cnfg.get("SCORER_BACKEND", "eager")
+        check_scorer_backend(self.scorer_backend)
+        self._instances: dict[str, Scorer|Regressor|Clusterer|ScoringQueue|PredictionCache] = {}
+        self._load_seconds: dict[str, float] = {}
+        self._lock = threading.RLock()
+
+    def _get(self, name: str, factory: Callable[[], Scorer|Regressor|Clusterer|ScoringQueue|PredictionCache]):
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        # Reentrant lock, as factories might depend on other registry entries.
+        with self._lock:
+            # Double-checked: another thread might have loaded the model while
+            #   waiting for the lock.
+            if name not in self._instances:
+                t0 = time.perf_counter()
+                instance = factory()
+                self._load_seconds[name] = time.perf_counter() - t0
+                self._instances[name] = instance
+            return self._instances[name]
+
+    def scorer(self) -> Scorer:
+        def factory() -> Scorer:
+            cnfg = load_env_json("./env/config.jsonc")
+            scorer = Scorer(
+                self.scorer_backend,
+                batch_size=cnfg.get("SCORER_BATCH_SIZE", 16),
+                max_length=cnfg.get("SCORER_MAX_LENGTH", None),
+            )
+            register_metrics("scorer_inputs", scorer.stats)
+            return scorer
+
+        return self._get("scorer", factory)
+
+    def regressor(self) -> Regressor:
+        def factory() -> Regressor:
+            cnfg = load_env_json("./env/config.jsonc")
+            return Regressor(cnfg.get("DIMSCORES_MODE", "regression"))
+
+        return self._get("regressor", factory)
+
+    def clusterer(self) -> Clusterer:
+        return self._get("clusterer", Clusterer)
+
+    def scoring_queue(self) -> ScoringQueue:
+        """The batching queue in front of the scorer. Text scoring of
+        concurrent report requests should go through this queue.
+        """
+        def factory() -> ScoringQueue:
+            cnfg = load_env_json("./env/config.jsonc")
+            queue = ScoringQueue(
+                self.scorer().predict,
+                max_wait_ms=cnfg.get("SCORING_BATCH_MAX_WAIT_MS", 50),
+                max_batch_size=cnfg.get("SCORING_BATCH_MAX_SIZE", 64),
+            )
+            register_metrics("scoring_queue", queue.stats)
+            return queue
+
+        return self._get("scoring_queue", factory)
+
+    def prediction_cache(self) -> PredictionCache:
+        """The prediction cache in front of the scoring queue. This is the
+        entrypoint for the text scoring of reports.
+        """
+        def factory() -> PredictionCache:
+            cnfg = load_env_json("./env/config.jsonc")
+            # Backends might differ in single predictions, so they do not share
+            #   cached predictions.
+            model_version = scorer_version("./models/scorer")
+            if self.scorer_backend != "eager":
+                model_version = f"{model_version}-{self.scorer_backend}"
+            cache = PredictionCache(
+                lambda texts: self.scoring_queue().predict(texts),
+                model_version=model_version,
+                max_bytes=int(cnfg.get("PREDICTION_CACHE_MAX_MB", 16) * 1024**2),
+                persistent=cnfg.get("PREDICTION_CACHE_PERSISTENT", False),
+            )
+            register_metrics("prediction_cache", cache.stats)
+            return cache
+
+        return self._get("prediction_cache", factory)
+
+    def preload(self) -> None:
+        """Loads all models right away instead of on first use.
+        """
+        self.scorer()
+        self.regressor()
+        self.clusterer()
+
+    def stats(self) -> dict[str, dict]:
+        """Load time (seconds) and memory footprint (bytes) of the currently
+        resident models.
+        """
+        return {
+            name: {
+                "load_seconds": round(self._load_seconds[name], 3),
+                "memory_bytes": instance.memory_bytes(),
+            }
+            for name, instance in list(self._instances.items())
+            if not isinstance(instance, (ScoringQueue, PredictionCache))
+        }
+
+
+model_registry = ModelRegistry()
+register_metrics("models", model_registry.stats)
+
+
+def preload_models() -> None:
+    """Loads all models at import time, if "PRELOAD_MODELS" is set in the
+    config. Otherwise they get loaded lazily on the first report request.
+    """
     cnfg = load_env_json("./env/config.jsonc")
     if cnfg.get("PRELOAD_MODELS", False):
-        regressor_mode = cnfg.get("DIMSCORES_MODE", "regression")
-        scorer = Scorer()
-        regressor = Regressor(regressor_mode)
-        clusterer = Clusterer()
-        return scorer, regressor, clusterer
-    else:
-        return None, None, None
+        model_registry.preload()
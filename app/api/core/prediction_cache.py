@@ -0,0 +1,159 @@
+import numpy as np
+import sqlalchemy as sa
+from sqlalchemy.exc import IntegrityError
+
+import sys
+import threading
+from hashlib import sha256
+
+from typing import Callable
+
+from .caching import LRUCache
+from .database import db
+from .dbmodels import PredictionCacheEntry
+
+
+def prediction_key(text: str, model_version: str) -> str:
+    """Content address of a (normalized) task text for a given model version.
+
+    Parameters
+    ----------
+    text : str
+        The text as passed to the scorer, i.e., after `add_item_names`.
+    model_version : str
+        Version string of the scorer model.
+
+    Returns
+    -------
+    key : str
+        Hex-encoded sha256-hash.
+    """
+    return sha256(f"{model_version}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class PredictionCache:
+    """A content-addressed cache in front of a predict-function. Lookups go
+    through an in-memory LRU tier and (optionally) a persistent tier stored in
+    the `PredictionCacheEntry` table. Only texts missing in both tiers are
+    passed on to `predict`.
+
+    Parameters
+    ----------
+    predict : Callable[[list[str]], np.ndarray]
+        The function scoring the cache misses, e.g., `ScoringQueue.predict`.
+    model_version : str
+        Version of the model behind `predict`. Part of the cache key, such
+        that a new model never gets served stale predictions.
+    max_bytes : int=16*1024**2
+        Size limit of the in-memory tier.
+    persistent : bool=False
+        Whether to use the persistent database tier. Requires an app context.
+    """
+    def __init__(
+        self,
+        predict: Callable[[list[str]], np.ndarray],
+        model_version: str,
+        max_bytes: int=16*1024**2,
+        persistent: bool=False,
+    ) -> None:
+        self._predict = predict
+        self.model_version = model_version
+        self.persistent = persistent
+        self.memory = LRUCache(
+            max_bytes,
+            sizeof=lambda key, value: sys.getsizeof(key) + sys.getsizeof(value),
+        )
+        self._lock = threading.Lock()
+        self.persistent_hits = 0
+        self.predicted = 0
+
+    def predict(self, texts: list[str]) -> np.ndarray:
+        """Predicts the scores of the texts, using cached predictions where
+        available.
+
+        Parameters
+        ----------
+        texts : list[str]
+
+        Returns
+        -------
+        y_pred : np.ndarray
+        """
+        keys = [prediction_key(text, self.model_version) for text in texts]
+        preds: dict[str, int] = {}
+
+        for key in keys:
+            pred = self.memory.get(key)
+            if pred is not None:
+                preds[key] = pred
+
+        missing = list(dict.fromkeys(key for key in keys if key not in preds))
+        if self.persistent and len(missing) > 0:
+            stored = self._load_persistent(missing)
+            for key, pred in stored.items():
+                self.memory.put(key, pred)
+            preds.update(stored)
+            with self._lock:
+                self.persistent_hits += len(stored)
+
+        missing_texts = {}
+        for key, text in zip(keys, texts):
+            if key not in preds:
+                missing_texts[key] = text
+        if len(missing_texts) > 0:
+            y_new = self._predict(list(missing_texts.values()))
+            new_preds = {
+                key: int(pred)
+                for key, pred in zip(missing_texts.keys(), y_new)
+            }
+            for key, pred in new_preds.items():
+                self.memory.put(key, pred)
+            if self.persistent:
+                self._store_persistent(new_preds)
+            preds.update(new_preds)
+            with self._lock:
+                self.predicted += len(new_preds)
+
+        y_pred = np.array([preds[key] for key in keys], dtype=int)
+        return y_pred
+
+    def _load_persistent(self, keys: list[str]) -> dict[str, int]:
+        entries: list[PredictionCacheEntry] = (PredictionCacheEntry
+            .query
+            .filter(PredictionCacheEntry.key.in_(keys))
+            .all()
+        )
+        return {entry.key: entry.prediction for entry in entries}
+
+    def _store_persistent(self, preds: dict[str, int]) -> None:
+        rows = [
+            {"key": key, "model_version": self.model_version, "prediction": pred}
+            for key, pred in preds.items()
+        ]
+        table = PredictionCacheEntry.__table__
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(sa.insert(table), rows)
+        except IntegrityError:
+            # Concurrent requests might have stored some of the same texts in
+            #   the meantime. Falling back to single inserts, skipping those.
+            for row in rows:
+                try:
+                    with db.engine.begin() as conn:
+                        conn.execute(sa.insert(table), row)
+                except IntegrityError:
+                    pass
+
+    def stats(self) -> dict:
+        """Hit/miss counters of both tiers.
+
+        Returns
+        -------
+        stats : dict
+        """
+        stats = self.memory.stats()
+        stats["persistent"] = self.persistent
+        stats["persistent_hits"] = self.persistent_hits
+        stats["predicted"] = self.predicted
+        stats["model_version"] = self.model_version
+        return stats
@@ -152,13 +152,7 @@ def item_dots(df: pd.DataFrame, col: str=None) -> pd.DataFrame:
     else:
         names = df[col].to_list()
 
-    new_names = []
-    for n in names:
-        if "_" in n:
-            n = re.sub("_", ".", n)
-        else:
-            n = f"{n}."
-        new_names.append(n)
+    new_names = [item_dot(n) for n in names]
 
     if col is None:
         df.columns = new_names
@@ -168,6 +162,34 @@ def item_dots(df: pd.DataFrame, col: str=None) -> pd.DataFrame:
     return df
 
 
+def item_dot(name: str) -> str:
+    """Unifies a single item-id to the "A1a. / A1b.1 / A5a." format. See
+    `item_dots`.
+    """
+    if "_" in name:
+        return re.sub("_", ".", name)
+    return f"{name}."
+
+
+def score_task(task_id: str) -> str:
+    """Maps a task-id as used in the questionnaire and the response tables
+    (e.g. "A1a", "A18b") to the corresponding scored task-name (e.g. "A1a.",
+    "A18.").
+
+    Parameters
+    ----------
+    task_id : str
+
+    Returns
+    -------
+    str
+    """
+    task = f"{task_id}."
+    if task not in tasks:
+        task = re.sub(r"[a-z]\.$", ".", task)
+    return task
+
+
 def reorder_column(df: pd.DataFrame, column: str, before: str) -> pd.DataFrame:
     """Wrapper to reorder a specific column in of a pandas dataset.
 
@@ -502,6 +524,110 @@ def score_mc_tasks(df: pd.DataFrame, mc_tasks: list[str]=mc_tasks) -> pd.DataFra
     return df
 
 
+class MCScorer:
+    """Compiled multiple choice scoring. Precomputes the item index, the
+    rubric vector, the item-to-task matrix and the kprim threshold table,
+    such that scoring is a comparison, a matrix product and a threshold count
+    instead of the DataFrame-pipeline `pivot_mc_item_df` -> `score_mc_items`
+    -> `score_mc_tasks`. Gives the same scores: missing items (99) score 0,
+    an edit without any MC-responses therefore scores 0 in all MC-tasks.
+
+    Parameters
+    ----------
+    mc_item_rubics : dict[str, bool]=mc_item_rubics
+    max_scores_mc : dict[str, int]=max_scores_mc
+    """
+    def __init__(
+        self,
+        mc_item_rubics: dict[str, bool]=mc_item_rubics,
+        max_scores_mc: dict[str, int]=max_scores_mc,
+    ) -> None:
+        self.items = list(mc_item_rubics.keys())
+        self.tasks = list(max_scores_mc.keys())
+        self.item_index = {item: idx for idx, item in enumerate(self.items)}
+        self.rubrics = np.array([int(ans) for ans in mc_item_rubics.values()])
+
+        # Items belong to the task they start with (see
+        #   `merge_columns_starting_with`)
+        self.task_matrix = np.zeros((len(self.items), len(self.tasks)), dtype=int)
+        for j, task in enumerate(self.tasks):
+            prefix = re.sub("\\.", "", task)
+            for i, item in enumerate(self.items):
+                if item.startswith(prefix):
+                    self.task_matrix[i, j] = 1
+
+        # Tasks without kprim-thresholds keep their summed item scores (see
+        #   `apply_kprim_thresholds`). The threshold rows are padded with inf.
+        thresholds = construct_kprim_thresholds(max_scores_mc)
+        n_thresholds = max([len(thr) for thr in thresholds.values()], default=0)
+        self.thresholds = np.full((len(self.tasks), n_thresholds), np.inf)
+        for j, task in enumerate(self.tasks):
+            thr = thresholds.get(task, [])
+            self.thresholds[j, :len(thr)] = thr
+        self.has_thresholds = np.array([task in thresholds for task in self.tasks])
+
+    def response_matrix(self, responses: list[dict[str, bool]]) -> np.ndarray:
+        """Builds the response matrix (1 / 0 / 99 for missing) of one or more
+        users from dicts mapping item-ids (in either "A5a" or "A5a." format)
+        to responses. Unknown items are ignored.
+
+        Parameters
+        ----------
+        responses : list[dict[str, bool]]
+
+        Returns
+        -------
+        np.ndarray
+            Matrix of shape (n_users, n_items).
+        """
+        X = np.full((len(responses), len(self.items)), 99, dtype=int)
+        for row, responses_ in enumerate(responses):
+            for item, response in responses_.items():
+                idx = self.item_index.get(item)
+                if idx is None:
+                    idx = self.item_index.get(item_dot(item))
+                if idx is not None:
+                    X[row, idx] = int(response)
+        return X
+
+    def score_matrix(self, X: np.ndarray) -> np.ndarray:
+        """Scores a response matrix as built by `response_matrix`.
+
+        Parameters
+        ----------
+        X : np.ndarray
+            Matrix of shape (n_users, n_items).
+
+        Returns
+        -------
+        np.ndarray
+            Task scores of shape (n_users, n_tasks).
+        """
+        item_scores = ((X == self.rubrics) & (X != 99)).astype(int)
+        sums = item_scores @ self.task_matrix
+        levels = (sums[:, :, None] >= self.thresholds[None, :, :]).sum(axis=-1)
+        return np.where(self.has_thresholds, levels, sums)
+
+    def score(self, responses: dict[str, bool]) -> dict[str, int]:
+        """Scores the MC-responses of a single user.
+
+        Parameters
+        ----------
+        responses : dict[str, bool]
+            Maps item-ids to responses.
+
+        Returns
+        -------
+        dict[str, int]
+            Maps the MC-tasks to their scores.
+        """
+        scores = self.score_matrix(self.response_matrix([responses]))[0]
+        return {task: int(score) for task, score in zip(self.tasks, scores)}
+
+
+mc_scorer = MCScorer()
+
+
 
 # Text Cleaning
 # ------------------------------------------------------------------------------
@@ -639,10 +765,7 @@ def replace_abbreviations(s: str) -> str:
     -------
     str
     """
-    repl_tpls = get_abbreviation_replacement_tuples()
-    for abbr, expr in repl_tpls:
-        s = re.sub(abbr, expr, s, flags=re.IGNORECASE)
-    return s
+    return text_normalizer.replace_abbreviations(s)
 
 
 def cleanup_whitespaces(s: str) -> str:
@@ -678,6 +801,244 @@ def remove_empty_aliases(s: str) -> str:
     return s
 
 
+class TextNormalizer:
+    """Text cleaning engine applying `cleanup_whitespaces`, the abbreviation
+    replacements and `remove_empty_aliases`. The abbreviation table is
+    compiled once: A cheap trigger pattern finds the positions where an
+    abbreviation might start (mostly word beginnings) and only the
+    abbreviations starting with the character at hand are tried there, such
+    that each text is processed in a single pass instead of one `re.sub` per
+    abbreviation. At each position the first matching abbreviation of the
+    table wins, as with the sequential replacements.
+
+    The sequential replacements see the results of the previous ones. This
+    matters where a replacement changes the word boundaries of its
+    surroundings (e.g. `a&b` -> `aundb`), so the table is split into separate
+    stages after such abbreviations. Other interactions (a replacement
+    completing another abbreviation, e.g. `z.Bsp..` -> `z.Beispiel` ->
+    `zum Beispiel`, or overlapping abbreviations) can not be told from the
+    table. Texts where replacements come close to each other or to further
+    abbreviations are therefore replaced sequentially (see `_interacting`).
+
+    Parameters
+    ----------
+    repl_tpls : list[tuple[str, str]]=None
+        Regex-replacement tuples. Defaults to
+        `get_abbreviation_replacement_tuples()`.
+    """
+    # Bump when the normalization changes, e.g., if the abbreviation table
+    #   is extended. Normalized texts of older versions are outdated then.
+    version = 2
+
+    # Number of characters around a replacement searched for interactions.
+    #   Must exceed the length of the abbreviations (including lookarounds).
+    interaction_window = 32
+
+    def __init__(self, repl_tpls: list[tuple[str, str]]=None) -> None:
+        if repl_tpls is None:
+            repl_tpls = get_abbreviation_replacement_tuples()
+        self.replacements = [expr for _, expr in repl_tpls]
+        self.fallbacks = 0
+
+        stages: list[list[tuple[int, str]]] = [[]]
+        for idx, (abbr, expr) in enumerate(repl_tpls):
+            stages[-1].append((idx, abbr))
+            if self._joins_words(abbr, expr) and idx < len(repl_tpls) - 1:
+                stages.append([])
+        self.stages = [self._compile_stage(stage) for stage in stages]
+
+    @staticmethod
+    def _first_chars(abbr: str) -> tuple[bool, set[str]]:
+        """Whether the abbreviation regex starts with a word boundary and the
+        (lowercase) characters a match can start with. The characters are
+        `None` if they can not be determined from the regex.
+        """
+        boundary = False
+        prefix = re.match(r"(\\b|\(\?<!?[^)]*\))+", abbr)
+        if prefix is not None:
+            boundary = r"\b" in prefix.group()
+            abbr = abbr[prefix.end():]
+
+        if re.match(r"[^\\\[\](){}.*+?|^$](?![?*]|\{0)", abbr):
+            return boundary, {abbr[0].lower()}
+        char_class = re.match(r"\[([^\]\\^]+)\](?![?*]|\{0)", abbr)
+        if char_class is not None:
+            return boundary, {c.lower() for c in char_class.group(1)}
+        group = re.match(r"\(([^()\\\[\]?]+)\)(?![?*]|\{0)", abbr)
+        if group is not None and "" not in group.group(1).split("|"):
+            return boundary, {a[0].lower() for a in group.group(1).split("|")}
+        return boundary, None
+
+    @classmethod
+    def _joins_words(cls, abbr: str, expr: str) -> bool:
+        """Whether the abbreviation starts with a non-word character but the
+        replacement with a word character, i.e., the replacement removes a
+        word boundary.
+        """
+        _, chars = cls._first_chars(abbr)
+        if chars is None or len(expr) == 0:
+            return False
+        return (
+            all(re.match(r"\W", c) for c in chars)
+            and re.match(r"\w", expr[0]) is not None
+        )
+
+    def _compile_stage(
+        self,
+        stage: list[tuple[int, str]],
+    ) -> tuple[re.Pattern, dict[str, re.Pattern], re.Pattern, list[tuple[re.Pattern, str]]]:
+        """Compiles the trigger pattern, the patterns per first character, the
+        complete alternation (as fallback) and the sequential replacements of
+        a stage.
+        """
+        first_chars = {idx: self._first_chars(abbr) for idx, abbr in stage}
+
+        def alternation(rules: list[tuple[int, str]]) -> re.Pattern:
+            return re.compile(
+                "|".join(f"(?P<a{idx}>{abbr})" for idx, abbr in rules),
+                flags=re.IGNORECASE,
+            )
+        full = alternation(stage)
+
+        chars_boundary, chars_anywhere = set(), set()
+        for boundary, chars in first_chars.values():
+            if chars is not None:
+                (chars_boundary if boundary else chars_anywhere).update(chars)
+        dispatch = {
+            char: alternation([
+                (idx, abbr) for idx, abbr in stage
+                if first_chars[idx][1] is None or char in first_chars[idx][1]
+            ])
+            for char in chars_boundary | chars_anywhere
+        }
+
+        if any(chars is None for _, chars in first_chars.values()):
+            trigger = re.compile(r"(?=[\s\S])")
+        else:
+            def char_class(chars: set[str]) -> str:
+                return "[" + "".join(re.escape(c) for c in sorted(chars)) + "]"
+            alternatives = []
+            if len(chars_boundary) > 0:
+                alternatives.append(rf"\b(?={char_class(chars_boundary)})")
+            if len(chars_anywhere) > 0:
+                alternatives.append(rf"(?={char_class(chars_anywhere)})")
+            trigger = re.compile("|".join(alternatives), flags=re.IGNORECASE)
+        sequential = [
+            (re.compile(abbr, flags=re.IGNORECASE), self.replacements[idx])
+            for idx, abbr in stage
+        ]
+        return trigger, dispatch, full, sequential
+
+    def _interacting(
+        self,
+        s: str,
+        out: str,
+        spans: list[tuple[int, int, int, int, int]],
+        stage: tuple[re.Pattern, dict[str, re.Pattern], re.Pattern, list[tuple[re.Pattern, str]]],
+    ) -> bool:
+        """Whether the single pass might differ from the sequential
+        replacements, i.e., whether two replacements are close to each other,
+        an earlier abbreviation of the table overlaps a replaced one or an
+        abbreviation matches close to a replacement in the output. `spans`
+        holds the start and end of each replacement in `s` and in `out` and
+        the index of its abbreviation.
+        """
+        trigger, dispatch, full, _ = stage
+        window = self.interaction_window
+        for k, (start, end, out_start, out_end, idx) in enumerate(spans):
+            if k > 0 and start - spans[k - 1][1] < window:
+                return True
+            for candidate in trigger.finditer(s, start + 1):
+                pos = candidate.start()
+                if pos >= end:
+                    break
+                match = dispatch.get(s[pos].lower(), full).match(s, pos)
+                if match is not None and int(match.lastgroup[1:]) < idx:
+                    return True
+            for candidate in trigger.finditer(out, max(out_start - window, 0)):
+                pos = candidate.start()
+                if pos >= out_end + window:
+                    break
+                if dispatch.get(out[pos].lower(), full).match(out, pos) is not None:
+                    return True
+        return False
+
+    def _replace_stage(
+        self,
+        s: str,
+        stage: tuple[re.Pattern, dict[str, re.Pattern], re.Pattern, list[tuple[re.Pattern, str]]],
+    ) -> str:
+        trigger, dispatch, full, sequential = stage
+        parts = []
+        spans = []
+        last = 0
+        n_out = 0
+        for candidate in trigger.finditer(s):
+            pos = candidate.start()
+            if pos < last:
+                continue
+            pattern = dispatch.get(s[pos].lower(), full)
+            match = pattern.match(s, pos)
+            if match is None:
+                continue
+            idx = int(match.lastgroup[1:])
+            parts.append(s[last:pos])
+            n_out += pos - last
+            parts.append(self.replacements[idx])
+            spans.append((pos, match.end(), n_out, n_out + len(self.replacements[idx]), idx))
+            n_out += len(self.replacements[idx])
+            last = match.end()
+        if last == 0:
+            return s
+        parts.append(s[last:])
+        out = "".join(parts)
+
+        if self._interacting(s, out, spans, stage):
+            self.fallbacks += 1
+            for abbr, expr in sequential:
+                s = abbr.sub(expr, s)
+            return s
+        return out
+
+    def replace_abbreviations(self, s: str) -> str:
+        """Replaces typically found abbreviations in a text string.
+        """
+        for stage in self.stages:
+            s = self._replace_stage(s, stage)
+        return s
+
+    def normalize(self, s: str) -> str:
+        """Applies the complete cleaning to a text string.
+
+        Parameters
+        ----------
+        s : str
+
+        Returns
+        -------
+        str
+        """
+        s = cleanup_whitespaces(s)
+        s = self.replace_abbreviations(s)
+        s = remove_empty_aliases(s)
+        return s
+
+    def normalize_batch(self, texts: list[str]) -> list[str]:
+        """Applies the complete cleaning to each of the texts.
+
+        Parameters
+        ----------
+        texts : list[str]
+
+        Returns
+        -------
+        list[str]
+        """
+        return [self.normalize(s) for s in texts]
+
+
+text_normalizer = TextNormalizer()
+
 whitespace_remover = np.vectorize(cleanup_whitespaces)
 abbreviations_replacer = np.vectorize(replace_abbreviations)
 empty_aliases_remover = np.vectorize(remove_empty_aliases)
@@ -0,0 +1,173 @@
+import sqlalchemy as sa
+
+import base64
+import threading
+
+from typing import Literal
+
+from ...config import load_env_json
+from .caching import LRUCache
+from .database import db
+from .dbmodels import Response, Responses, ImageResponse
+from .metrics import register_metrics
+
+
+Snapshot = dict[str, dict]
+
+
+class ResponseSnapshots:
+    """A write-through cache of the responses of a users edit, i.e., of
+    compact dicts
+    ```python
+        { item_id: {"view_id": ..., "task_id": ..., "response": ...}, ... }
+    ```
+    (image responses base64-encoded as in `Response.as_dict`). Snapshots get
+    loaded on first access and are updated by the response writes of this
+    process afterwards (see `record`). Writes of other processes (further
+    workers, `rescore.py`, ...) are picked up once the snapshot expires.
+
+    Parameters
+    ----------
+    max_entries : int=1000
+        Maximum number of cached snapshots (user edits).
+    ttl_s : float=30.0
+        Time after which a snapshot gets reloaded, bounding the staleness
+        with respect to writes of other processes. Write-throughs do not
+        extend it.
+    """
+    def __init__(self, max_entries: int=1000, ttl_s: float=30.0) -> None:
+        self.cache = LRUCache(max_entries, ttl_s=ttl_s)
+        # Number of concurrent loads and of the writes during them per edit
+        #   being loaded, such that a snapshot loaded concurrently with a
+        #   write does not get cached (it might miss the write).
+        self._loading: dict[tuple[int, int], list[int]] = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.write_throughs = 0
+
+    def get(self, user_id: int, edit_no: int) -> Snapshot:
+        """The snapshot of a users edit. Must not be modified. Requires an app
+        context.
+        """
+        key = (user_id, edit_no)
+        snapshot = self.cache.get(key)
+        if snapshot is not None:
+            return snapshot
+
+        with self._lock:
+            loading = self._loading.setdefault(key, [0, 0])
+            loading[0] += 1
+            n_writes = loading[1]
+        try:
+            snapshot = {
+                res["item_id"]: {
+                    "view_id": res["view_id"],
+                    "task_id": res["task_id"],
+                    "response": res["response"],
+                }
+                for responses in Responses.user_dicts(user_id, edit_no).values()
+                for res in responses
+            }
+        finally:
+            with self._lock:
+                loading[0] -= 1
+                if loading[0] == 0:
+                    del self._loading[key]
+                if snapshot is not None:
+                    self.loads += 1
+                    if loading[1] == n_writes:
+                        self.cache.put(key, snapshot)
+        return snapshot
+
+    def _count_write(self, key: tuple[int, int]) -> None:
+        """Counts a write for the running loads of the edit, if any. Must be
+        called holding the lock.
+        """
+        loading = self._loading.get(key)
+        if loading is not None:
+            loading[1] += 1
+
+    def apply(
+        self,
+        res_class: type[Response],
+        row: dict,
+        op: Literal["save", "delete"],
+    ) -> None:
+        """Applies a committed response write to the cached snapshot of the
+        edit, if any.
+        """
+        key = (row["user_id"], row["edit_no"])
+        with self._lock:
+            self._count_write(key)
+            snapshot = self.cache.peek(key)
+            if snapshot is None:
+                return
+            # Copy on write, as readers might still iterate the old snapshot
+            snapshot = dict(snapshot)
+            if op == "delete":
+                snapshot.pop(row["item_id"], None)
+            else:
+                response = row["response"]
+                if res_class is ImageResponse:
+                    response = base64.encodebytes(response).decode("utf-8")
+                snapshot[row["item_id"]] = {
+                    "view_id": row["view_id"],
+                    "task_id": row["task_id"],
+                    "response": response,
+                }
+            self.cache.replace(key, snapshot)
+            self.write_throughs += 1
+
+    def record(
+        self,
+        res_class: type[Response],
+        row: dict,
+        op: Literal["save", "delete"],
+    ) -> None:
+        """Records a response write of the current database session. It is
+        applied once the session commits and dropped on rollback.
+        """
+        db.session.info.setdefault("snapshot_writes", []).append((res_class, row, op))
+
+    def invalidate(self, user_id: int, edit_no: int=None) -> None:
+        """Drops the snapshots of a user (edit), e.g., when its responses get
+        deleted.
+        """
+        with self._lock:
+            for key in set(self.cache.keys()) | set(self._loading.keys()):
+                if key[0] == user_id and (edit_no is None or key[1] == edit_no):
+                    self._count_write(key)
+                    self.cache.pop(key)
+
+    def stats(self) -> dict:
+        """Hit/miss counters of the cache and numbers of loaded snapshots and
+        write-throughs.
+
+        Returns
+        -------
+        stats : dict
+        """
+        stats = self.cache.stats()
+        stats["loads"] = self.loads
+        stats["write_throughs"] = self.write_throughs
+        return stats
+
+
+@sa.event.listens_for(sa.orm.Session, "after_commit")
+def _apply_snapshot_writes(session: sa.orm.Session) -> None:
+    for res_class, row, op in session.info.pop("snapshot_writes", []):
+        response_snapshots.apply(res_class, row, op)
+
+
+@sa.event.listens_for(sa.orm.Session, "after_rollback")
+def _drop_snapshot_writes(session: sa.orm.Session) -> None:
+    session.info.pop("snapshot_writes", None)
+
+
+cnfg = load_env_json("./env/config.jsonc")
+
+response_snapshots = ResponseSnapshots(
+    cnfg.get("RESPONSE_SNAPSHOT_CACHE_SIZE", 1000),
+    ttl_s=cnfg.get("RESPONSE_SNAPSHOT_CACHE_TTL_S", 30.0),
+)
+register_metrics("response_snapshots", response_snapshots.stats)
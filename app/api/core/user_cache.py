@@ -0,0 +1,86 @@
+import sqlalchemy as sa
+
+import threading
+
+from ...config import load_env_json
+from .caching import LRUCache
+from .database import db
+from .dbmodels import User
+from .metrics import register_metrics
+
+
+class UserCache:
+    """A read-through cache of the `User` rows looked up by `jwt_auth_core`,
+    such that e.g. autosave bursts do not load the same user again and
+    again. The column values are cached (not the instances, which belong to
+    the session of a single thread) and merged into the current session
+    without a query. Writes to a user must call `invalidate` after
+    committing.
+
+    Parameters
+    ----------
+    max_entries : int=1000
+        Maximum number of cached users.
+    ttl_s : float=30.0
+        Time after which a cached user gets reloaded, bounding the staleness
+        with respect to writes of other processes.
+    """
+    def __init__(self, max_entries: int=1000, ttl_s: float=30.0) -> None:
+        self.cache = LRUCache(max_entries, ttl_s=ttl_s)
+        self._columns = [attr.key for attr in sa.inspect(User).column_attrs]
+        # Number of concurrent loads and of the invalidations during them per
+        #   user being loaded, such that a user loaded concurrently with a
+        #   write does not get cached.
+        self._loading: dict[int, list[int]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, public_id: int) -> User:
+        """The user attached to the current session or `None`, if it does not
+        exist. Requires an app context.
+        """
+        public_id = int(public_id)
+        values = self.cache.get(public_id)
+        if values is None:
+            with self._lock:
+                loading = self._loading.setdefault(public_id, [0, 0])
+                loading[0] += 1
+                n_writes = loading[1]
+            try:
+                user: User = db.session.get(User, public_id)
+                if user is not None:
+                    values = {key: getattr(user, key) for key in self._columns}
+            finally:
+                with self._lock:
+                    loading[0] -= 1
+                    if loading[0] == 0:
+                        del self._loading[public_id]
+                    if values is not None and loading[1] == n_writes:
+                        self.cache.put(public_id, values)
+            return user
+
+        user = User(**values)
+        sa.orm.make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+    def invalidate(self, public_id: int) -> None:
+        """Drops a user from the cache, e.g., after it has been changed or
+        deleted.
+        """
+        public_id = int(public_id)
+        with self._lock:
+            loading = self._loading.get(public_id)
+            if loading is not None:
+                loading[1] += 1
+            self.cache.pop(public_id)
+
+    def stats(self) -> dict:
+        return self.cache.stats()
+
+
+cnfg = load_env_json("./env/config.jsonc")
+
+user_cache = UserCache(
+    cnfg.get("USER_CACHE_SIZE", 1000),
+    ttl_s=cnfg.get("USER_CACHE_TTL_S", 30.0),
+)
+register_metrics("user_cache", user_cache.stats)
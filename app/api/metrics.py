@@ -0,0 +1,23 @@
+from flask import Blueprint, Response
+from flask import jsonify, make_response
+
+from .core.cookies import jwt_required
+from .core.dbmodels import User
+from .core.metrics import collect_metrics
+
+
+metrics_bp = Blueprint("metrics", __name__, template_folder="templates")
+
+
+@metrics_bp.route("/metrics", methods=["GET"])
+@jwt_required
+def metrics(current_user: User) -> Response:
+    """ADMIN-ROUTE: Runtime metrics of the api (model load times, cache
+    statistics, ...).
+    - JWT required, only for admins.
+    - HTTP - Status-Codes: 200, 401, 403, 410
+    """
+    if not current_user.is_admin:
+        return make_response(jsonify({"message": "Only for admins."}), 403)
+    return make_response(jsonify(collect_metrics()), 200)
+
@@ -2,14 +2,19 @@ from flask import Blueprint
 from flask import jsonify, make_response
 
 import pandas as pd
+from sqlalchemy.exc import SQLAlchemyError
+
+import datetime as dt
 
 import app.api.core.qutools as qutools
 
 from .core.cookies import jwt_required
-from .core.database import db
-from .core.dbmodels import Responses, User, Score
-from .core.models import Scorer, Regressor, Clusterer
-from .core.models import get_model_instances
+from .core.database import db, upsert
+from .core.dbmodels import Responses, User, Score, TestEdit, MCResponse, TextResponse
+from .core.models import model_registry, preload_models
+from .core.jobs import JobQueue, DebouncedWorker
+from .core.metrics import register_metrics
+from .core.time import utc_now
 
 from ..config import load_env_json
 
@@ -18,7 +23,20 @@ from ..core.utils import hprint
 
 report_bp = Blueprint("report", __name__, template_folder="templates")
 
-scorer, regressor, clusterer = get_model_instances()
+preload_models()
+
+cnfg = load_env_json("./env/config.jsonc")
+
+scoring_jobs = JobQueue(max_workers=cnfg.get("SCORING_JOB_WORKERS", 2))
+register_metrics("scoring_jobs", scoring_jobs.stats)
+
+speculative_scoring: DebouncedWorker = None
+if cnfg.get("SPECULATIVE_SCORING", False):
+    speculative_scoring = DebouncedWorker(
+        delay_s=cnfg.get("SPECULATIVE_SCORING_DELAY_S", 2.0),
+        cpu_share=cnfg.get("SPECULATIVE_SCORING_CPU_SHARE", 0.25),
+    )
+    register_metrics("speculative_scoring", speculative_scoring.stats)
 
 # A1a.: Der Lehrer wechselt zu schnell von der einfachen Gleichgewichtssituation zu einer dynamischen Bewegungssituation. Dieser Wechsel würde eine strukturiertere Betrachtung der Kräfte erfordern.
 # A1b.1: Es wirkt immer eine Kraft in Bewegunsrichtung
@@ -40,41 +58,184 @@ def user_scores(current_user: User):
 
 
 
-def store_scores(df: pd.DataFrame, user_id: int, edit_no: int) -> None:
+def store_scores(
+    df: pd.DataFrame,
+    user_id: int,
+    edit_no: int,
+    n_responses: dict[str, int]=None,
+    timestamp: dt.datetime=None,
+    provisional: bool=False,
+    revision: int=None,
+) -> None:
     """Stores the scores, passed as a pd.DataFrame in the database.
-    Automatically overwrites existing scores.
+    Automatically overwrites existing scores. All tasks are written with a
+    single upsert-statement and a single commit.
 
     Parameters
     ----------
     df : pd.DataFrame
-        Dataframe containing an ID-column and a column for each questionnaire
-        task.
+        Dataframe containing an ID-column and a column for each (re-) scored
+        questionnaire task.
     user_id : int
         The user-id (User.public_id) of the user, the scores belong to.
+    edit_no : int
+        The edit number of the users edit the scores belong to.
+    n_responses : dict[str, int]=None
+        Number of responses per task the scores have been computed from. See
+        `dirty_tasks`.
+    timestamp : dt.datetime=None
+        Time the scoring has been started at. Responses given afterwards mark
+        the tasks as outdated again. Defaults to the current time.
+    provisional : bool=False
+        Whether the scores stem from speculative scoring.
+    revision : int=None
+        The `TestEdit.revision` read before the scoring has been started.
     """
+    if n_responses is None:
+        n_responses = {}
+    if timestamp is None:
+        timestamp = utc_now()
+    model_version = model_registry.prediction_cache().model_version
+
+    rows = [
+        {
+            "id": f"u{user_id}_tst{edit_no}_tsk{task}",
+            "task_id": task,
+            "user_id": user_id,
+            "edit_no": edit_no,
+            "score": int(df[task].values[0]),
+            "n_responses": n_responses.get(task, 0),
+            "timestamp": timestamp,
+            "provisional": provisional,
+            "model_version": model_version,
+            "revision": revision,
+        }
+        for task in df.drop(columns="ID").columns
+    ]
+    upsert(Score, rows)
+    db.session.commit()
 
-    for task in df.drop(columns="ID").columns:
-        id = f"u{user_id}_tst{edit_no}_tsk{task}"
 
-        old_score: Score = Score.query.filter_by(id=id).first()
-        if old_score:
-            db.session.delete(old_score)
-            db.session.commit()
+def dirty_tasks(
+    user_id: int,
+    edit_no: int,
+    revision: int=None,
+) -> tuple[list[str], dict[str, int]]:
+    """Determines the tasks, whichs responses have changed since they have
+    been scored the last time, i.e., the tasks without score, with responses
+    newer than the score or with a different number of responses (deletions).
+    Text-tasks scored by another scorer model version are outdated as well.
+    If all scores carry the current revision of the edit, the responses are
+    not checked at all.
 
-        score_ = df[task].values[0]
-        score = Score(
-            id=id,
-            task_id=task,
-            user_id=user_id,
-            edit_no=edit_no,
-            score=int(score_),
-        )
-        db.session.add(score)
+    Parameters
+    ----------
+    user_id : int
+        The user-id (User.public_id) of the user.
+    edit_no : int
+        The edit number of the users edit.
+    revision : int=None
+        The current `TestEdit.revision` of the edit.
+
+    Returns
+    -------
+    tuple[list[str], dict[str, int]]
+        The tasks to be (re-) scored and the current number of responses for
+        each of them.
+    """
+    scores: dict[str, Score] = {
+        score.task_id: score
+        for score in Score.query.filter_by(user_id=user_id, edit_no=edit_no).all()
+    }
+    model_version = model_registry.prediction_cache().model_version
+
+    # No responses have been written since all tasks have been scored
+    if revision is not None and all(
+        task in scores and
+        scores[task].revision == revision and
+        (task not in qutools.text_tasks or scores[task].model_version == model_version)
+        for task in qutools.tasks
+    ):
+        return [], {}
+
+    n_responses = {task: 0 for task in qutools.tasks}
+    last_res_times = {}
+    for task_id, (last_res_time, n) in Responses.task_stats(user_id, edit_no).items():
+        task = qutools.score_task(task_id)
+        n_responses[task] += n
+        last_res_times[task] = last_res_time
+
+    tasks = []
+    for task in qutools.tasks:
+        score = scores.get(task)
+        last_res_time = last_res_times.get(task)
+        if (
+            score is None or
+            score.n_responses != n_responses[task] or
+            (last_res_time is not None and last_res_time > score.timestamp) or
+            (task in qutools.text_tasks and score.model_version != model_version)
+        ):
+            tasks.append(task)
+
+    return tasks, {task: n_responses[task] for task in tasks}
+
+
+def get_normalized_texts(user_id: int, edit_no: int, tasks: list[str]) -> pd.DataFrame:
+    """Retrieves the normalized text responses of the passed (scored) tasks.
+    The normalization is stored with the responses; responses normalized with
+    an outdated `TextNormalizer.version` are re-normalized and updated.
 
-    db.session.commit()
+    Parameters
+    ----------
+    user_id : int
+        The user-id (User.public_id) of the user.
+    edit_no : int
+        The edit number of the users edit.
+    tasks : list[str]
+        The (scored) tasks, whose text responses should be retrieved.
+
+    Returns
+    -------
+    pd.DataFrame
+        Dataframe containing an "item" and a "text" column.
+    """
+    normalizer = qutools.text_normalizer
+    responses: list[TextResponse] = [
+        res for res in TextResponse.query.filter_by(user_id=user_id, edit_no=edit_no)
+        if qutools.score_task(res.task_id) in tasks
+    ]
+
+    outdated = [
+        res for res in responses
+        if res.normalizer_version != normalizer.version
+    ]
+    if len(outdated) > 0:
+        normalized = normalizer.normalize_batch([res.response for res in outdated])
+        for res, text in zip(outdated, normalized):
+            res.normalized = text
+            res.normalizer_version = normalizer.version
+
+    df_text = pd.DataFrame(
+        {
+            "item": [res.item_id for res in responses],
+            "text": [res.normalized for res in responses],
+        },
+        columns=["item", "text"],
+    )
+
+    if len(outdated) > 0:
+        try:
+            db.session.commit()
+        except SQLAlchemyError as e:
+            # Responses might have been changed in the meantime. These get
+            #   re-normalized with the next scoring anyways.
+            db.session.rollback()
+            hprint(f"Storing re-normalized text responses failed: {e}")
+
+    return df_text
 
 
-def compute_scores(user_id: int, edit_no: int) -> None:
+def compute_scores(user_id: int, edit_no: int, tasks: list[str]=None) -> pd.DataFrame:
     """Computes the scores for the user belonging to the passed id. Empty
     responses are scored as 0-points. Uses the pck-tooling functionality that
     is part of the api.core modules.
@@ -83,52 +244,50 @@ def compute_scores(user_id: int, edit_no: int) -> None:
     ----------
     user_id : int
         The user-id (User.public_id) of the user, to be scored.
+    edit_no : int
+        The edit number of the users edit to be scored.
+    tasks : list[str]=None
+        The (scored) tasks to compute, e.g., as returned by `dirty_tasks`. Text
+        cleaning and model inference only run for these. If `None` all tasks
+        are computed.
+
+    Returns
+    -------
+    pd.DataFrame
+        Dataframe containing an ID-column and a column for each of the tasks.
     """
-    # Retrieve Responses
-    dfs_res = Responses.user_pandas(user_id, edit_no=edit_no)
+    if tasks is None:
+        tasks = qutools.tasks
 
     # Multiple Choice Items
-    df_mc = dfs_res["mc_responses"]
-    if df_mc.size > 0:
-        # retrieving
-        df_mc = df_mc.rename(columns={"item_id": "item"})
-        df_mc = df_mc[["item", "response"]]
-        df_mc = qutools.item_dots(df_mc, "item")
-        df_mc = qutools.pivot_mc_item_df(df_mc)
-
-        # scoring
-        df_mc = qutools.score_mc_items(df_mc)
-        df_mc = qutools.score_mc_tasks(df_mc)
-        df_mc["ID"] = "id"
-    else:
-        df_mc = qutools.df_mc_zero()
+    #   missing responses score 0, see `qutools.MCScorer`
+    mc_responses = {
+        res.item_id: res.response
+        for res in MCResponse.query.filter_by(user_id=user_id, edit_no=edit_no)
+    }
+    mc_scores = qutools.mc_scorer.score(mc_responses)
+    df_mc = pd.DataFrame([{"ID": "id", **mc_scores}])
 
     # Text Items
-    df_text = dfs_res["text_responses"]
+    #   only the requested tasks get scored; the texts are already cleaned
+    df_text = get_normalized_texts(user_id, edit_no, tasks)
+
     if df_text.size > 0:
         # retrieving
-        df_text = df_text.rename(columns={"item_id": "item", "response": "text"})
-        df_text = df_text[["item", "text"]]
         df_text = qutools.item_dots(df_text, "item")
 
-        # cleaning
-        df_text["text"] = df_text["text"].map(qutools.whitespace_remover)
-        df_text["text"] = df_text["text"].map(qutools.abbreviations_replacer)
-        df_text["text"] = df_text["text"].map(qutools.empty_aliases_remover)
-
         # preprocessing
         df_text = qutools.pivot_text_item_df(df_text)
         df_text = qutools.concat_taskwise(df_text)
         df_text = qutools.melt_tasks(df_text)
         df_text = qutools.drop_empty(df_text)
+
+    if df_text.size > 0:
         df_text = qutools.add_item_names(df_text)
 
         # scoring
-        if scorer is None:
-            adhoc_scorer = Scorer()
-            pred_scores = adhoc_scorer.predict(df_text["text"].to_list())
-        else:
-            pred_scores = scorer.predict(df_text["text"].to_list())
+        prediction_cache = model_registry.prediction_cache()
+        pred_scores = prediction_cache.predict(df_text["text"].to_list())
         df_text["predicted_scores"] = pred_scores
         df_text["ID"] = "id"
 
@@ -139,47 +298,167 @@ def compute_scores(user_id: int, edit_no: int) -> None:
 
     # Combine MC and Text Scores
     df = qutools.combinde_text_mc_cols(df_tscores, df_mc, merge_on="ID")
+    df = df[["ID"] + list(tasks)]
 
     return df
 
 
 
 
+def run_scoring(user_id: int, edit_no: int) -> str:
+    """Runs the scoring of a users edit, i.e., computes and stores the scores
+    of all tasks with changed responses. Is run as a background job by
+    `generate_report_data`.
+
+    Parameters
+    ----------
+    user_id : int
+        The user-id (User.public_id) of the user, to be scored.
+    edit_no : int
+        The edit number of the users edit to be scored.
+
+    Returns
+    -------
+    message : str
+    """
+    # Only tasks with changed responses get rescored
+    if Responses.journal is not None:
+        Responses.journal.flush()
+    scoring_time = utc_now()
+    revision = TestEdit.get_revision(user_id, edit_no)
+    tasks, n_responses = dirty_tasks(user_id, edit_no, revision)
+
+    no_responses = (
+        sum(n_responses.values()) == 0 and
+        Score.query.filter_by(user_id=user_id, edit_no=edit_no).first() is None
+    )
+
+    scored = len(tasks) > 0 and not no_responses
+    if scored:
+        df = compute_scores(user_id, edit_no=edit_no, tasks=tasks)
+        store_scores(df, user_id, edit_no, n_responses, scoring_time, revision=revision)
+
+    # Up to date speculative scores become part of the report, and all
+    #   scores are up to date with the revision read above.
+    confirmed = [
+        task for (task,) in Score.query
+        .with_entities(Score.task_id)
+        .filter_by(user_id=user_id, edit_no=edit_no, provisional=True)
+        .all()
+    ]
+    Score.query.filter_by(
+        user_id=user_id,
+        edit_no=edit_no,
+    ).update({"provisional": False, "revision": revision})
+    db.session.commit()
+
+    if not scored and len(confirmed) == 0:
+        return "No responses / Old report is still up to date."
+    recomputed = tasks if scored else []
+    return (
+        f"Scoring finished: {len(recomputed)} task(s) recomputed, "
+        f"{len(confirmed)} speculative score(s) confirmed."
+    )
+
+
+def run_speculative_scoring(user_id: int, edit_no: int, task: str) -> str:
+    """Scores a single task of a users edit in the background, storing it as a
+    provisional score. Does not run concurrently with a scoring job of the
+    same edit.
+
+    Parameters
+    ----------
+    user_id : int
+        The user-id (User.public_id) of the user, to be scored.
+    edit_no : int
+        The edit number of the users edit to be scored.
+    task : str
+        The (scored) task, e.g. "A18.".
+
+    Returns
+    -------
+    message : str
+    """
+    with scoring_jobs.key_lock((user_id, edit_no)):
+        if Responses.journal is not None:
+            Responses.journal.flush()
+        scoring_time = utc_now()
+        revision = TestEdit.get_revision(user_id, edit_no)
+        tasks, n_responses = dirty_tasks(user_id, edit_no, revision)
+        if task not in tasks:
+            return "Score is still up to date."
+
+        df = compute_scores(user_id, edit_no=edit_no, tasks=[task])
+        store_scores(df, user_id, edit_no, n_responses, scoring_time, provisional=True, revision=revision)
+    return "Speculative scoring finished."
+
+
+def schedule_speculative_scoring(user_id: int, edit_no: int, task_id: str) -> None:
+    """Schedules the speculative scoring of the task a response has been saved
+    for, if `SPECULATIVE_SCORING` is enabled.
+
+    Parameters
+    ----------
+    user_id : int
+        The user-id (User.public_id) of the user.
+    edit_no : int
+        The edit number of the users edit.
+    task_id : str
+        The task-id as used in the response tables, e.g. "A18b".
+    """
+    if speculative_scoring is None:
+        return
+    task = qutools.score_task(task_id)
+    if task not in qutools.tasks:
+        return
+    speculative_scoring.schedule(
+        (user_id, edit_no, task),
+        run_speculative_scoring, user_id, edit_no, task,
+    )
+
+
 @report_bp.route("/generate_report_data", methods=["GET", "POST"])
 @jwt_required
 def generate_report_data(current_user: User):
     """Prompts the generation of the report data for the current_user, i.e.,
-    kicks of the scoring
-    - HTTP - Status-Codes: 401, 403, 410, 200
+    queues a scoring job and returns its id right away. The job status can be
+    polled via `report_job`. A scoring job already queued for the same edit
+    is reused.
+    - HTTP - Status-Codes: 401, 403, 410, 202
     """
     user_id = current_user.public_id
     edit_no = current_user.active_edit_no
 
-    # Check last response time
-    last_response_time = Responses.get_last_response_time(user_id, edit_no)
-
-    # Check last report time
-    last_report_time = Score.get_last_report_time(user_id, edit_no)
+    job = scoring_jobs.submit((user_id, edit_no), user_id, run_scoring, user_id, edit_no)
 
-    no_report = last_report_time is None
-    responses_avalable = last_response_time is not None
-    if not no_report and responses_avalable:
-        report_outdated = last_response_time > last_report_time
+    return make_response(
+        jsonify({
+            'message': "Scoring job queued.",
+            'job_id': job.id,
+            'status': job.status,
+        }),
+        202,
+    )
 
-    if responses_avalable and (no_report or report_outdated):
-        df = compute_scores(user_id, edit_no=edit_no)
-        store_scores(df, user_id, edit_no)
 
+@report_bp.route("/report_job/<job_id>", methods=["GET"])
+@jwt_required
+def report_job(current_user: User, job_id: str):
+    """Status of a scoring job queued by `generate_report_data`, i.e., one of
+    "queued", "running", "done" and "failed".
+    - HTTP - Status-Codes: 401, 403, 404, 410, 200
+    """
+    job = scoring_jobs.get(job_id)
+    if job is None or job.user_id != current_user.public_id:
         return make_response(
-            jsonify( {'message': "Scoring finished."} ),
-            201,
+            jsonify({'message': "No such scoring job."}),
+            404,
         )
 
-    else:
-        return make_response(
-            jsonify( {'message': "No responses / Old report is still up to date."} ),
-            201,
-        )
+    return make_response(
+        jsonify(job.as_dict()),
+        200,
+    )
 
 
 @report_bp.route("/report", methods=["GET"])
@@ -213,20 +492,10 @@ def report_(current_user: User):
     df = Score.user_pandas(user_id, edit_no)
     X = df.values
 
-    if regressor is None:
-        cnfg = load_env_json("./env/config.jsonc")
-        regressor_mode = cnfg.get("DIMSCORES_MODE", "regression")
-        adhoc_regressor = Regressor(regressor_mode)
-        df_dimscores = adhoc_regressor.dimscores(X)
-    else:
-        df_dimscores = regressor.dimscores(X)
+    df_dimscores = model_registry.regressor().dimscores(X)
     df_dimscores = qutools.append_dimscore_infos(df_dimscores)
 
-    if clusterer is None:
-        adhoc_clusterer = Clusterer()
-        clst = adhoc_clusterer.predict(X)
-    else:
-        clst = clusterer.predict(X)
+    clst = model_registry.clusterer().predict(X)
 
     data = {
         "df_scores": df.to_json(),
@@ -10,15 +10,21 @@ from io import BytesIO
 
 from pathlib import Path
 
-from .core.database import db
+from .core import qutools
+from .core.database import db, upsert
 from .core.dbmodels import (
+    Response,
     Responses,
     TextResponse,
     MCResponse,
     ImageResponse,
     User,
+    ViewProgress,
 )
 from .core.cookies import jwt_required, cconsent_required
+from .core.snapshots import response_snapshots
+from .core.time import utc_now
+from .report import schedule_speculative_scoring
 
 from ..core.utils import hprint
 
@@ -26,58 +32,126 @@ from ..core.utils import hprint
 response_bp = Blueprint("response", __name__, template_folder="templates")
 
 
+def response_row(
+    response: str|bool|bytes,
+    current_user: User,
+    view_id: str,
+    task_id: str,
+    item_id: str,
+) -> dict:
+    """The columns of a response of the current users active edit, as written
+    by `save_response`.
+    """
+    return {
+        "id": f"u{current_user.public_id}_tst{current_user.active_edit_no}_i{item_id}",
+        "item_id": item_id,
+        "task_id": task_id,
+        "view_id": view_id,
+        "user_id": current_user.public_id,
+        "edit_no": current_user.active_edit_no,
+        "response": response,
+        "timestamp": utc_now(),
+    }
+
+
+def save_response(
+    res_class: type[Response],
+    row: dict,
+    only_changed: list[str]=None,
+) -> int:
+    """Inserts or overwrites a response with a single statement. Does not
+    commit; the cached response snapshot of the edit gets updated on commit.
+
+    Parameters
+    ----------
+    res_class : type[Response]
+        The response class (table).
+    row : dict
+        The response, e.g., as returned by `response_row`.
+    only_changed : list[str]=None
+        Columns an existing response is only overwritten for if they change,
+        see `database.upsert`.
+
+    Returns
+    -------
+    n_written : int
+        1 if the response has been written, 0 if it was unchanged.
+    """
+    n_written = upsert(res_class, [row], only_changed=only_changed)
+    response_snapshots.record(res_class, row, "save")
+    ViewProgress.touch(row["user_id"], row["edit_no"], row["view_id"])
+    return n_written
+
+
+def delete_response(res_class: type[Response], row: dict) -> int:
+    """Deletes a response with a single statement. Does not commit; the
+    cached response snapshot of the edit gets updated on commit.
+
+    Parameters
+    ----------
+    res_class : type[Response]
+        The response class (table).
+    row : dict
+        The response, e.g., as returned by `response_row`.
+
+    Returns
+    -------
+    n_deleted : int
+        1 if the response existed, 0 otherwise.
+    """
+    result = db.session.execute(
+        delete(res_class)
+        .where(res_class.id == row["id"])
+    )
+    response_snapshots.record(res_class, row, "delete")
+    ViewProgress.touch(row["user_id"], row["edit_no"], row["view_id"])
+    return result.rowcount
+
+
 def process_open_response(
     response: str,
     current_user: User,
     view_id: str,
     task_id: str,
     item_id: str,
+    commit: bool=True,
 ):
     response = response.strip()
     response_is_empty = response == ""
 
-    unique_id = f"u{current_user.public_id}_tst{current_user.active_edit_no}_i{item_id}"
-    old_response: TextResponse = TextResponse.query.filter_by(id=unique_id).first()
+    row = response_row(response, current_user, view_id, task_id, item_id)
+    unique_id = row["id"]
 
-    if old_response and (response_is_empty or request.method == "DELETE"):
+    if response_is_empty or request.method == "DELETE":
         try:
-            db.session.delete(old_response)
-            db.session.commit()
-            return make_response(
-                jsonify({'message': f"Response {unique_id} deleted"}),
-                200,
-            )
+            n_deleted = delete_response(TextResponse, row)
+            if commit:
+                db.session.commit()
         except Exception as e:
+            db.session.rollback()
             return make_response(
                 jsonify( {'message': f"There was an error deleting response {unique_id}: {e}"} ),
                 500,
             )
-
-    if old_response:
-        hprint(f"/response: ID already exists, updating entry {unique_id}.")
-        db.session.delete(old_response)
-        db.session.commit()
+        if n_deleted > 0:
+            return make_response(
+                jsonify({'message': f"Response {unique_id} deleted"}),
+                200,
+            )
 
     if not response_is_empty:
-        new_response = TextResponse(
-            id=unique_id,
-            item_id=item_id,
-            task_id=task_id,
-            view_id=view_id,
-            user_id=current_user.public_id,
-            edit_no=current_user.active_edit_no,
-            response=response,
-        )
+        row["normalized"] = qutools.text_normalizer.normalize(response)
+        row["normalizer_version"] = qutools.text_normalizer.version
         try:
-            db.session.add(new_response)
-            db.session.flush()
-            db.session.commit()
-            print("success")
+            save_response(TextResponse, row)
+            if commit:
+                db.session.commit()
             return make_response(
                 jsonify({'message': f"Response {unique_id} added"}),
                 200,
             )
         except Exception as e:
+            db.session.rollback()
             return make_response(
                 jsonify( { 'message': f"There was an error adding response {unique_id}: {e}"} ),
                 500,
@@ -96,45 +170,33 @@ def process_mc_response(
     view_id: str,
     task_id: str,
     item_id: str,
+    commit: bool=True,
 ):
+    row = response_row(response, current_user, view_id, task_id, item_id)
+    unique_id = row["id"]
 
-    unique_id = f"u{current_user.public_id}_tst{current_user.active_edit_no}_i{item_id}"
-    old_response: MCResponse = MCResponse.query.filter_by(id=unique_id).first()
-
-    if old_response:
-        db.session.delete(old_response)
-
-        if old_response.response == response:
-            try:
-                db.session.commit()
-                return make_response(
-                    jsonify( {'message': f"Deleted response {unique_id}"} ),
-                    200,
-                )
-            except Exception as e:
-                return make_response(
-                    jsonify( {'message': f"There was an error deleting response {unique_id}: {e}"} ),
-                    500,
-                )
-
-    new_response = MCResponse(
-        id=unique_id,
-        item_id=item_id,
-        task_id=task_id,
-        view_id=view_id,
-        user_id=current_user.public_id,
-        edit_no=current_user.active_edit_no,
-        response=response,
-    )
     try:
-        db.session.add(new_response)
-        db.session.commit()
+        # Passing the same response again deletes it (unchecking the box).
+        #   Saving only writes if the response changes, such that this is
+        #   only a second statement in that case.
+        n_written = save_response(MCResponse, row, only_changed=["response"])
+        if n_written == 0:
+            delete_response(MCResponse, row)
+        if commit:
+            db.session.commit()
     except Exception as e:
+        db.session.rollback()
         return make_response(
             jsonify( {'message': f"There was an error updating response {unique_id}: {e}"} ),
             500,
         )
 
+    if n_written == 0:
+        return make_response(
+            jsonify( {'message': f"Deleted response {unique_id}"} ),
+            200,
+        )
+
     return make_response(
         jsonify({'message': f"Updated response {unique_id}"}),
         200,
@@ -147,14 +209,15 @@ def process_image_response(
         view_id: str,
         task_id: str,
         item_id: str,
+        commit: bool=True,
     ):
 
-    unique_id = f"u{current_user.public_id}_tst{current_user.active_edit_no}_i{item_id}"
-    old_response: ImageResponse = ImageResponse.query.filter_by(id=unique_id).first()
-
     response = response.removeprefix("data:image/png;base64,")
     response = base64.decodebytes(str.encode(response))
 
+    row = response_row(response, current_user, view_id, task_id, item_id)
+    unique_id = row["id"]
+
     image_array = np.array(Image.open(BytesIO(response)))
     response_is_empty = np.mean(image_array) == 0
 
@@ -172,42 +235,34 @@ def process_image_response(
             pass
 
 
-    if old_response and (response_is_empty or request.method == "DELETE"):
+    if response_is_empty or request.method == "DELETE":
         try:
-            db.session.delete(old_response)
-            db.session.commit()
-            return make_response(
-                jsonify({'message': f"Response {unique_id} deleted"}),
-                200,
-            )
+            n_deleted = delete_response(ImageResponse, row)
+            if commit:
+                db.session.commit()
         except Exception as e:
+            db.session.rollback()
             return make_response(
                 jsonify( {'message': f"There was an error deleting response {unique_id}: {e}"} ),
                 500,
             )
-
-    if old_response:
-        hprint(f"/response: ID already exists, updating entry {unique_id}.")
-        db.session.delete(old_response)
+        if n_deleted > 0:
+            return make_response(
+                jsonify({'message': f"Response {unique_id} deleted"}),
+                200,
+            )
 
     if not response_is_empty:
-        new_response = ImageResponse(
-            id=unique_id,
-            item_id=item_id,
-            task_id=task_id,
-            view_id=view_id,
-            user_id=current_user.public_id,
-            edit_no=current_user.active_edit_no,
-            response=response,
-        )
         try:
-            db.session.add(new_response)
-            db.session.commit()
+            save_response(ImageResponse, row)
+            if commit:
+                db.session.commit()
             return make_response(
                 jsonify({'message': f"Response {unique_id} added"}),
                 200,
             )
         except Exception as e:
+            db.session.rollback()
             return make_response(
                 jsonify( {'message': f"There was an error adding response {unique_id}: {e}"} ),
                 500,
@@ -221,6 +276,86 @@ def process_image_response(
 
 
 
+def journal_response(
+    response: str|bool,
+    item_type: str,
+    current_user: User,
+    view_id: str,
+    task_id: str,
+    item_id: str,
+):
+    """Write-behind counterpart of `process_open_response` and
+    `process_mc_response`: the response is only appended to the write-behind
+    journal (see `Responses.journal`) and written to the database by its
+    flusher.
+    """
+    if item_type == "text":
+        res_class = TextResponse
+        response = response.strip()
+        row = response_row(response, current_user, view_id, task_id, item_id)
+        if response == "" or request.method == "DELETE":
+            op, message = "delete", f"Response {row['id']} deleted"
+        else:
+            row["normalized"] = qutools.text_normalizer.normalize(response)
+            row["normalizer_version"] = qutools.text_normalizer.version
+            op, message = "save", f"Response {row['id']} added"
+    else:
+        res_class = MCResponse
+        row = response_row(response, current_user, view_id, task_id, item_id)
+        # Passing the same response again deletes it, see `process_mc_response`
+        entry = Responses.journal.get(MCResponse, row["id"])
+        if entry is not None:
+            current = entry["row"]["response"] if entry["op"] == "save" else None
+        else:
+            old_response: MCResponse = db.session.get(MCResponse, row["id"])
+            current = old_response.response if old_response is not None else None
+        if current == response:
+            op, message = "delete", f"Deleted response {row['id']}"
+        else:
+            op, message = "save", f"Updated response {row['id']}"
+
+    try:
+        Responses.journal.append(res_class, row, op)
+        response_snapshots.apply(res_class, row, op)
+    except OSError as e:
+        return make_response(
+            jsonify( {'message': f"There was an error journaling response {row['id']}: {e}"} ),
+            500,
+        )
+    return make_response(
+        jsonify({'message': message}),
+        200,
+    )
+
+
+def process_response(
+    response: str|bool,
+    item_type: str,
+    current_user: User,
+    view_id: str,
+    task_id: str,
+    item_id: str,
+    commit: bool=True,
+):
+    """Saves (or deletes) a single response of the current users active edit,
+    dispatching to the processor of the item type. With `commit=False` the
+    changes are left to be committed by the caller. Text- and MC-responses go
+    through the write-behind journal instead, if it is enabled.
+    """
+    if Responses.journal is not None and item_type in ["text", "mc"]:
+        return journal_response(response, item_type, current_user, view_id, task_id, item_id)
+    if item_type == "text":
+        return process_open_response(response, current_user, view_id, task_id, item_id, commit)
+    if item_type == "mc":
+        return process_mc_response(response, current_user, view_id, task_id, item_id, commit)
+    if item_type == "image":
+        return process_image_response(response, current_user, view_id, task_id, item_id, commit)
+    return make_response(
+        jsonify( {'message': "The item type passed is undefined; it must be `text`, `mc` or `image`."} ),
+        422,
+    )
+
+
 @response_bp.route("/response/<view_id>/<task_id>/<item_id>", methods=["POST", "DELETE"])
 @jwt_required
 @cconsent_required
@@ -229,31 +364,96 @@ def response_(current_user: User, view_id: str, task_id: str, item_id: str):
     item_type = data["item_type"]
     response = data["response"]
 
-    if item_type == "text":
-        return process_open_response(response, current_user, view_id, task_id, item_id)
-
-    elif item_type == "mc":
-        return process_mc_response(response, current_user, view_id, task_id, item_id)
-
-    elif item_type == "image":
-        return process_image_response(response, current_user, view_id, task_id, item_id)
-
-    else:
-        return make_response(
-            jsonify( {'message': "The item type passed is undefined; it must be `text` or `mc`."} ),
-            422,
+    resp = process_response(response, item_type, current_user, view_id, task_id, item_id)
+    if item_type in ["text", "mc"] and resp.status_code == 200:
+        schedule_speculative_scoring(
+            current_user.public_id,
+            current_user.active_edit_no,
+            task_id,
         )
+    return resp
 
 
 @response_bp.route("/response_json", methods=["POST", "DELETE"])
 @jwt_required
 @cconsent_required
 def response_json(current_user: User):
-    data = request.get_json()
-    item_id  = data["item_id"]
-    task_id  = data["task_id"]
-    view_id  = data["view_id"]
-    response_(current_user, view_id, task_id, item_id)
+    """Saves a batch of responses of the current user in a single transaction.
+    Expects a json-body
+    ```python
+        { "responses": [
+            { "view_id": ..., "task_id": ..., "item_id": ...,
+              "item_type": ..., "response": ... },
+            ...
+        ] }
+    ```
+    (or a single response object). The responses are applied in order, i.e.,
+    repeated MC-responses toggle the same way as with `response_`. If any of
+    the responses can not be saved, none of them is (journaled responses, see
+    `journal_response`, are only checked for their item type).
+    The body is parsed regardless of the content type, as `navigator.sendBeacon`
+    can not set it.
+    - HTTP - Status-Codes: 400, 401, 403, 410, 412, 422, 500, 200
+    """
+    data = request.get_json(force=True, silent=True)
+    if isinstance(data, dict):
+        data = data.get("responses", [data])
+
+    keys = ["view_id", "task_id", "item_id", "item_type", "response"]
+    if (
+        not isinstance(data, list) or
+        any(not isinstance(res, dict) or any(key not in res for key in keys) for res in data)
+    ):
+        return make_response(
+            jsonify( {'message': f"Expected a list of responses with the keys {keys}."} ),
+            400,
+        )
+    if any(res["item_type"] not in ["text", "mc", "image"] for res in data):
+        return make_response(
+            jsonify( {'message': "The item type passed is undefined; it must be `text`, `mc` or `image`."} ),
+            422,
+        )
+
+    messages = []
+    for res in data:
+        resp = process_response(
+            res["response"],
+            res["item_type"],
+            current_user,
+            res["view_id"],
+            res["task_id"],
+            res["item_id"],
+            commit=False,
+        )
+        if resp.status_code != 200:
+            db.session.rollback()
+            return make_response(
+                jsonify( {'message': f"No response has been saved, response {res['item_id']} failed: {resp.get_json()['message']}"} ),
+                resp.status_code,
+            )
+        messages.append(resp.get_json()["message"])
+
+    try:
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return make_response(
+            jsonify( {'message': f"There was an error saving the responses: {e}"} ),
+            500,
+        )
+
+    scored_task_ids = [res["task_id"] for res in data if res["item_type"] in ["text", "mc"]]
+    for task_id in dict.fromkeys(scored_task_ids):
+        schedule_speculative_scoring(
+            current_user.public_id,
+            current_user.active_edit_no,
+            task_id,
+        )
+
+    return make_response(
+        jsonify({'message': f"{len(data)} responses saved", 'responses': messages}),
+        200,
+    )
 
 
 @response_bp.route("/user_responses", methods=["GET"])
@@ -266,6 +466,35 @@ def user_responses(current_user: User):
     )
 
 
+@response_bp.route("/user_response_snapshot", methods=["GET"])
+@jwt_required
+def user_response_snapshot(current_user: User):
+    """The responses of the current users active edit as a compact dict
+    `{item_id: {"view_id": ..., "task_id": ..., "response": ...}}`, served
+    from the response snapshot cache.
+    - HTTP - Status-Codes: 401, 403, 410, 200
+    """
+    snapshot = response_snapshots.get(current_user.public_id, current_user.active_edit_no)
+    return make_response(
+        jsonify(snapshot),
+        200,
+    )
+
+
+@response_bp.route("/user_progress", methods=["GET"])
+@jwt_required
+def user_progress(current_user: User):
+    """The number of responses per view of the current users active edit as a
+    dict `{view_id: n_responses}` (see `ViewProgress`).
+    - HTTP - Status-Codes: 401, 403, 410, 200
+    """
+    progress = ViewProgress.user_progress(current_user.public_id, current_user.active_edit_no)
+    return make_response(
+        jsonify(progress),
+        200,
+    )
+
+
 
 
 
@@ -5,8 +5,10 @@ from flask import current_app, request
 from sqlalchemy import text
 
 from .core.database import db
-from .core.dbmodels import User, TestEdit, Responses, Score
+from .core.dbmodels import User, TestEdit, Responses, Score, ViewProgress
 from .core.cookies import jwt_required
+from .core.snapshots import response_snapshots
+from .core.user_cache import user_cache
 
 
 test_edits_bp = Blueprint("test_edits", __name__, template_folder="templates")
@@ -64,11 +66,13 @@ def delete_test_edit(current_user: User, edit_no: str):
         }), 403)
 
     # Delete connected data
+    Responses.discard_journaled(public_id, edit_no)
     _ = [
         response_class.query.filter_by(user_id=public_id, edit_no=edit_no).delete()
         for response_class in Responses.res_classes
     ]
     _ = Score.query.filter_by(user_id=public_id, edit_no=edit_no).delete()
+    ViewProgress.delete_edits(public_id, edit_no)
 
     # Get edit name
     te: TestEdit = TestEdit.query.filter_by(user_id=public_id, edit_no=edit_no).first()
@@ -82,6 +86,8 @@ def delete_test_edit(current_user: User, edit_no: str):
         current_user.active_edit_no = 0
 
     db.session.commit()
+    response_snapshots.invalidate(public_id, edit_no)
+    user_cache.invalidate(public_id)
 
     return make_response(jsonify({
         "message": f"Deleted test-edit 'u{public_id}_t{edit_no}' ({edit_name})",
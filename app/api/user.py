@@ -3,8 +3,10 @@ from flask import jsonify, make_response
 from flask import current_app
 
 from .core.database import db
-from .core.dbmodels import User, TestEdit, Responses, Score, Reset
-from .core.cookies import jwt_required
+from .core.dbmodels import User, TestEdit, Responses, Score, Reset, ViewProgress
+from .core.cookies import jwt_required, reset_auth_context, verified_tokens
+from .core.snapshots import response_snapshots
+from .core.user_cache import user_cache
 
 from ..core.utils import hprint
 
@@ -92,6 +94,7 @@ def delete(current_user: User, public_id: str):
         )
 
     # Delete connected data
+    Responses.discard_journaled(user.public_id)
     _ = [
         response_class.query.filter_by(user_id=public_id).delete()
         for response_class in Responses.res_classes
@@ -99,9 +102,15 @@ def delete(current_user: User, public_id: str):
     _ = TestEdit.query.filter_by(user_id=public_id).delete()
     _ = Score.query.filter_by(user_id=public_id).delete()
     _ = Reset.query.filter_by(user_id=public_id).delete()
+    ViewProgress.delete_edits(user.public_id)
 
+    user_id = user.public_id
     db.session.delete(user)
     db.session.commit()
+    response_snapshots.invalidate(user_id)
+    verified_tokens.forget_user(user_id)
+    user_cache.invalidate(user_id)
+    reset_auth_context()
 
     return make_response(
         jsonify({"message": f"Deleted user {user.username}."}),
@@ -137,8 +146,10 @@ def set_active_edit_no(current_user: User, edit_no: int):
     - JWT required for authentication.
     - HTTP - Status-Codes: 200, 401, 403, 410, 412
     """
+    public_id = current_user.public_id
     current_user.active_edit_no = edit_no
     db.session.commit()
+    user_cache.invalidate(public_id)
 
     data = user_info()
     data = data.get_json()
@@ -6,6 +6,7 @@ from .config import ConsentCookieSession
 from .config import set_config_from_json, register_blueprint_list, print_status
 
 from .api.core.database import db
+from .api.core.journal import init_response_journal
 from .api import blueprints as backend_blueprints
 
 from .interface import blueprints as frontend_blueprints
@@ -13,7 +14,24 @@ from .interface import blueprints as frontend_blueprints
 from .test import create_admin, create_testuser, test_responses
 
 
-def create_app() -> Flask:
+def create_app(init_db: bool=True, config: dict=None, journal: bool=True) -> Flask:
+    """Creates the app.
+
+    Parameters
+    ----------
+    init_db : bool=True
+        Whether to (re-) initialize the database, i.e., drop all tables and
+        set up the admin, the testusers and their responses. Must be `False`
+        for tools working on an existing database (see `rescore.py`).
+    config : dict=None
+        Overrides of the json-config, e.g., a throwaway database (see
+        `bench.py`).
+    journal : bool=True
+        Whether to start the write-behind response journal (if enabled in the
+        config) of this process. Must be `False` for tools running besides the
+        app (see `rescore.py`, `bench.py`), which write to the database
+        directly.
+    """
     app = Flask(
         __name__,
         template_folder="./interface/templates",
@@ -24,6 +42,8 @@ def create_app() -> Flask:
 
     set_config_from_json(app, "./env/config.jsonc")
     set_config_from_json(app, "./env/secret_config.jsonc")
+    if config is not None:
+        app.config.update(config)
 
     register_blueprint_list(app, backend_blueprints, "/api")
     register_blueprint_list(app, frontend_blueprints)
@@ -31,13 +51,17 @@ def create_app() -> Flask:
 
     db.init_app(app)
 
-    with app.app_context():
-        db.drop_all()
-        db.create_all()
-        create_admin(db)
-        create_testuser(db)
-        create_testuser(db, "testmail", app.config["TEST_RECIEVER_ADDRESS"])
-        test_responses(db)
+    if init_db:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            create_admin(db)
+            create_testuser(db)
+            create_testuser(db, "testmail", app.config["TEST_RECIEVER_ADDRESS"])
+            test_responses(db)
+
+    if journal:
+        init_response_journal(app)
 
     return app
 
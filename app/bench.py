@@ -0,0 +1,530 @@
+from flask import Flask
+from flask.testing import FlaskClient
+
+import requests
+
+import numpy as np
+import pandas as pd
+import sqlalchemy as sa
+
+import argparse
+import json
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from typing import Iterator
+
+from .app import create_app
+
+from .api.core import qutools
+from .api.core.batching import ScoringQueue
+from .api.core.database import db, count_queries
+from .api.core.dbmodels import User, TextResponse
+from .api.core.models import model_registry
+from .api.core.snapshots import ResponseSnapshots
+from .api.report import store_scores
+
+from .compare_backends import reference_texts
+
+from .core.data import questionnaire
+
+from .interface.core.api import http_session
+
+
+# Benchmarks and regression checks of the hot paths, run on a throwaway
+#   database (the configured database is not touched). Run with
+#   "python bench.py --help".
+
+
+class Checks:
+    """Collects the failed checks of a benchmark run.
+    """
+    def __init__(self) -> None:
+        self.failed: list[str] = []
+
+    def __call__(self, condition: bool, message: str) -> None:
+        print(f"  [{'ok' if condition else 'FAILED'}] {message}")
+        if not condition:
+            self.failed.append(message)
+
+
+@contextmanager
+def bench_app() -> Iterator[Flask]:
+    """An app on a fresh, temporary sqlite-database with the testusers.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = Path(tmp_dir) / "bench.sqlite"
+        app = create_app(config={"SQLALCHEMY_DATABASE_URI": f"sqlite:///{db_path}"}, journal=False)
+        try:
+            yield app
+        finally:
+            with app.app_context():
+                db.session.remove()
+                db.engine.dispose()
+
+
+def login(app: Flask, username: str="test", password: str="test") -> FlaskClient:
+    """A test client with the JWT- and consent-cookies of the user.
+    """
+    client = app.test_client()
+    client.set_cookie("x-consent", "1")
+    res = client.post("/api/login", auth=(username, password))
+    if res.status_code != 200:
+        raise RuntimeError(f"Login of {username} failed with {res.status_code}.")
+    return client
+
+
+def response_batch(n_items: int) -> list[dict]:
+    """A batch of text- and MC-responses as expected by `/api/response_json`.
+    """
+    return [
+        {
+            "view_id": view.id,
+            "task_id": task.id,
+            "item_id": item.id,
+            "item_type": task.task_type,
+            "response": "Eine Antwort." if task.task_type == "text" else True,
+        }
+        for view in questionnaire.views
+        for task in view.tasks
+        for item in task.items
+        if task.task_type in ["text", "mc"]
+    ][:n_items]
+
+
+def bench_saves(checks: Checks, n_items: int=20) -> None:
+    """Number of statements and commits of the report- and the batched
+    response-writes, which must not grow with the number of tasks or grow at
+    most linearly with the number of responses (single commit).
+    """
+    with bench_app() as app:
+        client = login(app)
+        with app.app_context():
+            user_id = User.query.filter_by(username="test").first().public_id
+            df = pd.DataFrame({"ID": [user_id], **{task: [1] for task in qutools.tasks}})
+            for case in ["new", "overwrite"]:
+                with count_queries() as counter:
+                    store_scores(df, user_id, 0)
+                checks(
+                    counter.count <= 2,
+                    f"store_scores ({case}, {len(qutools.tasks)} tasks): {counter.count} statements",
+                )
+
+            for n in [n_items, 2 * n_items]:
+                with count_queries() as counter:
+                    res = client.post("/api/response_json", json={"responses": response_batch(n)})
+                n_commits = counter.statements.count("COMMIT")
+                checks(
+                    res.status_code == 200 and n_commits == 1 and counter.count <= 2 * n + 10,
+                    f"response_json ({n} responses): {counter.count} statements, {n_commits} commit(s)",
+                )
+
+
+def bench_snapshots(checks: Checks, ttl_s: float=1.0) -> None:
+    """Staleness of the response snapshots with respect to a write of another
+    process, simulated by a separate connection bypassing the session (and
+    hence the write-through).
+    """
+    with bench_app() as app:
+        snapshots = ResponseSnapshots(10, ttl_s=ttl_s)
+        with app.app_context():
+            user_id = User.query.filter_by(username="test").first().public_id
+            item_id = TextResponse.query.filter_by(user_id=user_id, edit_no=0).first().item_id
+            old = snapshots.get(user_id, 0)[item_id]["response"]
+
+            engine = sa.create_engine(app.config["SQLALCHEMY_DATABASE_URI"])
+            with engine.begin() as conn:
+                conn.execute(
+                    sa.update(TextResponse.__table__)
+                    .where(TextResponse.user_id == user_id, TextResponse.item_id == item_id)
+                    .values(response="Extern geschrieben.")
+                )
+            engine.dispose()
+
+            checks(
+                snapshots.get(user_id, 0)[item_id]["response"] == old,
+                "snapshot is served from memory right after the external write",
+            )
+            time.sleep(ttl_s)
+            checks(
+                snapshots.get(user_id, 0)[item_id]["response"] == "Extern geschrieben.",
+                f"external write shows up after the ttl of {ttl_s} s",
+            )
+
+
+def sequential_replacements(s: str) -> str:
+    """Reference implementation of the abbreviation replacements: one
+    `re.sub` per entry of the abbreviation table, in table order.
+    """
+    for abbr, expr in qutools.get_abbreviation_replacement_tuples():
+        s = re.sub(abbr, expr, s, flags=re.IGNORECASE)
+    return s
+
+
+# Spellings of (table-) abbreviations and tricky neighbours for the random
+#   texts of `bench_normalizer`
+_ABBREVIATION_TOKENS = [
+    "z.B.", "z. B", "zB", "z.Bsp", "usw.", "u.", "u", "&", "a&b", "x&&y", "WW", "N I", "N II",
+    "N III", "<-", "->", "<-->", "bzw", "d.h.", "d. h", "ggf.", "i.d.R.", "Nr.", "nr", "St.",
+    "st", "v.a.", "v. A", "o.Ä.", "u. Ä", "zsm.hg", "Zsm hang", "zusammenhg", "zsm", "zm",
+    "Beschl.", "beschlng", "selbstständiges A", "möglich weise", "Mögl.weise", "mgl", "S.A",
+    "S. B", "Schülervorst", "L", "LK", "lp", "od", "o", "phys", "physik", "exp", "Ex", "SuS",
+    "sos", "Kraft", "Geschw.", "Geschwind", "etc", "etcet", "wdh", "WH",
+    # "&" between words removes the word boundary of the following abbreviation
+    "a&u.", "x&bzw", "Kraft&usw.", "N&N II", "Zsm&zB",
+]
+_SEPARATORS = [" ", " ", "", ".", ":", "  ", "\n", ", ", "-"]
+
+
+def bench_normalizer(checks: Checks, n_random: int=20_000, seed: int=0) -> None:
+    """Equivalence of the compiled `TextNormalizer` and the sequential
+    replacements on the test-responses and on random texts of abbreviation
+    spellings, and the speedup on the test-responses.
+    """
+    from .test import test_responses_good, test_responses_bad
+
+    normalizer = qutools.text_normalizer
+    fixtures = [
+        text
+        for test_responses in [test_responses_good, test_responses_bad]
+        for text in test_responses.values()
+        if isinstance(text, str)
+    ]
+    fixtures += [qutools.cleanup_whitespaces(text) for text in fixtures]
+
+    rng = random.Random(seed)
+    words = [word for text in fixtures for word in text.split()]
+    texts = [
+        "".join(
+            rng.choice(_ABBREVIATION_TOKENS if rng.random() < 0.6 else words) + rng.choice(_SEPARATORS)
+            for _ in range(rng.randint(1, 8))
+        )
+        for _ in range(n_random)
+    ]
+
+    for name, cases in [("test-responses", fixtures), ("random", texts)]:
+        mismatches = [
+            text for text in cases
+            if normalizer.replace_abbreviations(text) != sequential_replacements(text)
+        ]
+        checks(
+            len(mismatches) == 0,
+            f"{name}: {len(mismatches)} of {len(cases)} texts differ from the sequential replacements"
+            + (f", e.g. {mismatches[0]!r}" if len(mismatches) > 0 else ""),
+        )
+
+    t0 = time.perf_counter()
+    for text in fixtures:
+        sequential_replacements(text)
+    t_sequential = time.perf_counter() - t0
+    fallbacks = normalizer.fallbacks
+    t0 = time.perf_counter()
+    for text in fixtures:
+        normalizer.replace_abbreviations(text)
+    t_compiled = time.perf_counter() - t0
+    print(
+        f"  {len(fixtures)} test-responses: sequential {t_sequential * 1000:.1f} ms, "
+        f"compiled {t_compiled * 1000:.1f} ms "
+        f"({normalizer.fallbacks - fallbacks} stage(s) replaced sequentially)"
+    )
+
+
+def _latencies(seconds: list[float]) -> str:
+    return (
+        f"p50 {np.percentile(seconds, 50) * 1000:.1f} ms, "
+        f"p95 {np.percentile(seconds, 95) * 1000:.1f} ms"
+    )
+
+
+def _run_concurrently(n_threads: int, fn) -> float:
+    """Runs `fn(thread_no)` in `n_threads` threads and returns the wall time.
+    """
+    threads = [threading.Thread(target=fn, args=(k,)) for k in range(n_threads)]
+    t0 = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - t0
+
+
+def bench_autosave(checks: Checks, n_writers: int=8, n_saves: int=50) -> None:
+    """Latency of single autosaves (`/api/response/...`) under concurrent
+    writers, each repeatedly saving its own items.
+    """
+    items = response_batch(10_000)
+    with bench_app() as app:
+        clients = [login(app) for _ in range(n_writers)]
+        latencies: list[float] = []
+        failed: list[int] = []
+        lock = threading.Lock()
+
+        def writer(k: int) -> None:
+            for n in range(n_saves):
+                res = items[(k + n_writers * n) % len(items)]
+                response = f"Antwort {k}-{n}" if res["item_type"] == "text" else n % 2 == 0
+                t0 = time.perf_counter()
+                status = clients[k].post(
+                    f"/api/response/{res['view_id']}/{res['task_id']}/{res['item_id']}",
+                    json={"item_type": res["item_type"], "response": response},
+                ).status_code
+                with lock:
+                    latencies.append(time.perf_counter() - t0)
+                    if status != 200:
+                        failed.append(status)
+
+        wall = _run_concurrently(n_writers, writer)
+        print(
+            f"  {n_writers} writers x {n_saves} saves: {len(latencies) / wall:.0f} saves/s, "
+            f"{_latencies(latencies)}"
+        )
+        checks(len(failed) == 0, f"autosave: {len(failed)} failed saves")
+
+
+def bench_scoring_queue(
+    checks: Checks,
+    n_callers: int=8,
+    n_requests: int=20,
+    texts_per_request: int=4,
+    max_wait_ms: float=50,
+    max_batch_size: int=64,
+) -> None:
+    """Throughput and latency of concurrent callers scoring a few texts each
+    (e.g. report requests), calling the scorer directly vs. through the
+    dynamic batching `ScoringQueue`. The predictions must not differ.
+    """
+    texts = reference_texts()
+    scorer = model_registry.scorer()
+    queue = ScoringQueue(scorer.predict, max_wait_ms=max_wait_ms, max_batch_size=max_batch_size)
+    scorer.predict(texts[:1])
+
+    rng = random.Random(0)
+    requests = [
+        [rng.sample(texts, texts_per_request) for _ in range(n_requests)]
+        for _ in range(n_callers)
+    ]
+    expected = {text: y for text, y in zip(texts, scorer.predict(texts))}
+
+    for name, predict in [("direct", scorer.predict), ("queue", queue.predict)]:
+        latencies: list[float] = []
+        mismatches = []
+        lock = threading.Lock()
+
+        def caller(k: int) -> None:
+            for request_texts in requests[k]:
+                t0 = time.perf_counter()
+                y_pred = predict(request_texts)
+                with lock:
+                    latencies.append(time.perf_counter() - t0)
+                    mismatches.extend(
+                        text for text, y in zip(request_texts, y_pred) if y != expected[text]
+                    )
+
+        wall = _run_concurrently(n_callers, caller)
+        n_texts = n_callers * n_requests * texts_per_request
+        print(
+            f"  {name:>6}: {n_texts / wall:.0f} texts/s, {_latencies(latencies)} per request"
+        )
+        checks(len(mismatches) == 0, f"scoring ({name}): {len(mismatches)} differing predictions")
+
+    stats = queue.stats()
+    print(
+        f"  queue: {stats['batches']} batches, "
+        f"mean {stats.get('mean_requests', 0):.1f} requests / {stats.get('mean_texts', 0):.1f} texts per batch"
+    )
+
+
+class _StandInAPIHandler(BaseHTTPRequestHandler):
+    """Keep-alive stand-in for the API, counting the connections and
+    requests. Every response sets a cookie, every other request to "/flaky"
+    fails with a 503.
+    """
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self) -> None:
+        with self.server.lock:
+            self.server.connections += 1
+        super().setup()
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def _respond(self) -> None:
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        status = 200
+        with self.server.lock:
+            self.server.requests += 1
+            if self.path == "/flaky":
+                self.server.flaky_calls += 1
+                if self.server.flaky_calls % 2 == 1:
+                    status = 503
+        body = json.dumps({"path": self.path}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Set-Cookie", "x-access-token=stand-in; Path=/")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _respond
+
+
+@contextmanager
+def stand_in_api() -> Iterator[ThreadingHTTPServer]:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StandInAPIHandler)
+    server.lock = threading.Lock()
+    server.connections = server.requests = server.flaky_calls = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def bench_api_pool(checks: Checks, n_requests: int=50, n_threads: int=8) -> None:
+    """Connection reuse and retries of the pooled client of the "request"-mode
+    (see `app.interface.core.api.http_session`) against a local stand-in API.
+    """
+    app = Flask(__name__)
+    app.config.update({
+        "API_REQUEST_POOL_SIZE": n_threads,
+        "API_REQUEST_RETRIES": 2,
+    })
+    timeout = (3.0, 30.0)
+    with app.app_context(), stand_in_api() as server:
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        session = http_session()
+
+        # Unpooled, as before
+        t0 = time.perf_counter()
+        for _ in range(n_requests):
+            requests.request("GET", f"{base_url}/user_info", timeout=timeout)
+        t_unpooled = time.perf_counter() - t0
+        n_unpooled = server.connections
+
+        t0 = time.perf_counter()
+        for _ in range(n_requests):
+            session.get(f"{base_url}/user_info", timeout=timeout)
+        t_pooled = time.perf_counter() - t0
+        n_pooled = server.connections - n_unpooled
+        print(
+            f"  {n_requests} sequential GETs: unpooled {n_unpooled} connections, "
+            f"{t_unpooled / n_requests * 1000:.2f} ms each; pooled {n_pooled} connection(s), "
+            f"{t_pooled / n_requests * 1000:.2f} ms each"
+        )
+        checks(n_pooled <= 1, f"sequential requests reuse a single connection ({n_pooled})")
+
+        n_before = server.connections
+        _run_concurrently(n_threads, lambda k: [
+            session.get(f"{base_url}/user_progress", timeout=timeout) for _ in range(n_requests)
+        ])
+        n_concurrent = server.connections - n_before
+        checks(
+            n_concurrent <= n_threads,
+            f"{n_threads} threads x {n_requests} GETs open at most the pool size of connections ({n_concurrent})",
+        )
+
+        res = session.get(f"{base_url}/flaky", timeout=timeout)
+        checks(
+            res.status_code == 200 and server.flaky_calls == 2,
+            f"idempotent GET is retried after a 503 ({res.status_code} after {server.flaky_calls} calls)",
+        )
+        res = session.post(f"{base_url}/flaky", json={}, timeout=timeout)
+        checks(
+            res.status_code == 503 and server.flaky_calls == 3,
+            f"POST is not retried ({res.status_code} after {server.flaky_calls - 2} call(s))",
+        )
+        checks(
+            res.cookies.get("x-access-token") == "stand-in" and len(session.cookies) == 0,
+            "cookies are passed on with the response, but not stored in the shared session",
+        )
+
+
+def run_bench() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmarks and regression checks on a throwaway database.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    saves = commands.add_parser("saves",
+        help="Statements and commits of the score- and batched response-writes.")
+    saves.add_argument("--n-items", type=int, default=20,
+        help="Number of responses of the smaller batch (default: 20).")
+
+    snapshots = commands.add_parser("snapshots",
+        help="Staleness of the response snapshots with respect to writes of other processes.")
+    snapshots.add_argument("--ttl", type=float, default=1.0,
+        help="Time to live of the snapshots (default: 1.0).")
+
+    normalizer = commands.add_parser("normalizer",
+        help="Equivalence of the compiled text normalizer and the sequential replacements.")
+    normalizer.add_argument("--n-random", type=int, default=20_000,
+        help="Number of random texts of abbreviation spellings (default: 20000).")
+    normalizer.add_argument("--seed", type=int, default=0,
+        help="Seed of the random texts (default: 0).")
+
+    autosave = commands.add_parser("autosave",
+        help="Latency of single autosaves under concurrent writers.")
+    autosave.add_argument("--writers", type=int, default=8,
+        help="Number of concurrent writers (default: 8).")
+    autosave.add_argument("--saves", type=int, default=50,
+        help="Number of saves per writer (default: 50).")
+
+    api_pool = commands.add_parser("api-pool",
+        help="Connection reuse and retries of the \"request\"-mode client against a stand-in API.")
+    api_pool.add_argument("--requests", type=int, default=50,
+        help="Number of requests per run / thread (default: 50).")
+    api_pool.add_argument("--threads", type=int, default=8,
+        help="Number of concurrent threads, also the pool size (default: 8).")
+
+    queue = commands.add_parser("scoring-queue",
+        help="Throughput and latency of direct vs. queued (batched) scoring.")
+    queue.add_argument("--callers", type=int, default=8,
+        help="Number of concurrent callers (default: 8).")
+    queue.add_argument("--requests", type=int, default=20,
+        help="Number of requests per caller (default: 20).")
+    queue.add_argument("--texts", type=int, default=4,
+        help="Number of texts per request (default: 4).")
+    queue.add_argument("--max-wait-ms", type=float, default=50,
+        help="Maximum waiting time of a batch (default: 50).")
+    queue.add_argument("--max-batch-size", type=int, default=64,
+        help="Maximum number of texts per batch (default: 64).")
+
+    args = parser.parse_args()
+
+    checks = Checks()
+    print(f"[bench] {args.command}")
+    if args.command == "saves":
+        bench_saves(checks, n_items=args.n_items)
+    if args.command == "snapshots":
+        bench_snapshots(checks, ttl_s=args.ttl)
+    if args.command == "normalizer":
+        bench_normalizer(checks, n_random=args.n_random, seed=args.seed)
+    if args.command == "autosave":
+        bench_autosave(checks, n_writers=args.writers, n_saves=args.saves)
+    if args.command == "api-pool":
+        bench_api_pool(checks, n_requests=args.requests, n_threads=args.threads)
+    if args.command == "scoring-queue":
+        bench_scoring_queue(
+            checks,
+            n_callers=args.callers,
+            n_requests=args.requests,
+            texts_per_request=args.texts,
+            max_wait_ms=args.max_wait_ms,
+            max_batch_size=args.max_batch_size,
+        )
+
+    if len(checks.failed) > 0:
+        print(f"[bench] {len(checks.failed)} check(s) failed.")
+        sys.exit(1)
+    print("[bench] All checks passed.")
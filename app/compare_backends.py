@@ -0,0 +1,60 @@
+import argparse
+
+import pandas as pd
+
+from .api.core import qutools
+from .api.core.models import ScorerBackend, compare_scorer_backends, scorer_backends
+
+
+# Parity check and latency comparison of the scorer backends. Run with
+#   "python compare_backends.py --help".
+
+
+def reference_texts() -> list[str]:
+    """The scorer inputs of the test-responses, used as reference set for
+    the scorer backend comparison.
+    """
+    from .test import test_responses_good, test_responses_bad
+
+    texts = []
+    for test_responses in [test_responses_good, test_responses_bad]:
+        df_text = pd.DataFrame(
+            [(item, text) for item, text in test_responses.items() if isinstance(text, str)],
+            columns=["item", "text"],
+        )
+        df_text = qutools.item_dots(df_text, "item")
+        df_text = df_text[df_text["item"].isin(qutools.text_items)]
+        df_text["text"] = qutools.text_normalizer.normalize_batch(df_text["text"].to_list())
+        df_text = qutools.pivot_text_item_df(df_text)
+        df_text = qutools.concat_taskwise(df_text)
+        df_text = qutools.melt_tasks(df_text)
+        df_text = qutools.drop_empty(df_text)
+        df_text = qutools.add_item_names(df_text)
+        texts += df_text["text"].to_list()
+    return texts
+
+
+def compare_backends(
+    backends: list[ScorerBackend]=scorer_backends,
+    n_repeats: int=3,
+) -> pd.DataFrame:
+    """Compares the scorer backends on the test-responses (see
+    `app.api.core.models.compare_scorer_backends`). Loads a separate scorer
+    per backend.
+    """
+    df = compare_scorer_backends(reference_texts(), backends, n_repeats)
+    print(df.to_string(index=False))
+    return df
+
+
+def run_comparison() -> None:
+    parser = argparse.ArgumentParser(
+        description="Parity check and latency comparison of the scorer backends on the test-responses.",
+    )
+    parser.add_argument("--backends", nargs="+", choices=scorer_backends, default=scorer_backends,
+        help="The backends to compare (default: all).")
+    parser.add_argument("--n-repeats", type=int, default=3,
+        help="Number of timed predictions of the reference set per backend (default: 3).")
+    args = parser.parse_args()
+
+    compare_backends(backends=args.backends, n_repeats=args.n_repeats)
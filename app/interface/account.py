@@ -6,8 +6,6 @@ from flask_wtf import FlaskForm
 from wtforms.fields import StringField
 from wtforms.validators import Length
 
-import requests
-
 from .core import interface, interface_loggedin, call_api, get_user_info
 from .core import API
 
@@ -75,12 +73,7 @@ def account(cookies):
     }
 
     if new_te_form.validate_on_submit():
-        _ = requests.request(
-            method="POST",
-            url=url_for(API.test_edit.url_for, _external=True),
-            cookies=request.cookies.to_dict(),
-            json={"edit_name": request.form["edit_name"]}
-        )
+        _ = call_api(API.test_edit, "POST", json={"edit_name": request.form["edit_name"]})
         test_edits = load_existing_edits(active_edit_no)
         return redirect(request.referrer)
 
@@ -1,8 +1,5 @@
-import requests
-from requests.auth import HTTPBasicAuth
-
 from flask import Blueprint
-from flask import render_template, redirect, url_for, make_response
+from flask import render_template, redirect, make_response
 from flask import request, current_app
 
 from flask_wtf import FlaskForm
@@ -70,23 +67,13 @@ def login(cookies):
         if recaptcha_val != 1:
             return recaptcha_val
 
-        auth = HTTPBasicAuth(
-            form.username.data.strip().encode("utf-8"),
-            form.password.data.encode("utf-8"),
-        )
+        auth = (form.username.data.strip(), form.password.data)
 
-        res = requests.post(
-            url_for(API.login.url_for, _external=True),
-            auth=auth,
-            cookies=cookies,
-        )
+        res, _ = call_api(API.login, "POST", auth=auth)
 
         if res.status_code == 200:
             browser_res = make_response(redirect("/"))
-
-            key = current_app.config['JWT_COOKIE_KEY']
-            browser_res.set_cookie(key, res.cookies[key])
-            return browser_res
+            return propagate_cookies(res, browser_res)
 
         if res.status_code == 412:
             return render(consent_missing=True)
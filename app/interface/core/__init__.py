@@ -1,4 +1,4 @@
-from .api import call_api, API  # noqa: F401
+from .api import call_api, call_apis, API  # noqa: F401
 
 from .forms import AJAXForm  # noqa: F401
 from .forms import form_render_kws, auth_form  # noqa: F401
@@ -1,36 +1,229 @@
 import requests
 from requests import Response as reqResponse
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+from urllib3.util.retry import Retry
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import DefaultCookiePolicy
 
 from flask import Response
 from flask import url_for
 from flask import request, current_app
+from werkzeug.test import EnvironBuilder
 
 from typing import Literal
 
 from ...api import APIMethod, API  # noqa: F401
 
 
+_http_session: requests.Session = None
+_http_executor: ThreadPoolExecutor = None
+_http_lock = threading.Lock()
+
+
+def http_session() -> requests.Session:
+    """The connection-pooled (keep-alive) HTTP-session of this worker process
+    for "request"-mode API-calls. Is shared by all threads: the session does
+    not store any cookies (they are passed per request), and the connection
+    pools are thread-safe. Idempotent requests get retried on connection
+    errors and 502/503/504-responses. Configured by the
+    "API_REQUEST_POOL_SIZE"- and "API_REQUEST_RETRIES"-keys.
+    """
+    global _http_session
+    if _http_session is not None:
+        return _http_session
+    with _http_lock:
+        if _http_session is None:
+            pool_size = current_app.config.get("API_REQUEST_POOL_SIZE", 10)
+            retry = Retry(
+                total=current_app.config.get("API_REQUEST_RETRIES", 2),
+                backoff_factor=0.1,
+                status_forcelist=(502, 503, 504),
+                allowed_methods=frozenset({"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}),
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(
+                pool_connections=pool_size,
+                pool_maxsize=pool_size,
+                max_retries=retry,
+            )
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+            _http_session = session
+    return _http_session
+
+
+def _http_request(
+        method: str,
+        url: str,
+        cookies: dict,
+        json: dict=None,
+        auth: tuple[str, str]=None,
+        timeout: tuple[float, float]=None,
+    ) -> tuple[reqResponse, dict]:
+    if auth is not None:
+        auth = HTTPBasicAuth(auth[0].encode("utf-8"), auth[1].encode("utf-8"))
+    res = http_session().request(
+        method=method,
+        url=url,
+        cookies=cookies,
+        json=json,
+        auth=auth,
+        timeout=timeout,
+    )
+    try:
+        data = res.json()
+    except requests.JSONDecodeError:
+        data = None
+    return res, data
+
+
+def _http_timeout() -> tuple[float, float]:
+    return (
+        current_app.config.get("API_REQUEST_CONNECT_TIMEOUT_S", 3.0),
+        current_app.config.get("API_REQUEST_READ_TIMEOUT_S", 30.0),
+    )
+
+
+def dispatch_wsgi(
+        method: str,
+        url: str,
+        json: dict=None,
+        auth: tuple[str, str]=None,
+    ) -> Response:
+    """Dispatches a request to the API into the WSGI app in-process, i.e.,
+    with a full request context (cookies, status codes, `after_request`-
+    hooks, ...) but without a socket. The cookies and the remote address of
+    the current (interface-) request are passed on. The API-request shares
+    the app context (and thereby `flask.g` and the database session) with
+    the interface-request, as with "functional" calls.
+
+    Parameters
+    ----------
+    method : str
+    url : str
+        The (non-external) url of the API-route, as returned by `url_for`.
+    json : dict=None
+        Optional json-body.
+    auth : tuple[str, str]=None
+        Optional username and password for HTTP-basic auth.
+    """
+    headers = {}
+    if "Cookie" in request.headers:
+        headers["Cookie"] = request.headers["Cookie"]
+    builder = EnvironBuilder(
+        path=url.removeprefix(request.script_root),
+        base_url=request.url_root,
+        method=method,
+        json=json,
+        auth=auth,
+        headers=headers,
+        environ_base={"REMOTE_ADDR": request.remote_addr},
+    )
+    try:
+        environ = builder.get_environ()
+    finally:
+        builder.close()
+    return Response.from_app(current_app.wsgi_app, environ, buffered=True)
+
+
 def call_api(
         api_method: APIMethod,
-        method: str=Literal["GET", "POST", "PUT", "DELETE"],
+        method: Literal["GET", "POST", "PUT", "DELETE"]="GET",
         fun_kwargs: dict={},
+        json: dict=None,
+        auth: tuple[str, str]=None,
     ) -> tuple[reqResponse|Response, dict]:
+    """Calls an API-route from the interface, depending on the
+    "API_INTERFACE_COMMUNICATION"-mode:
+    - "functional": The route function gets called directly. Calls passing
+    a json-body or basic auth need a request of their own and are
+    dispatched as in "wsgi"-mode.
+    - "wsgi": The request is dispatched into the WSGI app in-process (see
+    `dispatch_wsgi`).
+    - "request": An actual HTTP-request is sent to the API.
+    """
+    mode = current_app.config["API_INTERFACE_COMMUNICATION"]
+    if mode == "functional" and (json is not None or auth is not None):
+        mode = "wsgi"
 
-    if current_app.config["API_INTERFACE_COMMUNICATION"] == "functional":
+    if mode == "functional":
         # hprint(f"Functional API-call ({api_method.url_for})")
         res = api_method(**fun_kwargs)
         data = res.get_json()
 
-    if current_app.config["API_INTERFACE_COMMUNICATION"] == "request":
+    if mode == "wsgi":
+        res = dispatch_wsgi(
+            method,
+            url_for(api_method.url_for, **fun_kwargs),
+            json=json,
+            auth=auth,
+        )
+        data = res.get_json(silent=True)
+
+    if mode == "request":
         # hprint(f"Request API-call url_for({api_method.url_for})")
-        res = requests.request(
-            method=method,
-            url=url_for(api_method.url_for, _external=True),
-            cookies=request.cookies.to_dict(),
+        res, data = _http_request(
+            method,
+            url_for(api_method.url_for, _external=True, **fun_kwargs),
+            request.cookies.to_dict(),
+            json=json,
+            auth=auth,
+            timeout=_http_timeout(),
         )
-        data = res.json()
 
     # hprint(f"  Response: {res}")
     # hprint(f"  Data: {data}")
 
     return res, data
+
+
+def call_apis(
+        calls: list[tuple[APIMethod, str]],
+    ) -> list[tuple[reqResponse|Response, dict]]:
+    """Runs several independent API-calls (without json-body or auth), e.g.,
+    the data an interface-route needs. In "request"-mode the HTTP-requests
+    are sent concurrently (on the pooled `http_session`), in the other modes
+    the calls run one after the other in the current request context.
+
+    ```python
+    (_, user_info), (_, progress) = call_apis([
+        (API.user_info, "GET"),
+        (API.user_progress, "GET"),
+    ])
+    ```
+
+    Returns
+    -------
+    results : list[tuple[reqResponse|Response, dict]]
+        `call_api`-results in the order of the calls.
+    """
+    if current_app.config["API_INTERFACE_COMMUNICATION"] != "request" or len(calls) < 2:
+        return [call_api(api_method, method) for api_method, method in calls]
+
+    global _http_executor
+    with _http_lock:
+        if _http_executor is None:
+            _http_executor = ThreadPoolExecutor(
+                max_workers=current_app.config.get("API_REQUEST_POOL_SIZE", 10),
+                thread_name_prefix="api-request",
+            )
+    # The request context is not available in the executor threads
+    cookies = request.cookies.to_dict()
+    timeout = _http_timeout()
+    http_session()
+    futures = [
+        _http_executor.submit(
+            _http_request,
+            method,
+            url_for(api_method.url_for, _external=True),
+            cookies,
+            timeout=timeout,
+        )
+        for api_method, method in calls
+    ]
+    return [future.result() for future in futures]
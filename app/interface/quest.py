@@ -1,5 +1,3 @@
-import pandas as pd
-
 from flask import Blueprint
 from flask import render_template, url_for
 from flask import request
@@ -7,7 +5,7 @@ from flask import request
 from wtforms.fields import TextAreaField, BooleanField, FileField
 
 from .core import API, AJAXForm
-from .core import call_api, interface_loggedin, get_user_info
+from .core import call_api, call_apis, interface_loggedin
 
 from ..core.data import View
 from ..core.data import questionnaire
@@ -57,42 +55,32 @@ def build_forms(view: View) -> dict[str, openForm|MCForm]:
     return forms
 
 
-def users_current_responses(cookies: dict) -> pd.DataFrame:
+def users_current_responses(cookies: dict) -> dict[str, dict]:
     """Retrieves the current user's (via cookies) current responses to the
-    questionnaire.
+    questionnaire as a dict `{item_id: {"view_id", "task_id", "response"}}`.
     """
-    res, data = call_api(API.user_responses, "GET")
+    res, data = call_api(API.user_response_snapshot, "GET")
+    return data
 
-    user_responses = [
-        response
-        for response_lists in data.values()
-        for response in response_lists
-    ]
 
-    df_ur = pd.DataFrame(user_responses)
-    return df_ur
+def users_current_progress(cookies: dict) -> dict[str, int]:
+    """Retrieves the number of responses per view of the current user's (via
+    cookies) active edit as a dict `{view_id: n_responses}`.
+    """
+    res, data = call_api(API.user_progress, "GET")
+    return data
 
 
 def prepopulate_forms(
         view: View,
-        df_ur: pd.DataFrame,
+        user_responses: dict[str, dict],
         forms: dict[str, openForm|MCForm],
     ):
     """Populates forms with the users current responses
     """
-    view_id = view.id
-    if df_ur.size <= 0:
-        return forms
-
-    df_ur_cview = df_ur[df_ur['view_id'] == view_id][['item_id', 'response']]
-    if df_ur_cview.size <= 0:
-        return forms
-
-    worked_items = df_ur_cview['item_id'].to_list()
     for key, form in forms.items():
-        if key in worked_items:
-            msk = df_ur_cview['item_id'] == key
-            response = df_ur_cview['response'][msk].to_list()[0]
+        if key in user_responses:
+            response = user_responses[key]['response']
             if isinstance(form, openForm):
                 form.response_text.data = response
             if isinstance(form, MCForm):
@@ -113,17 +101,15 @@ def surrounding_views(view_id: str) -> tuple[str, str]:
     return previous_view, next_view
 
 
-def views_progress(views: dict, df_ur: pd.DataFrame) -> dict:
-    """Alters the "progress"-status of the `views`-dict based on the users
-    current responses `df_ur` (passed as a `pd.DataFrame`).
+def views_progress(views: dict, progress: dict[str, int]) -> dict:
+    """Alters the "progress"-status of the `views`-dict based on the number of
+    responses per view (as returned by `users_current_progress`).
     """
-    if df_ur.size <= 0:
-        return views
     for view_id, specs in views.items():
-        df_ur_cview: pd.DataFrame = df_ur[df_ur['view_id'] == view_id]
-        if df_ur_cview.size > 0:
+        n_responses = progress.get(view_id, 0)
+        if n_responses > 0:
             cview = questionnaire[view_id]
-            if cview.n_items() == df_ur_cview.shape[0]:
+            if cview.n_items() == n_responses:
                 specs['progress'] = "finished"
             else:
                 specs['progress'] = "some"
@@ -134,19 +120,23 @@ def views_progress(views: dict, df_ur: pd.DataFrame) -> dict:
 @quest_bp.route("/quest/<view_id>", methods=["GET", "POST"])
 @interface_loggedin()
 def quest(cookies, view_id: str=None):
+    # The independent API-calls of the route (concurrently in "request"-mode)
+    calls = [(API.user_info, "GET"), (API.user_progress, "GET")]
+    with_responses = request.method == "GET" and view_id is not None and view_id in questionnaire
+    if with_responses:
+        calls.append((API.user_response_snapshot, "GET"))
+    results = [data for _, data in call_apis(calls)]
+    user_info, progress = results[:2]
+
     # Active test info
-    user_info = get_user_info()
     active_edit_no = int(user_info["active_edit_no"])
     active_test_name = user_info["active_test_name"]
 
     # Initializting the views-dict
     views = questionnaire.asdict()
 
-    # Getting current responses
-    df_ur = users_current_responses(cookies)
-
     # Views progress
-    views_progress(views, df_ur)
+    views_progress(views, progress)
 
     # Render wrapper
     def render(**kwargs):
@@ -169,8 +159,9 @@ def quest(cookies, view_id: str=None):
     forms = build_forms(view)
 
     # Pre-Populating forms
-    if request.method == "GET":
-        forms = prepopulate_forms(view, df_ur, forms)
+    if with_responses:
+        user_responses = results[2]
+        forms = prepopulate_forms(view, user_responses, forms)
 
     # Current, next, & previous views
     views[view_id]['is_active'] = True
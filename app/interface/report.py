@@ -1,5 +1,5 @@
 from flask import Blueprint
-from flask import render_template, make_response, jsonify
+from flask import render_template, make_response, jsonify, url_for
 from flask import request
 
 from io import StringIO
@@ -35,10 +35,21 @@ def get_iamge_data(fig: Figure) -> str:
 @report_bp.route("/generate_report", methods=["POST"])
 @interface_loggedin()
 def generate_report(cookies):
+    """Interface-Route queueing the scoring. Returns the url, where the status
+    of the scoring job can be polled.
+    """
     res, data = call_api(API.generate_report_data, "POST")
+    if res.status_code != 202:
+        return make_response(jsonify(data), res.status_code)
+
+    status_url = url_for(API.report_job.url_for, job_id=data["job_id"])
     return make_response(
-        jsonify({"message": "scoring successful"}),
-        200,
+        jsonify({
+            "message": "scoring queued",
+            "status": data["status"],
+            "status_url": status_url,
+        }),
+        202,
     )
 
 
@@ -61,8 +72,11 @@ def report(cookies):
 
     # Get scores
     res, data = call_api(API.report, "GET")
-    last_report = data["last_report"] if data["last_report"] else "Keine"
-    last_response = data["last_response"] if data["last_response"] else "Keine"
+    # 204-responses have no body, unless the API is called "functional"
+    if data is None:
+        data = {}
+    last_report = data.get("last_report") or "Keine"
+    last_response = data.get("last_response") or "Keine"
     df_scores_html = None
     df_dimscores_html = None
     img_dimscores = None
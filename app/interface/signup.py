@@ -1,6 +1,3 @@
-import requests
-from requests.auth import HTTPBasicAuth
-
 from flask import Blueprint
 from flask import render_template, redirect, url_for
 from flask import current_app, request
@@ -13,6 +10,7 @@ from wtforms.validators import InputRequired, Length, ValidationError, Email
 from ..api import API
 
 from .core import (
+    call_api,
     interface,
     validate_consent,
     form_render_kws,
@@ -49,20 +47,14 @@ class RegisterForm(FlaskForm):
     )
 
     def validate_username(self, username: StringField):
-        res = requests.get(
-            url_for(API.check_username.url_for, _external=True),
-            json={'username': username.data.strip()},
-        )
-        username_exists = res.json()['username_exists']
+        _, data = call_api(API.check_username, "GET", json={'username': username.data.strip()})
+        username_exists = data['username_exists']
         if username_exists:
             raise ValidationError("Dieser Benutzername existiert bereits.")
 
     def validate_email(self, email: EmailField):
-        res = requests.get(
-            url_for(API.check_email.url_for, _external=True),
-            json={'email': email.data.strip()},
-        )
-        email_exists = res.json()['email_exists']
+        _, data = call_api(API.check_email, "GET", json={'email': email.data.strip()})
+        email_exists = data['email_exists']
         if email_exists:
             raise ValidationError("Es gibt schon einen Account mit dieser E-Mail Adresse.")
 
@@ -93,16 +85,8 @@ def signup(cookies):
         if recaptcha_val != 1:
             return recaptcha_val
 
-        auth = HTTPBasicAuth(
-            form.username.data.strip().encode("utf-8"),
-            form.password.data.encode("utf-8"),
-        )
-        res = requests.post(
-            url_for(API.signup.url_for, _external=True),
-            auth=auth,
-            json={'email': form.email.data.strip()},
-            cookies=cookies,
-        )
+        auth = (form.username.data.strip(), form.password.data)
+        res, _ = call_api(API.signup, "POST", json={'email': form.email.data.strip()}, auth=auth)
 
         if res.status_code == 200:
             return redirect(url_for("auth_interface.login"))
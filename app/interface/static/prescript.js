@@ -250,10 +250,17 @@ function scrollActiveItemIntoView() {
 
 /* Submitters for Item-Forms */
 /* -------------------------------------------------------------------------- */
-async function submitItemAJAX(item) {
+// Changed items are buffered for `responseFlushDelay` ms and sent together to
+// the batch endpoint. Text and image responses of the same item collapse to the
+// latest one, MC responses are kept in order, as the server toggles them.
+const responseFlushDelay = 400;
+var responseBuffer = [];
+var responseBatchUrl = null;
+var responseFlushTimer = null;
+
+function itemResponse(item) {
     const itemNameArr = item.name.split("-")
     const itemName = itemNameArr[0];
-    const form = item.form;
 
     if (item.type == "textarea") {
         var response = item.value;
@@ -281,17 +288,51 @@ async function submitItemAJAX(item) {
         var itemType = "image"
     }
 
+    // The forms action is ".../response/<view_id>/<task_id>/<item_id>"
+    const path = new URL(item.form.action).pathname;
+    const [viewId, taskId, itemId] = path.split("/").slice(-3);
+    responseBatchUrl = path.slice(0, path.lastIndexOf("/response/")) + "/response_json";
+
+    return {
+        view_id: decodeURIComponent(viewId),
+        task_id: decodeURIComponent(taskId),
+        item_id: decodeURIComponent(itemId),
+        item_type: itemType,
+        response: response,
+    };
+}
+
+function bufferResponse(entry) {
+    if (entry.item_type != "mc") {
+        responseBuffer = responseBuffer.filter(
+            buffered => buffered.item_id != entry.item_id
+        );
+    }
+    responseBuffer.push(entry);
+}
+
+function takeResponseBuffer() {
+    clearTimeout(responseFlushTimer);
+    responseFlushTimer = null;
+    const responses = responseBuffer;
+    responseBuffer = [];
+    return responses;
+}
+
+async function flushResponses() {
+    const responses = takeResponseBuffer();
+    if (responses.length == 0) {
+        return 0;
+    }
+
     try {
-        const res = await fetch(form.action, {
+        const res = await fetch(responseBatchUrl, {
             method: "POST",
             headers: {
                 'Content-Type': 'application/json'
             },
             // credentials: 'include',
-            body: JSON.stringify({
-                response: response,
-                item_type: itemType
-            })
+            body: JSON.stringify({ responses: responses })
         });
 
         // Updating session timer because AJAX also sets token-cookie
@@ -311,6 +352,29 @@ async function submitItemAJAX(item) {
     }
 }
 
+function flushResponsesOnUnload() {
+    const responses = takeResponseBuffer();
+    if (responses.length == 0) {
+        return 0;
+    }
+    // A plain-text body, as beacons with other content types might be blocked;
+    //   the server parses it as json regardless.
+    const body = new Blob(
+        [JSON.stringify({ responses: responses })],
+        { type: "text/plain" }
+    );
+    navigator.sendBeacon(responseBatchUrl, body);
+}
+
+async function submitItemAJAX(item) {
+    bufferResponse(itemResponse(item));
+    clearTimeout(responseFlushTimer);
+    responseFlushTimer = setTimeout(flushResponses, responseFlushDelay);
+}
+
+window.addEventListener("beforeunload", flushResponsesOnUnload);
+window.addEventListener("pagehide", flushResponsesOnUnload);
+
 
 /* Execution */
 /* ========================================================================== */
@@ -1,4 +1,35 @@
-// Ajax request for generating report
+// Polls the status of a scoring job until it has finished. Returns false if
+//  the session has expired, throws if the job failed or its status is
+//  unavailable.
+async function waitForScoringJob(statusUrl) {
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        const res = await fetch(statusUrl, {
+            headers: {
+                'Content-Type': 'application/json'
+            },
+        });
+        if (res.status == 410) {
+            window.location.replace("/");
+            return false;
+        }
+        if (!res.ok) {
+            throw new Error(`Status der Auswertung nicht verfügbar (${res.status})`);
+        }
+        const job = await res.json();
+        if (job.status == "failed") {
+            throw new Error(`Auswertung fehlgeschlagen: ${job.message}`);
+        }
+        if (job.status == "done") {
+            console.log(`Scoring job ${job.status}: ${job.message}`);
+            return true;
+        }
+    }
+}
+
+
+// Ajax request for generating report. Returns whether the report has been
+//  generated.
 async function genRepAJAX() {
     const form = document.getElementById("genRepForm");
     const loaderContainer = document.getElementById("loaderContainer");
@@ -26,9 +57,19 @@ async function genRepAJAX() {
 
         if (res.status == 410) {
             window.location.replace("/");
+            return false;
+        }
+        if (res.status != 202) {
+            throw new Error(`Auswertung konnte nicht gestartet werden (${res.status})`);
         }
+
+        const data = await res.json();
+        return await waitForScoringJob(data.status_url);
     } catch (error) {
+        loaderContainer.classList.add("d-none");
+        previousResults.classList.remove("d-none");
         alert(`Es gab einen Fehler bei der Verarbeitung ihrer Eingabe: ${error}`);
+        return false;
     }
 }
 
@@ -36,8 +77,10 @@ async function genRepAJAX() {
 var button = document.getElementById("genRepBtn");
 button.onclick = () => {
     var res = genRepAJAX();
-    res.then(() => {
-        console.log("Success");
-        window.location.reload();
+    res.then((success) => {
+        if (success) {
+            console.log("Success");
+            window.location.reload();
+        }
     })
 }
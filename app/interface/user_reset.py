@@ -1,8 +1,5 @@
-import requests
-from requests.auth import HTTPBasicAuth
-
 from flask import Blueprint
-from flask import render_template, url_for
+from flask import render_template
 from flask import request, current_app
 
 from flask_wtf import FlaskForm
@@ -12,7 +9,7 @@ from wtforms.validators import InputRequired, Length, Email
 
 from ..api import API
 
-from .core import interface, form_render_kws, validate_recaptcha, auth_form
+from .core import call_api, interface, form_render_kws, validate_recaptcha, auth_form
 
 
 user_reset_bp = Blueprint("user_reset_interface", __name__, template_folder="templates")
@@ -75,11 +72,7 @@ def request_reset(cookies: dict):
     if form.validate_on_submit():
         validate_recaptcha(request, render)
 
-        res = requests.post(
-            url_for(API.request_account_reset.url_for, _external=True),
-            json={'email': form.email.data},
-            cookies=cookies,
-        )
+        res, _ = call_api(API.request_account_reset, "POST", json={'email': form.email.data})
 
         if res.status_code == 404:
             return render(no_user=True)
@@ -125,17 +118,9 @@ def user_reset(cookies: dict):
     if form.validate_on_submit():
         validate_recaptcha(request, render)
 
-        auth = HTTPBasicAuth(
-            form.username.data.encode("utf-8"),
-            form.password.data.encode("utf-8"),
-        )
+        auth = (form.username.data, form.password.data)
 
-        res = requests.put(
-            url_for(API.account_reset.url_for, _external=True),
-            auth=auth,
-            json={'reset_code': form.reset_code.data},
-            cookies=cookies,
-        )
+        res, _ = call_api(API.account_reset, "PUT", json={'reset_code': form.reset_code.data}, auth=auth)
 
         print(res)
 
@@ -0,0 +1,246 @@
+from flask import Flask
+
+import argparse
+import datetime as dt
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from .app import create_app
+
+from .api.core.cohort import Edit, rescore_cohort
+from .api.core.dbmodels import Score, TestEdit
+from .api.core.models import model_registry
+
+from .core.utils import hprint
+
+
+# Offline (re-) scoring of stored edits, e.g., after a new model has been
+#   dropped into "./models/scorer". Run with "python rescore.py --help".
+
+
+_worker_app: Flask = None
+
+
+def _init_worker(n_threads: int) -> None:
+    """Initializer of the pool processes. Each process works on the existing
+    database with its own app, database connections and models.
+    """
+    import torch
+    torch.set_num_threads(n_threads)
+
+    global _worker_app
+    _worker_app = create_app(init_db=False, journal=False)
+
+
+def _rescore_chunk(edits: list[Edit], batch_size: int) -> tuple[list[Edit], int]:
+    with _worker_app.app_context():
+        n_scores = rescore_cohort(edits, batch_size=batch_size)
+    return edits, n_scores
+
+
+class Checkpoint:
+    """Append-only file of the edits that have already been rescored, such
+    that an interrupted run can be resumed. The first line holds the model
+    version; a checkpoint of another model version is discarded.
+
+    Parameters
+    ----------
+    path : str
+    model_version : str
+    """
+    def __init__(self, path: str, model_version: str) -> None:
+        self.path = Path(path)
+        self.model_version = model_version
+        self.done: set[Edit] = set()
+
+        if self.path.is_file():
+            with open(self.path) as f:
+                lines = f.read().splitlines()
+            if len(lines) > 0 and lines[0] == f"model_version {model_version}":
+                for line in lines[1:]:
+                    # A line might be incomplete, if the run has been killed
+                    #   while writing.
+                    parts = line.split()
+                    if len(parts) == 2:
+                        self.done.add((int(parts[0]), int(parts[1])))
+            else:
+                self.path.unlink()
+
+        if not self.path.is_file():
+            with open(self.path, "w") as f:
+                f.write(f"model_version {model_version}\n")
+
+    def add(self, edits: list[Edit]) -> None:
+        """Marks the edits as done, flushing them to disk right away.
+        """
+        with open(self.path, "a") as f:
+            f.writelines(f"{user_id} {edit_no}\n" for user_id, edit_no in edits)
+            f.flush()
+            os.fsync(f.fileno())
+        self.done.update(edits)
+
+    def remove(self) -> None:
+        self.path.unlink(missing_ok=True)
+
+
+def select_edits(
+    model_version: str,
+    user_ids: list[int]=None,
+    stale_only: bool=False,
+) -> list[Edit]:
+    """The edits to be rescored, i.e., the edits that already have scores.
+    Edits without scores are left alone, as their report has never been
+    requested. Requires an app context.
+
+    Parameters
+    ----------
+    model_version : str
+        The current scorer model version.
+    user_ids : list[int]=None
+        Restricts the rescoring to these users.
+    stale_only : bool=False
+        Only selects edits with scores of another model version.
+
+    Returns
+    -------
+    edits : list[Edit]
+    """
+    if stale_only:
+        selected = Score.outdated_edits(model_version)
+    else:
+        selected = Score.scored_edits()
+    return [edit for edit in TestEdit.all_edits(user_ids) if edit in selected]
+
+
+def _progress(n_done: int, n_total: int, n_scores: int, t_start: float) -> str:
+    elapsed = time.perf_counter() - t_start
+    rate = n_done / elapsed if elapsed > 0 else 0.0
+    eta = dt.timedelta(seconds=round((n_total - n_done) / rate)) if rate > 0 else "-"
+    return (
+        f"[rescore] {n_done}/{n_total} edits ({n_done / n_total:.1%}) | "
+        f"{rate:.1f} edits/s, {n_scores / elapsed:.0f} scores/s | "
+        f"elapsed {dt.timedelta(seconds=round(elapsed))}, ETA {eta}"
+    )
+
+
+def rescore(
+    user_ids: list[int]=None,
+    stale_only: bool=False,
+    workers: int=None,
+    chunk_size: int=200,
+    batch_size: int=256,
+    checkpoint_path: str="./rescore_checkpoint.txt",
+    restart: bool=False,
+) -> int:
+    """Rescores the scored edits with the current scorer model. The edits are
+    split into chunks of `chunk_size`, which are loaded, scored and stored by
+    a pool of processes (see `app.api.core.cohort.rescore_cohort`). Finished
+    chunks are recorded in a checkpoint file.
+
+    Parameters
+    ----------
+    user_ids : list[int]=None
+        Restricts the rescoring to these users.
+    stale_only : bool=False
+        Only rescores edits with scores of another model version.
+    workers : int=None
+        Number of processes. Defaults to half the number of cpus.
+    chunk_size : int=200
+        Number of edits loaded and stored at once per process.
+    batch_size : int=256
+        Number of texts per scorer call.
+    checkpoint_path : str="./rescore_checkpoint.txt"
+        The checkpoint file. Gets removed after a complete run.
+    restart : bool=False
+        Ignores an existing checkpoint.
+
+    Returns
+    -------
+    n_scores : int
+        Number of stored scores.
+    """
+    if workers is None:
+        workers = max((os.cpu_count() or 2) // 2, 1)
+
+    app = create_app(init_db=False, journal=False)
+    with app.app_context():
+        model_version = model_registry.prediction_cache().model_version
+        edits = select_edits(model_version, user_ids, stale_only)
+
+    if restart:
+        Path(checkpoint_path).unlink(missing_ok=True)
+    checkpoint = Checkpoint(checkpoint_path, model_version)
+    n_selected = len(edits)
+    edits = [edit for edit in edits if edit not in checkpoint.done]
+    print(
+        f"[rescore] Model version {model_version}: {len(edits)} edits to score "
+        f"({n_selected - len(edits)} already done according to the checkpoint)."
+    )
+    if len(edits) == 0:
+        checkpoint.remove()
+        return 0
+
+    chunks = [edits[k:k + chunk_size] for k in range(0, len(edits), chunk_size)]
+    workers = min(workers, len(chunks))
+    n_threads = max((os.cpu_count() or 1) // workers, 1)
+
+    n_done, n_scores = 0, 0
+    t_start = time.perf_counter()
+    # "spawn", as forking would copy the (locked) state of the threads of
+    #   the scorer and the database pool.
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=mp.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(n_threads,),
+    ) as executor:
+        futures = [executor.submit(_rescore_chunk, chunk, batch_size) for chunk in chunks]
+        try:
+            for future in as_completed(futures):
+                chunk, n = future.result()
+                checkpoint.add(chunk)
+                n_done += len(chunk)
+                n_scores += n
+                print(_progress(n_done, len(edits), n_scores, t_start))
+        except BaseException:
+            executor.shutdown(wait=False, cancel_futures=True)
+            hprint(f"[rescore] Interrupted, rerun to resume from {checkpoint.path}.")
+            raise
+
+    checkpoint.remove()
+    print(f"[rescore] Done: {n_scores} scores of {len(edits)} edits in {dt.timedelta(seconds=round(time.perf_counter() - t_start))}.")
+    return n_scores
+
+
+def run_rescoring() -> None:
+    parser = argparse.ArgumentParser(
+        description="Rescores the scored edits with the current scorer model.",
+    )
+    parser.add_argument("--users", type=int, nargs="+", default=None,
+        help="Only rescore the edits of these users (public ids).")
+    parser.add_argument("--stale-only", action="store_true",
+        help="Only rescore edits with scores of another model version.")
+    parser.add_argument("--workers", type=int, default=None,
+        help="Number of processes (default: half the number of cpus).")
+    parser.add_argument("--chunk-size", type=int, default=200,
+        help="Number of edits per chunk (default: 200).")
+    parser.add_argument("--batch-size", type=int, default=256,
+        help="Number of texts per scorer call (default: 256).")
+    parser.add_argument("--checkpoint", default="./rescore_checkpoint.txt",
+        help="Checkpoint file (default: ./rescore_checkpoint.txt).")
+    parser.add_argument("--restart", action="store_true",
+        help="Ignore an existing checkpoint.")
+    args = parser.parse_args()
+
+    rescore(
+        user_ids=args.users,
+        stale_only=args.stale_only,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        batch_size=args.batch_size,
+        checkpoint_path=args.checkpoint,
+        restart=args.restart,
+    )
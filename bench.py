@@ -0,0 +1,4 @@
+from app.bench import run_bench
+
+if __name__ == "__main__":
+    run_bench()
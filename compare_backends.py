@@ -0,0 +1,4 @@
+from app.compare_backends import run_comparison
+
+if __name__ == "__main__":
+    run_comparison()
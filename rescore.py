@@ -0,0 +1,4 @@
+from app.rescore import run_rescoring
+
+if __name__ == "__main__":
+    run_rescoring()